@@ -1,10 +1,19 @@
+import hashlib
 import os
+import time
+from functools import partial
 import pandas as pd
 import numpy as np
 from statsmodels.tsa.stattools import coint
-from itertools import combinations
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm
+from processors.AlignedPanel import AlignedPanel
+from processors.PairTiler import PairTiler
+from analyzers.EngleGrangerMoments import EngleGrangerMoments, mackinnonp_vec
+from processors.TimeframeResampler import TIMEFRAMES, resolve_timeframe_dir
+from utils.symbols import SymbolDictionary
+from utils.sharding import in_shard
+from utils.checkpoint import PairCheckpoint, params_fingerprint
+from utils.executor import StageExecutor, default_workers
 
 
 class CointegrationAnalyzerAsync:
@@ -17,47 +26,99 @@ class CointegrationAnalyzerAsync:
        в парном трейдинге и арбитраже.
 
        Алгоритм:
-       1. Загружаются данные из CSV файлов, содержащих столбцы 'timestamp' и 'close'.
-       2. Формируются все возможные пары активов.
-       3. Каждая пара проверяется на коинтеграцию с использованием теста Энгла-Грейнджера.
-       4. Проверка выполняется параллельно с помощью ThreadPoolExecutor.
+       1. Загружаются данные из CSV файлов, содержащих столбцы 'timestamp' и 'close',
+          в выровненную панель (processors.AlignedPanel).
+       2. Пространство пар обходится плитками (processors.PairTiler) — список всех пар
+          не строится; пары с недостаточным пересечением по времени отсекаются внутри плитки.
+       3. Каждая пара проходит каскад от дешёвых проверок к дорогим:
+          - prefilter (по желанию, выключен по умолчанию): ADF остатка OLS с фиксированным лагом
+            (или статистика Дарбина-Уотсона остатка), векторно по всей плитке через EngleGrangerMoments;
+          - полный тест Энгла-Грейнджера (statsmodels.coint с autolag) для прошедших;
+          - при both_directions=True — тот же тест с переставленными монетами для финального набора.
+          Число прошедших пар и время каждой ступени печатаются в конце (self.cascade_stats).
+       4. Плитки выполняются параллельно (utils.executor.StageExecutor), одновременно в работе
+          не больше 2 * max_workers плиток, размер плитки подбирается под memory_budget_mb.
        5. Пары с p-value ниже заданного порога считаются коинтегрированными.
-       6. Результаты можно сохранить в файл.
+       6. Результаты можно сохранить в файл, в том числе дописывать по мере готовности плиток.
 
        Параметры:
        - data_dir: путь к папке с CSV-файлами
        - min_data_points: минимальное количество точек данных для анализа
        - pvalue_threshold: пороговое значение p-value для коинтеграции
-       - max_workers: количество потоков для параллельной обработки
+       - max_workers: количество воркеров (по умолчанию — число ядер)
+       - backend: 'auto' (потоки), 'serial', 'thread', 'process' или 'asyncio'
+       - timeframe: таймфрейм анализа (h1, h2, h4, h12, d1); старшие строятся из часовых баров
+       - memory_budget_mb: бюджет памяти на плитки пар, находящиеся в работе
+       - universe: необязательный список монет (processors.UniverseFilter); пары строятся только внутри него
+       - candidates: необязательные пары-кандидаты (processors.PairCandidateSearch, столбец 'pair');
+         проверяются только они вместо всех пар вселенной
+       - prefilter: None (по умолчанию — результат совпадает с полным тестом), 'adf' или 'dw' —
+         дешёвая первая ступень каскада. Она ускоряет скан примерно вдвое ценой полноты: ADF с лагом 0
+         не видит автокорреляцию остатка, которую учитывает autolag, и часть пар, проходящих полный тест,
+         отсекается. На выборках h1 из 43 монет при prefilter_pvalue=0.3 терялась 1 пара из 84
+         (FLMUSDT/MOVRUSDT: autolag p=0.034, ADF lag=0 p=0.48) и 1 из 123 на другой выборке;
+         при 0.5 потерь не было, но отсев слабее (903 → 603 пар вместо 903 → 456)
+       - prefilter_lag, prefilter_pvalue: лаг и мягкий порог p-value ADF первой ступени
+       - dw_threshold: минимальная статистика Дарбина-Уотсона остатка для prefilter='dw'
+       - both_directions: требовать коинтеграцию и в обратной регрессии (b на a)
        """
 
-    def __init__(self, data_dir, min_data_points=100, pvalue_threshold=0.05, max_workers=8):
+    def __init__(self, data_dir, min_data_points=100, pvalue_threshold=0.05, max_workers=None, timeframe='h1',
+                 memory_budget_mb=256, universe=None, backend='auto', candidates=None, prefilter=None,
+                 prefilter_lag=0, prefilter_pvalue=0.3, dw_threshold=0.02, both_directions=False):
+        if prefilter not in ('adf', 'dw', None):
+            raise ValueError("prefilter должен быть 'adf', 'dw' или None")
         self.data_dir = data_dir
+        self.timeframe = timeframe
         self.min_data_points = min_data_points
         self.pvalue_threshold = pvalue_threshold
-        self.max_workers = max_workers
-        self.data = self._load_data()
+        self.max_workers = max_workers or default_workers('cpu')
+        self.backend = backend
+        self.memory_budget_mb = memory_budget_mb
+        self.universe = set(universe) if universe is not None else None
+        self.prefilter = prefilter
+        self.prefilter_lag = prefilter_lag
+        self.prefilter_pvalue = prefilter_pvalue
+        self.dw_threshold = dw_threshold
+        self.both_directions = both_directions
+        self.cascade_stats = {}
+        self.candidates = None
+        self.candidate_mask = None
+        self.panel = self._load_data()
+        if candidates is not None:
+            self.set_candidates(candidates)
         self.results = []
+        self.status_changes = []
+        self.stability = []
+        self.universe_diff = []
 
     def _load_data(self):
         """
-        Загружает и очищает CSV-файлы с данными.
+        Загружает CSV-файлы в выровненную панель (общая ось времени + маска валидности).
         Оставляет только те, которые имеют нужный формат и достаточную длину.
         """
-        data = {}
-        for file in os.listdir(self.data_dir):
-            if file.endswith(".csv"):
-                df = pd.read_csv(os.path.join(self.data_dir, file))
-                if 'timestamp' not in df.columns or 'close' not in df.columns:
-                    continue
-                df['timestamp'] = pd.to_datetime(df['timestamp'])
-                df = df.sort_values('timestamp')
-                if len(df) < self.min_data_points:
-                    continue
-                name = os.path.splitext(file)[0]
-                df = df[['timestamp', 'close']].dropna()
-                data[name] = df
-        return data
+        return AlignedPanel.from_dir(resolve_timeframe_dir(self.data_dir, self.timeframe),
+                                     min_data_points=self.min_data_points, symbols=self.universe)
+
+    def set_universe(self, universe):
+        """
+        Ограничивает анализ вселенной монет и перечитывает данные (например, после свежего сбора).
+        """
+        self.universe = set(universe) if universe is not None else None
+        self.panel = self._load_data()
+        if self.candidates is not None:
+            self.set_candidates(self.candidates)
+
+    def set_candidates(self, candidates):
+        """
+        Ограничивает проверку парами-кандидатами: симметричная булева маска [монеты × монеты] панели.
+        """
+        self.candidates = candidates
+        pairs = SymbolDictionary.from_panel(self.panel).encode_pairs(candidates)
+        pairs = pairs.take(pairs.known)
+        mask = np.zeros((len(self.panel), len(self.panel)), dtype=bool)
+        mask[pairs.a, pairs.b] = mask[pairs.b, pairs.a] = True
+        self.candidate_mask = mask
 
     def _check_cointegration(self, pair):
         """
@@ -65,39 +126,516 @@ class CointegrationAnalyzerAsync:
                 Возвращает словарь с парой и p-value, если найдено соответствие.
         """
         a, b = pair
-        df1 = self.data[a].set_index('timestamp')
-        df2 = self.data[b].set_index('timestamp')
-        merged = pd.merge(df1, df2, left_index=True, right_index=True, suffixes=('_a', '_b'))
+        _, close_a, close_b = self.panel.pair_view(a, b)
 
-        if len(merged) < self.min_data_points:
+        if len(close_a) < self.min_data_points:
             return None
 
         try:
-            score, pvalue, _ = coint(merged['close_a'], merged['close_b'])
+            score, pvalue, _ = coint(close_a, close_b)
             if pvalue < self.pvalue_threshold:
                 return {'pair': f'{a}/{b}', 'p-value': round(pvalue, 5)}
         except Exception:
             return None
         return None
 
-    def run(self):
+    def _check_reverse(self, result):
+        """
+        Последняя ступень каскада: тест с обратной регрессией (b — зависимая, a — регрессор).
+        """
+        a, b = result['pair'].split('/')
+        _, close_a, close_b = self.panel.pair_view(a, b)
+        try:
+            pvalue = coint(close_b, close_a)[1]
+        except Exception:
+            return None
+        if pvalue < self.pvalue_threshold:
+            return {**result, 'p-value reverse': round(pvalue, 5)}
+        return None
+
+    def _prefilter(self, ii, jj):
+        """
+        Первая ступень каскада для пар (ii, jj) плитки: булев массив прошедших.
+        Моменты Энгла-Грейнджера всех пар считаются одним векторным проходом,
+        ADF с фиксированным лагом (или статистика Дарбина-Уотсона) — по ним без цикла по парам.
+        Вырожденные пары (NaN) пропускаются дальше: их судьбу решает полный тест.
+        """
+        if self.prefilter is None or not len(ii):
+            return np.ones(len(ii), dtype=bool)
+        values, mask = self.panel.values, self.panel.mask
+        xs, ys = [], []
+        for i, j in zip(ii, jj):
+            idx = np.flatnonzero(mask[i] & mask[j])
+            xs.append(values[j, idx])
+            ys.append(values[i, idx])
+        moments = EngleGrangerMoments(len(ii), max_lag=self.prefilter_lag)
+        moments.update(np.arange(len(ii)), xs, ys)
+        if self.prefilter == 'dw':
+            return ~(moments.durbin_watson() <= self.dw_threshold)
+        tstat, _ = moments.adf(lag=self.prefilter_lag)
+        return ~(mackinnonp_vec(tstat, regression='c', N=2) >= self.prefilter_pvalue)
+
+    def _check_tile(self, tile, shard=None):
+        """
+        Проверяет все пары плитки с достаточным пересечением (и, если задан шард, только пары шарда)
+        каскадом ступеней. Возвращает (число просмотренных пар, результаты, статистика ступеней).
+        Статистика ступеней: {ступень: [пар на входе, прошло, секунд]}.
+        """
+        ii, jj = PairTiler.tile_pairs(tile, self.panel.overlap_counts, self.min_data_points)
+        if self.candidate_mask is not None:
+            keep = self.candidate_mask[ii, jj]
+            ii, jj = ii[keep], jj[keep]
+        symbols = self.panel.symbols
+        checked = len(ii)
+        keep = np.array([in_shard(symbols[i], symbols[j], shard) for i, j in zip(ii, jj)], dtype=bool)
+        ii, jj = ii[keep], jj[keep]
+        stats = {}
+
+        start = time.perf_counter()
+        passed = self._prefilter(ii, jj)
+        if self.prefilter is not None:
+            stats['prefilter'] = [len(ii), int(passed.sum()), time.perf_counter() - start]
+
+        start = time.perf_counter()
+        results = []
+        for i, j in zip(ii[passed], jj[passed]):
+            result = self._check_cointegration((symbols[i], symbols[j]))
+            if result:
+                results.append(result)
+        stats['coint'] = [int(passed.sum()), len(results), time.perf_counter() - start]
+
+        if self.both_directions:
+            start = time.perf_counter()
+            forward = len(results)
+            results = [r for r in map(self._check_reverse, results) if r]
+            stats['reverse'] = [forward, len(results), time.perf_counter() - start]
+        return checked, results, stats
+
+    def _add_cascade_stats(self, stats):
+        for stage, (entered, passed, seconds) in stats.items():
+            total = self.cascade_stats.setdefault(stage, [0, 0, 0.0])
+            total[0] += entered
+            total[1] += passed
+            total[2] += seconds
+
+    def _print_cascade_stats(self):
+        names = {'prefilter': f"{self.prefilter} (lag={self.prefilter_lag})" if self.prefilter == 'adf' else 'dw',
+                 'coint': 'coint autolag', 'reverse': 'обратная регрессия'}
+        parts = [f"{names[stage]}: {entered} → {passed} ({seconds:.1f} с)"
+                 for stage, (entered, passed, seconds) in self.cascade_stats.items()]
+        if parts:
+            print("🪜 Каскад (время суммарно по потокам): " + " | ".join(parts))
+
+    def _tiler(self):
+        # Пара в работе держит два ряда цен и промежуточные массивы регрессии
+        bytes_per_pair = 16 * 8 * max(1, self.panel.values.shape[1])
+        return PairTiler(len(self.panel), bytes_per_pair, self.memory_budget_mb,
+                         max_in_flight=2 * self.max_workers, max_tile=64)
+
+    def run(self, results_path=None, shard=None, checkpoint_path=None, resume=False):
         """
                 Запускает многопоточную проверку всех возможных пар на коинтеграцию.
+                Плитки пар подаются в пул по мере освобождения потоков; найденные пары
+                накапливаются в self.results и, если задан results_path, сразу дописываются в CSV.
+                shard=(номер, число шардов) ограничивает проверку парами одного шарда (utils.sharding).
+                checkpoint_path — файл контрольной точки: завершённые плитки дописываются в него,
+                и при resume=True уже проверенные плитки пропускаются (если данные не изменились).
         """
-        symbols = list(self.data.keys())
-        all_pairs = list(combinations(symbols, 2))
-        print(f"🔍 Проверка {len(all_pairs)} пар на коинтеграцию...")
+        n = len(self.panel)
+        # Пары с недостаточным пересечением по времени отсекаются заранее по матрице пересечений
+        total = PairTiler.count_pairs(self.panel.overlap_counts, self.min_data_points)
+        long_enough = total
+        if self.candidate_mask is not None:
+            total = int(np.triu((self.panel.overlap_counts >= self.min_data_points) & self.candidate_mask, k=1).sum())
+        tiler = self._tiler()
+        skipped_candidates = f"не кандидатов: {long_enough - total}, " if self.candidate_mask is not None else ""
+        print(f"🔍 Проверка {total} пар на коинтеграцию "
+              f"(отсеяно по длине пересечения: {n * (n - 1) // 2 - long_enough}, {skipped_candidates}"
+              f"плиток: {tiler.n_tiles} по {tiler.tile} монет)...")
+        self.results = []
+        self.cascade_stats = {}
+        if results_path and os.path.exists(results_path):
+            os.remove(results_path)
 
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            futures = {executor.submit(self._check_cointegration, pair): pair for pair in all_pairs}
-            for future in tqdm(as_completed(futures), total=len(futures), desc="Обработка пар"):
-                result = future.result()
-                if result:
-                    self.results.append(result)
+        checkpoint = None
+        if checkpoint_path:
+            candidates = None if self.candidate_mask is None \
+                else hashlib.sha1(np.packbits(self.candidate_mask).tobytes()).hexdigest()
+            fingerprint = params_fingerprint('coint', self.panel.fingerprint(), tiler.tile, shard,
+                                             self.min_data_points, self.pvalue_threshold, candidates,
+                                             self.prefilter, self.prefilter_lag, self.prefilter_pvalue,
+                                             self.dw_threshold, self.both_directions)
+            checkpoint = PairCheckpoint(checkpoint_path, fingerprint, resume=resume)
 
+        try:
+            # Плитки из контрольной точки не пересчитываются
+            pending, skipped = [], 0
+            for tile in tiler.tiles():
+                key = f"{tile[0]}:{tile[2]}"
+                if checkpoint is not None and key in checkpoint:
+                    done = checkpoint.get(key)
+                    skipped += done['checked']
+                    self._add_cascade_stats(done.get('stats', {}))
+                    self.results.extend(done['results'])
+                    self._append_results(done['results'], results_path)
+                else:
+                    pending.append(tile)
+            if skipped:
+                print(f"⏭ Пропущено уже проверенных пар: {skipped}")
+
+            # Плитки читают общую панель, а OLS/ADF statsmodels считаются в LAPACK без GIL — по умолчанию потоки
+            backend = 'thread' if self.backend == 'auto' else self.backend
+            executor = StageExecutor(backend=backend, max_workers=self.max_workers, errors='raise')
+            for tile, (checked, results, stats) in executor.map(partial(self._check_tile, shard=shard), pending,
+                                                                desc="Обработка пар", total=total - skipped,
+                                                                weight=lambda outcome: outcome[0]):
+                self.results.extend(results)
+                self._append_results(results, results_path)
+                self._add_cascade_stats(stats)
+                if checkpoint is not None:
+                    checkpoint.add(f"{tile[0]}:{tile[2]}", {'checked': checked, 'results': results, 'stats': stats})
+        finally:
+            # Даже при ошибке или Ctrl+C всё завершённое должно остаться на диске
+            if checkpoint is not None:
+                checkpoint.close()
+        self._print_cascade_stats()
         print(f"✅ Найдено {len(self.results)} коинтегрированных пар.")
         return self.results
 
+    @staticmethod
+    def _append_results(results, results_path):
+        if not results_path or not results:
+            return
+        pd.DataFrame(results).to_csv(results_path, mode='a', index=False,
+                                     header=not os.path.exists(results_path))
+
+    def _symbol_revisions(self, state):
+        """
+        Монеты, чья ранее учтённая история изменилась (или которых не было в прошлом прогоне).
+        Сохранённые бары сверяются с текущими данными; бары старше начала текущего файла
+        (ушедшие из окна коллектора) не считаются пересмотром.
+        """
+        ts = self.panel.timestamps.astype('datetime64[ns]').astype(np.int64)
+        known = {name: i for i, name in enumerate(state['symbols'])}
+        revised = set()
+        for name in self.panel.symbols:
+            k = known.get(name)
+            if k is None:
+                revised.add(name)
+                continue
+            row = self.panel.index[name]
+            first_ts = ts[np.argmax(self.panel.mask[row])]
+            stored_ts = state['history_ts'][k]
+            stored_close = state['history_close'][k]
+            keep = stored_ts >= first_ts
+            stored_ts, stored_close = stored_ts[keep], stored_close[keep]
+
+            pos = np.minimum(np.searchsorted(ts, stored_ts), len(ts) - 1)
+            present = (ts[pos] == stored_ts) & self.panel.mask[row, pos]
+            if not np.all(present) or not np.allclose(self.panel.values[row, pos], stored_close, rtol=1e-12, atol=0):
+                revised.add(name)
+        return revised
+
+    def _symbol_history(self):
+        """
+        История цен каждой монеты (метки в нс и close, дополнение нулями):
+        по ней в следующем прогоне выявляются пересмотры уже учтённых баров.
+        """
+        ts = self.panel.timestamps.astype('datetime64[ns]').astype(np.int64)
+        history_ts = np.zeros(self.panel.values.shape, dtype=np.int64)
+        history_close = np.zeros(self.panel.values.shape)
+        for row in range(len(self.panel)):
+            idx = np.flatnonzero(self.panel.mask[row])
+            if not len(idx):
+                continue
+            history_ts[row, -len(idx):] = ts[idx]
+            history_close[row, -len(idx):] = self.panel.values[row, idx]
+        return history_ts, history_close
+
+    def run_incremental(self, state_path="coint_state.npz", max_lag=12):
+        """
+        Инкрементальный режим: по каждой паре хранятся достаточные статистики регрессии
+        Энгла-Грейнджера (суммы, кросс-произведения, лаговые автоковариации остатков),
+        и при новом прогоне они обновляются только новыми барами.
+
+        Полный пересчёт выполняется лишь для новых пар и пар, у которых изменилась
+        уже учтённая история одной из монет. Пары, сменившие статус коинтеграции
+        относительно прошлого прогона, попадают в self.status_changes.
+
+        Лаг ADF выбирается по AIC в диапазоне 0..max_lag (фиксированный верхний предел
+        между прогонами), поэтому p-value могут немного отличаться от полного run().
+        """
+        ts = self.panel.timestamps.astype('datetime64[ns]').astype(np.int64)
+        all_pairs = self.panel.eligible_pairs(self.min_data_points)
+
+        state = dict(np.load(state_path, allow_pickle=False)) if os.path.exists(state_path) else None
+        if state is not None and int(state['max_lag']) != max_lag:
+            print(f"⚠️ В состоянии max_lag={int(state['max_lag'])}, запрошен {max_lag} — полный пересчёт.")
+            state = None
+
+        previous = {}
+        revised = set(self.panel.symbols)
+        if state is not None:
+            previous = {(a, b): i for i, (a, b) in enumerate(zip(state['asset_a'], state['asset_b']))}
+            revised = self._symbol_revisions(state)
+
+        known, fresh = [], []
+        for pair in all_pairs:
+            if pair in previous and pair[0] not in revised and pair[1] not in revised:
+                known.append(pair)
+            else:
+                fresh.append(pair)
+        if state is None:
+            print(f"🆕 Состояние {state_path} не найдено — полный расчёт {len(fresh)} пар.")
+        else:
+            print(f"🔁 Инкрементальная проверка: {len(known)} пар обновляется новыми барами, "
+                  f"{len(fresh)} пересчитывается полностью (новые или пересмотренные монеты: {len(revised)}).")
+
+        parts = []
+        prev_pvalues = np.full(len(all_pairs), np.nan)
+        if known:
+            old_idx = np.array([previous[pair] for pair in known])
+            parts.append(EngleGrangerMoments.from_arrays(state).take(old_idx))
+            prev_pvalues[:len(known)] = state['pvalue'][old_idx]
+        parts.append(EngleGrangerMoments(len(fresh), max_lag))
+        moments = EngleGrangerMoments.concatenate(parts, max_lag)
+        pairs = known + fresh
+
+        last_ts = np.zeros(len(pairs), dtype=np.int64)
+        if known:
+            last_ts[:len(known)] = state['last_ts'][old_idx]
+
+        xs, ys = [], []
+        for k, (a, b) in enumerate(tqdm(pairs, desc="Новые бары пар")):
+            idx = self.panel.pair_indices(a, b)
+            idx = idx[ts[idx] > last_ts[k]]
+            # coint(close_a, close_b): a — зависимая, b — регрессор
+            xs.append(self.panel.values[self.panel.index[b], idx])
+            ys.append(self.panel.values[self.panel.index[a], idx])
+            if len(idx):
+                last_ts[k] = ts[idx[-1]]
+        moments.update(np.arange(len(pairs)), xs, ys)
+
+        _, pvalues, _ = moments.coint()
+        cointegrated = pvalues < self.pvalue_threshold
+        was_cointegrated = prev_pvalues < self.pvalue_threshold
+        changed = np.flatnonzero(~np.isnan(prev_pvalues) & (cointegrated != was_cointegrated))
+
+        self.results = [{'pair': f'{a}/{b}', 'p-value': round(float(pvalues[k]), 5)}
+                        for k, (a, b) in enumerate(pairs) if cointegrated[k]]
+        self.status_changes = [{
+            'pair': f'{pairs[k][0]}/{pairs[k][1]}',
+            'p-value': round(float(pvalues[k]), 5),
+            'previous p-value': round(float(prev_pvalues[k]), 5),
+            'status': 'gained' if cointegrated[k] else 'lost'
+        } for k in changed]
+
+        history_ts, history_close = self._symbol_history()
+        np.savez(
+            state_path,
+            asset_a=np.array([a for a, _ in pairs], dtype=str),
+            asset_b=np.array([b for _, b in pairs], dtype=str),
+            last_ts=last_ts,
+            pvalue=pvalues,
+            symbols=np.array(self.panel.symbols, dtype=str),
+            history_ts=history_ts,
+            history_close=history_close,
+            **moments.to_arrays()
+        )
+
+        print(f"✅ Найдено {len(self.results)} коинтегрированных пар, "
+              f"статус сменили {len(self.status_changes)} пар. Состояние: {state_path}")
+        return self.results
+
+    def stale_symbols(self, stale_bars=24):
+        """
+        Булева маска строк панели, чей последний бар отстаёт от последнего бара панели больше чем на stale_bars
+        баров таймфрейма: после делистинга коллектор перестаёт обновлять файл, но CSV остаётся в data_dir.
+        """
+        if not len(self.panel):
+            return np.zeros(0, dtype=bool)
+        mask = self.panel.mask
+        last = mask.shape[1] - 1 - np.argmax(mask[:, ::-1], axis=1)
+        lag = self.panel.timestamps[-1] - self.panel.timestamps[last]
+        return ~mask.any(axis=1) | (lag > np.timedelta64(stale_bars * TIMEFRAMES[self.timeframe], 'h'))
+
+    def _universe_fingerprint(self):
+        return params_fingerprint('coint-universe', self.timeframe, self.min_data_points, self.pvalue_threshold,
+                                  self.prefilter, self.prefilter_lag, self.prefilter_pvalue, self.dw_threshold,
+                                  self.both_directions)
+
+    def run_expansion(self, state_path="coint_universe.npz", stale_bars=24, checkpoint_path=None, resume=False):
+        """
+        Расширение вселенной между прогонами: полный каскад run() только для пар с новыми монетами.
+
+        В state_path хранятся монеты прошлого прогона и найденные тогда пары (int32-идентификаторы
+        словаря монет и p-value). По сравнению с ним:
+        - добавленные монеты (новые листинги или вернувшиеся после простоя) — проверяются все их пары
+          с монетами вселенной, то есть N_new × N пар вместо N² / 2;
+        - делистинг: монеты, файла которых больше нет или чей последний бар отстаёт больше чем
+          на stale_bars баров (stale_symbols), — их пары не проверяются, результаты с ними списываются;
+        - результаты пар из монет, которые были и остались во вселенной, переносятся как есть.
+
+        Перенесённые p-value не обновляются новыми барами (для этого — run_incremental), а пары старых монет,
+        набравшие достаточное пересечение только сейчас, не проверяются — их подхватит полный run().
+        Если состояния нет или изменились параметры теста, выполняется полный прогон по активным монетам.
+        Изменения вселенной — в self.universe_diff.
+        """
+        symbols = SymbolDictionary.from_panel(self.panel)
+        active = ~self.stale_symbols(stale_bars)
+        fingerprint = self._universe_fingerprint()
+
+        state = dict(np.load(state_path, allow_pickle=False)) if os.path.exists(state_path) else None
+        if state is not None and str(state['fingerprint']) != fingerprint:
+            print(f"⚠️ Параметры теста изменились с прошлого прогона ({state_path}) — полный прогон.")
+            state = None
+
+        previous = np.zeros(len(self.panel), dtype=bool)
+        carried = []
+        if state is not None:
+            ids = symbols.encode(state['symbols'])
+            previous[ids[ids >= 0]] = True
+        added = active & ~previous
+        if state is not None:
+            a = symbols.encode(state['symbols'][state['asset_a']])
+            b = symbols.encode(state['symbols'][state['asset_b']])
+            keep = (a >= 0) & (b >= 0)
+            keep[keep] = active[a[keep]] & active[b[keep]]
+            if self.candidate_mask is not None:
+                keep[keep] = self.candidate_mask[a[keep], b[keep]]
+            names = np.asarray(self.panel.symbols, dtype=object)
+            carried = [{'pair': f'{names[i]}/{names[j]}', 'p-value': round(float(p), 5)}
+                       for i, j, p in zip(a[keep], b[keep], state['pvalue'][keep])]
+            retired = len(keep) - len(carried)
+            gone = sorted(set(state['symbols']) - {self.panel.symbols[i] for i in np.flatnonzero(active)})
+        else:
+            print(f"🆕 Состояние вселенной {state_path} не найдено — полный прогон по активным монетам.")
+            retired, gone = 0, []
+
+        stale = [self.panel.symbols[i] for i in np.flatnonzero(~active)]
+        self.universe_diff = ([{'symbol': name, 'status': 'added'} for i, name in enumerate(self.panel.symbols)
+                               if added[i] and state is not None]
+                              + [{'symbol': name, 'status': 'delisted'} for name in gone]
+                              + [{'symbol': name, 'status': 'stale'} for name in stale if name not in gone])
+        if state is not None:
+            print(f"🌐 Вселенная: новых монет {int(added.sum())}, делистинг {len(gone)}, "
+                  f"устаревших файлов {len(stale)}; перенесено результатов {len(carried)}, списано {retired}.")
+        elif stale:
+            print(f"🗑 Устаревшие файлы (последний бар старше {stale_bars} баров): {len(stale)} монет не проверяются.")
+
+        # Новые пары проверяются обычным run() через маску пар: хотя бы одна монета новая, обе активные
+        schedule = (added[:, None] | added[None, :]) & active[:, None] & active[None, :]
+        saved_mask = self.candidate_mask
+        self.candidate_mask = schedule if saved_mask is None else schedule & saved_mask
+        try:
+            self.run(checkpoint_path=checkpoint_path, resume=resume)
+        finally:
+            self.candidate_mask = saved_mask
+        self.results = carried + self.results
+
+        # Состояние: активные монеты и все найденные пары в int32-идентификаторах их словаря
+        universe = SymbolDictionary(self.panel.symbols[i] for i in np.flatnonzero(active))
+        pairs = universe.encode_pairs(pd.DataFrame(self.results, columns=['pair', 'p-value']))
+        np.savez(
+            state_path,
+            fingerprint=np.array(fingerprint),
+            symbols=np.array(universe.names, dtype=str),
+            asset_a=pairs.a,
+            asset_b=pairs.b,
+            pvalue=np.array([result['p-value'] for result in self.results], dtype=np.float64),
+        )
+        print(f"✅ Всего коинтегрированных пар: {len(self.results)} "
+              f"(новых {len(self.results) - len(carried)}). Состояние: {state_path}")
+        return self.results
+
+    def run_stability(self, pairs=None, window=336, step=24, max_lag=12, min_stability=0.0, batch_pairs=64):
+        """
+        Профиль устойчивости коинтеграции: тест Энгла-Грейнджера на скользящих окнах
+        длины window баров с шагом step (последнее окно — по последним барам).
+
+        Окна не переоцениваются заново: моменты всех окон пары берутся из накопленных
+        кросс-моментов (EngleGrangerMoments.from_windows), ADF считается векторно по окнам пачки пар.
+
+        По каждой паре: stability — доля окон с p-value ниже порога, recent p-value — последнее окно,
+        breakpoint — конец первого окна текущего режима (когда пара последний раз сменила статус).
+        pairs — список (a, b); по умолчанию пары из self.results. self.results заменяется парами,
+        коинтегрированными сейчас (последнее окно) и с stability не ниже min_stability.
+        """
+        if pairs is None:
+            pairs = [tuple(result['pair'].split('/')) for result in self.results]
+        previous = {result['pair']: result['p-value'] for result in self.results}
+
+        self.stability = []
+        for start in tqdm(range(0, len(pairs), batch_pairs), desc="Устойчивость по окнам"):
+            parts, owners = [], []
+            for a, b in pairs[start:start + batch_pairs]:
+                ts, close_a, close_b = self.panel.pair_view(a, b)
+                moments, _, ends = EngleGrangerMoments.from_windows(close_b, close_a, window, step, max_lag)
+                if len(moments):
+                    parts.append(moments)
+                    owners.append((a, b, ts[ends - 1]))
+            if not parts:
+                continue
+            _, pvalues, _ = EngleGrangerMoments.concatenate(parts, max_lag).coint()
+
+            offset = 0
+            for a, b, window_ends in owners:
+                pv = pvalues[offset:offset + len(window_ends)]
+                offset += len(window_ends)
+                status = pv < self.pvalue_threshold
+                changes = np.flatnonzero(status[1:] != status[:-1])
+                breakpoint = pd.Timestamp(window_ends[changes[-1] + 1]) if len(changes) else pd.NaT
+                self.stability.append({
+                    'pair': f'{a}/{b}',
+                    'p-value': previous.get(f'{a}/{b}', np.nan),
+                    'recent p-value': round(float(pv[-1]), 5),
+                    'stability': round(float(status.mean()), 4),
+                    'cointegrated_now': bool(status[-1]),
+                    'breakpoint': breakpoint,
+                    'windows': len(pv),
+                })
+
+        stable = [row for row in self.stability if row['cointegrated_now'] and row['stability'] >= min_stability]
+        stable_pairs = {row['pair'] for row in stable}
+        if previous:
+            self.results = [result for result in self.results if result['pair'] in stable_pairs]
+        else:
+            self.results = [{'pair': row['pair'], 'p-value': row['recent p-value']} for row in stable]
+        print(f"📉 Устойчивость: {len(stable)} из {len(self.stability)} пар коинтегрированы сейчас "
+              f"(окно {window}, шаг {step}) и в ≥ {min_stability:.0%} окон.")
+        return self.stability
+
+    def save_stability(self, filepath="coint_stability.csv"):
+        """
+        Сохраняет профиль устойчивости всех проверенных пар.
+        """
+        if not self.stability:
+            print("ℹ️ Профиль устойчивости не рассчитан.")
+            return
+        df = pd.DataFrame(self.stability).sort_values(['cointegrated_now', 'stability'], ascending=False)
+        df.to_csv(filepath, index=False)
+        print(f"💾 Профиль устойчивости сохранён в {filepath}")
+
+    def save_status_changes(self, filepath="coint_status_changes.csv"):
+        """
+        Сохраняет пары, сменившие статус коинтеграции в последнем инкрементальном прогоне.
+        """
+        if not self.status_changes:
+            print("ℹ️ Пар со сменой статуса нет.")
+            return
+        pd.DataFrame(self.status_changes).to_csv(filepath, index=False)
+        print(f"💾 Смены статуса сохранены в {filepath}")
+
+    def save_universe_diff(self, filepath="coint_universe_diff.csv"):
+        """
+        Сохраняет изменения вселенной последнего прогона run_expansion (added / delisted / stale).
+        """
+        if not self.universe_diff:
+            print("ℹ️ Вселенная не изменилась.")
+            return
+        pd.DataFrame(self.universe_diff).to_csv(filepath, index=False)
+        print(f"💾 Изменения вселенной сохранены в {filepath}")
+
     def save_results(self, filepath="/Users/papaskakun/PycharmProjects/PythonProject/cointegrated_pairs.csv"):
         """
                 Сохраняет результаты анализа в CSV-файл.
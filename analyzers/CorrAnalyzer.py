@@ -1,54 +1,73 @@
-import os
 import pandas as pd
 import numpy as np
 from tqdm import tqdm
+from processors.AlignedPanel import AlignedPanel
+from processors.PairTiler import PairTiler
+from processors.TimeframeResampler import resolve_timeframe_dir
 
 
 class CorrAnalyzer:
-    def __init__(self, data_dir, corr_threshold=0.9, zscore_threshold=2, min_data_points=100):
+    def __init__(self, data_dir, corr_threshold=0.9, zscore_threshold=2, min_data_points=100, timeframe='h1',
+                 memory_budget_mb=256, universe=None, feature_store=None):
         self.data_dir = data_dir
+        self.timeframe = timeframe
         self.corr_threshold = corr_threshold
         self.zscore_threshold = zscore_threshold
         self.min_data_points = min_data_points
-        self.data = {}
-        self.returns_df = pd.DataFrame()
+        self.memory_budget_mb = memory_budget_mb
+        self.universe = set(universe) if universe is not None else None
+        # FeatureStore: готовые лог-доходности вместо пересчёта из цен на каждом запуске
+        self.feature_store = feature_store
+        self.panel = None
+        self.returns = np.empty((0, 0))
         self.high_corr_pairs = []
         self.signals = []
 
     def load_all_data(self):
-        data = {}
-        for file in os.listdir(self.data_dir):
-            if file.endswith(".csv"):
-                df = pd.read_csv(os.path.join(self.data_dir, file))
-                if 'timestamp' not in df.columns or 'close' not in df.columns:
-                    continue
-                df['timestamp'] = pd.to_datetime(df['timestamp'])
-                df = df.sort_values('timestamp')
-                if len(df) < self.min_data_points:
-                    continue
-                name = os.path.splitext(file)[0]
-                df = df[['timestamp', 'close']].dropna()
-                data[name] = df
-        self.data = data
-        print(f"✅ Загружено {len(data)} монет.")
+        self.panel = AlignedPanel.from_dir(resolve_timeframe_dir(self.data_dir, self.timeframe),
+                                           min_data_points=self.min_data_points, symbols=self.universe)
+        print(f"✅ Загружено {len(self.panel)} монет.")
 
     def compute_log_returns(self):
-        returns = {}
-        for name, df in self.data.items():
-            df = df.set_index('timestamp')
-            df[f'{name}_logret'] = np.log(df['close'] / df['close'].shift(1))
-            returns[name] = df[[f'{name}_logret']].dropna()
-        self.returns_df = pd.concat(returns.values(), axis=1).dropna()
+        if self.feature_store is not None:
+            returns = self.feature_store.aligned('log_return', self.panel)
+            self.returns = returns[:, np.isfinite(returns).all(axis=0)]
+            print("📈 Лог-доходности загружены из хранилища признаков.")
+            return
+
+        # Доходность считается к предыдущему валидному бару самой монеты (ffill по общей оси).
+        # Хранится только матрица [монеты × бары] по барам, где валидны все монеты, без DataFrame-копий.
+        values, mask = self.panel.values, self.panel.mask
+        last_valid = np.maximum.accumulate(np.where(mask, np.arange(mask.shape[1]), 0), axis=1)
+        prev = np.full(values.shape, np.nan)
+        prev[:, 1:] = np.take_along_axis(values, last_valid[:, :-1], axis=1)
+        prev[:, 1:][~np.maximum.accumulate(mask, axis=1)[:, :-1]] = np.nan
+        with np.errstate(divide='ignore', invalid='ignore'):
+            returns = np.log(values / prev)
+        self.returns = returns[:, np.isfinite(returns).all(axis=0)]
         print("📈 Лог-доходности посчитаны.")
 
     def find_high_corr_pairs(self):
-        corr_matrix = self.returns_df.corr()
+        """
+        Корреляция Пирсона считается плитками: доходности стандартизуются один раз,
+        затем для каждой плитки [монеты I × монеты J] берётся произведение Z_I @ Z_J.T / (T - 1).
+        Полная матрица корреляций не строится, в памяти одна плитка.
+        """
+        symbols = self.panel.symbols
+        n_obs = self.returns.shape[1]
         pairs = []
-        for i in range(len(corr_matrix.columns)):
-            for j in range(i + 1, len(corr_matrix.columns)):
-                a, b = corr_matrix.columns[i], corr_matrix.columns[j]
-                if corr_matrix.loc[a, b] > self.corr_threshold:
-                    pairs.append((a.replace("_logret", ""), b.replace("_logret", "")))
+        if n_obs > 1:
+            std = self.returns.std(axis=1, ddof=1, keepdims=True)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                z = (self.returns - self.returns.mean(axis=1, keepdims=True)) / std
+            tiler = PairTiler(len(symbols), bytes_per_pair=8, memory_budget_mb=self.memory_budget_mb)
+            for i0, i1, j0, j1 in tiler.tiles():
+                block = z[i0:i1] @ z[j0:j1].T / (n_obs - 1)
+                ii, jj = np.nonzero(block > self.corr_threshold)
+                ii, jj = ii + i0, jj + j0
+                keep = ii < jj
+                pairs.extend((symbols[i], symbols[j]) for i, j in zip(ii[keep], jj[keep]))
+        pairs.sort(key=lambda pair: (self.panel.index[pair[0]], self.panel.index[pair[1]]))
         self.high_corr_pairs = pairs
         print(f"🔗 Найдено {len(pairs)} пар с корреляцией > {self.corr_threshold}")
 
@@ -59,15 +78,11 @@ class CorrAnalyzer:
 
     def analyze_signals(self, limit=5000):
         signals = []
-        for a, b in tqdm(self.high_corr_pairs[:limit], desc="🔍 Анализ пар"):
-            df1 = self.data[a].set_index('timestamp')
-            df2 = self.data[b].set_index('timestamp')
-            merged = pd.merge(df1, df2, left_index=True, right_index=True, suffixes=('_a', '_b'))
-
-            if len(merged) < 30:
-                continue
-
-            z = self.compute_latest_zscore(merged['close_a'], merged['close_b'])
+        # Пары с коротким пересечением отсекаются по матрице пересечений панели до основного цикла
+        pairs = [(a, b) for a, b in self.high_corr_pairs[:limit] if self.panel.overlap_count(a, b) >= 30]
+        for a, b in tqdm(pairs, desc="🔍 Анализ пар"):
+            _, close_a, close_b = self.panel.pair_view(a, b)
+            z = self.compute_latest_zscore(pd.Series(close_a), pd.Series(close_b))
             if abs(z) > self.zscore_threshold:
                 signals.append({'pair': f'{a}/{b}', 'zscore': z})
 
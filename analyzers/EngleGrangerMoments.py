@@ -0,0 +1,304 @@
+import numpy as np
+from scipy.stats import norm
+from statsmodels.tsa.adfvalues import _tau_largeps, _tau_maxs, _tau_mins, _tau_smallps, _tau_stars
+
+
+def mackinnonp_vec(tstat, regression='c', N=2):
+    """
+    Векторная версия statsmodels.tsa.adfvalues.mackinnonp (те же таблицы MacKinnon 1994).
+    """
+    tstat = np.asarray(tstat, dtype=np.float64)
+    small = np.polyval(np.asarray(_tau_smallps[regression][N - 1])[::-1], tstat)
+    large = np.polyval(np.asarray(_tau_largeps[regression][N - 1])[::-1], tstat)
+    pvalues = norm.cdf(np.where(tstat <= _tau_stars[regression][N - 1], small, large))
+    pvalues = np.where(tstat > _tau_maxs[regression][N - 1], 1.0, pvalues)
+    pvalues = np.where(tstat < _tau_mins[regression][N - 1], 0.0, pvalues)
+    return np.where(np.isfinite(tstat), pvalues, np.nan)
+
+
+class EngleGrangerMoments:
+    """
+    Достаточные статистики теста Энгла-Грейнджера для пачки пар.
+
+    Для каждой пары хранится вектор z_t = [1, x_t, y_t] (y — зависимая монета, x — регрессор)
+    и его лаговые кросс-моменты:
+    - C[d] = Σ z_t z_{t-d}^T для d = 0..max_lag+1 (матрицы 3×3);
+    - первые и последние max_lag+1 строк z (голова и хвост ряда).
+
+    Остаток регрессии e_t = y_t - alpha - beta * x_t линеен по z_t, поэтому и OLS-регрессия,
+    и ADF-регрессия остатков (Δe_t на e_{t-1}, Δe_{t-1..t-p}, без константы, выбор лага по AIC,
+    как в statsmodels.coint) восстанавливаются из этих моментов точно.
+    Новые бары добавляются обновлением сумм, без повторного прохода по всей истории.
+
+    Все операции векторные по парам: состояние — массивы с первой осью по парам.
+    Цены масштабируются на первое значение пары, чтобы суммы квадратов не теряли точность.
+    """
+
+    def __init__(self, n_pairs, max_lag=12):
+        self.max_lag = max_lag
+        depth = max_lag + 1
+        self.n = np.zeros(n_pairs, dtype=np.int64)
+        self.C = np.zeros((n_pairs, depth + 1, 3, 3))
+        self.head = np.zeros((n_pairs, depth, 3))
+        self.tail = np.zeros((n_pairs, depth, 3))
+        self.scale = np.ones((n_pairs, 2))
+
+    @property
+    def depth(self):
+        return self.max_lag + 1
+
+    def __len__(self):
+        return len(self.n)
+
+    def to_arrays(self):
+        return {'n': self.n, 'C': self.C, 'head': self.head, 'tail': self.tail, 'scale': self.scale,
+                'max_lag': np.array(self.max_lag)}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        moments = cls(0, int(arrays['max_lag']))
+        moments.n = arrays['n'].astype(np.int64)
+        moments.C = arrays['C']
+        moments.head = arrays['head']
+        moments.tail = arrays['tail']
+        moments.scale = arrays['scale']
+        return moments
+
+    def take(self, idx):
+        """
+        Новый набор моментов из подмножества пар (копия).
+        """
+        moments = EngleGrangerMoments(0, self.max_lag)
+        moments.n = self.n[idx].copy()
+        moments.C = self.C[idx].copy()
+        moments.head = self.head[idx].copy()
+        moments.tail = self.tail[idx].copy()
+        moments.scale = self.scale[idx].copy()
+        return moments
+
+    @classmethod
+    def concatenate(cls, parts, max_lag):
+        moments = cls(0, max_lag)
+        if parts:
+            moments.n = np.concatenate([part.n for part in parts])
+            moments.C = np.concatenate([part.C for part in parts])
+            moments.head = np.concatenate([part.head for part in parts])
+            moments.tail = np.concatenate([part.tail for part in parts])
+            moments.scale = np.concatenate([part.scale for part in parts])
+        return moments
+
+    @classmethod
+    def from_windows(cls, x, y, window, step, max_lag=12):
+        """
+        Моменты скользящих окон длины window с шагом step по одной паре (x — регрессор, y — зависимая).
+        Последнее окно заканчивается на последнем баре ряда.
+
+        Окна не пересчитываются заново: для каждого лага d строится накопленная сумма
+        Q_d[k] = Σ_{t=d}^{d+k-1} z_t z_{t-d}^T, и момент окна [w0, w1) равен Q_d[w1-d] - Q_d[w0].
+        Возвращает (моменты по окнам, начала окон, концы окон).
+        """
+        depth = max_lag + 1
+        n = len(x)
+        moments = cls(0, max_lag)
+        if n < window or window < depth:
+            return moments, np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+        starts = np.arange(0, n - window + 1, step, dtype=np.int64)
+        starts += (n - window) - starts[-1]
+        ends = starts + window
+
+        sx, sy = abs(x[0]), abs(y[0])
+        sx, sy = (sx if sx > 0 else 1.0), (sy if sy > 0 else 1.0)
+        z = np.column_stack([np.ones(n), np.asarray(x, dtype=np.float64) / sx, np.asarray(y, dtype=np.float64) / sy])
+
+        moments = cls(len(starts), max_lag)
+        for d in range(depth + 1):
+            prefix = np.zeros((n - d + 1, 3, 3))
+            np.cumsum(z[d:, :, None] * z[:n - d, None, :], axis=0, out=prefix[1:])
+            moments.C[:, d] = prefix[ends - d] - prefix[starts]
+        offsets = np.arange(depth)
+        moments.head = z[starts[:, None] + offsets]
+        moments.tail = z[ends[:, None] - depth + offsets]
+        moments.n[:] = window
+        moments.scale[:] = (sx, sy)
+        return moments, starts, ends
+
+    def reset(self, idx):
+        self.n[idx] = 0
+        self.C[idx] = 0
+        self.head[idx] = 0
+        self.tail[idx] = 0
+        self.scale[idx] = 1
+
+    def update(self, idx, xs, ys, max_cells=4_000_000):
+        """
+        Добавляет новые бары: idx — индексы пар, xs/ys — списки массивов новых значений x и y
+        (длины могут различаться). Пары обрабатываются порциями, чтобы ограничить память.
+        """
+        idx = np.asarray(idx, dtype=np.int64)
+        lengths = np.array([len(x) for x in xs], dtype=np.int64)
+        order = np.argsort(lengths)
+        start = 0
+        while start < len(order):
+            # Порция: сколько пар поместится при паддинге до самой длинной из них
+            stop = start + 1
+            while stop < len(order) and (stop - start + 1) * (lengths[order[stop]] + self.depth) <= max_cells:
+                stop += 1
+            part = order[start:stop]
+            self._update_chunk(idx[part], [xs[k] for k in part], [ys[k] for k in part])
+            start = stop
+
+    def _update_chunk(self, idx, xs, ys):
+        depth = self.depth
+        lengths = np.array([len(x) for x in xs], dtype=np.int64)
+        m_max = int(lengths.max()) if len(lengths) else 0
+        if m_max == 0:
+            return
+
+        fresh = self.n[idx] == 0
+        for k in np.flatnonzero(fresh & (lengths > 0)):
+            sx, sy = abs(xs[k][0]), abs(ys[k][0])
+            self.scale[idx[k]] = (sx if sx > 0 else 1.0, sy if sy > 0 else 1.0)
+
+        # Новые строки z, дополненные нулями: нулевые строки не вносят вклад в суммы
+        rows = np.zeros((len(idx), m_max, 3))
+        for k in range(len(idx)):
+            m = lengths[k]
+            rows[k, :m, 0] = 1.0
+            rows[k, :m, 1] = np.asarray(xs[k], dtype=np.float64) / self.scale[idx[k], 0]
+            rows[k, :m, 2] = np.asarray(ys[k], dtype=np.float64) / self.scale[idx[k], 1]
+
+        ext = np.concatenate([self.tail[idx], rows], axis=1)
+        current_t = ext[:, depth:].transpose(0, 2, 1)
+        for d in range(depth + 1):
+            self.C[idx, d] += np.matmul(current_t, ext[:, depth - d: depth - d + m_max])
+
+        # Голова: первые depth строк ряда (для новых пар — просто первые строки порции)
+        for k in np.flatnonzero(self.n[idx] < depth):
+            p = idx[k]
+            have = int(self.n[p])
+            need = min(depth - have, lengths[k])
+            self.head[p, have:have + need] = rows[k, :need]
+
+        # Хвост: последние depth реальных строк расширенного ряда
+        positions = lengths[:, None] + np.arange(depth)[None, :]
+        self.tail[idx] = np.take_along_axis(ext, positions[:, :, None], axis=1)
+        self.n[idx] += lengths
+
+    def _ols_coef(self):
+        # pinv вместо solve: вырожденная пара (постоянная цена) не должна ронять всю пачку
+        S = self.C[:, 0]
+        return np.einsum('pij,pj->pi', np.linalg.pinv(S[:, :2, :2]), S[:, :2, 2])
+
+    def regression(self):
+        """
+        OLS y = alpha + beta * x по накопленным моментам. Возвращает (alpha, beta) в исходном масштабе цен.
+        """
+        coef = self._ols_coef()
+        alpha = coef[:, 0] * self.scale[:, 1]
+        beta = coef[:, 1] * self.scale[:, 1] / self.scale[:, 0]
+        return alpha, beta
+
+    def _residual_products(self):
+        """
+        Скаляры остатков по моментам: Cw[d] = Σ e_t e_{t-d}, остатки головы и хвоста ряда.
+        """
+        coef = self._ols_coef()
+        w = np.column_stack([-coef[:, 0], -coef[:, 1], np.ones(len(coef))])
+        Cw = np.einsum('pi,pdij,pj->pd', w, self.C, w)
+        e_head = np.einsum('psi,pi->ps', self.head, w)
+        e_tail = np.einsum('psi,pi->ps', self.tail, w)
+        return Cw, e_head, e_tail
+
+    def _lag_matrix(self, Cw, e_head, e_tail, size, start):
+        """
+        E[i, j] = Σ_{t=start}^{n-1} e_{t-i} e_{t-j} для i, j < size; start — массив по парам.
+        """
+        depth = self.depth
+        n_pairs = len(Cw)
+        E = np.empty((n_pairs, size, size))
+        rows = np.arange(n_pairs)
+        for d in range(size):
+            # Кумулятивные произведения головы: hc[:, k] = Σ_{s=d}^{k-1} e_s e_{s-d}
+            products = np.zeros((n_pairs, depth + 1))
+            products[:, d + 1:] = np.cumsum(e_head[:, d:] * e_head[:, :depth - d], axis=1)
+            tail_products = e_tail[:, d:] * e_tail[:, :depth - d]
+            for i in range(size - d):
+                head_corr = products[rows, np.maximum(start - i, d)]
+                tail_corr = tail_products[:, depth - d - i:].sum(axis=1) if i else 0.0
+                E[:, i, i + d] = Cw[:, d] - head_corr - tail_corr
+                E[:, i + d, i] = E[:, i, i + d]
+        return E
+
+    @staticmethod
+    def _adf_from_lag_matrix(E, lag, nobs):
+        """
+        ADF-регрессия Δe_t на e_{t-1}, Δe_{t-1}, ..., Δe_{t-lag} по матрице E размера lag+2.
+        Возвращает (t-статистика, AIC).
+        """
+        size = lag + 2
+        U = np.zeros((size, size))
+        U[0, 0], U[0, 1] = 1.0, -1.0
+        U[1, 1] = 1.0
+        for m in range(1, lag + 1):
+            U[1 + m, m], U[1 + m, m + 1] = 1.0, -1.0
+        G = U @ E[:, :size, :size] @ U.T
+        gxx, gxy, gyy = G[:, 1:, 1:], G[:, 1:, 0], G[:, 0, 0]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            try:
+                inv = np.linalg.inv(gxx)
+            except np.linalg.LinAlgError:
+                # Вырожденные пары (например, постоянный остаток) — псевдообратная, t-статистика уйдёт в NaN/inf
+                inv = np.linalg.pinv(gxx)
+            b = np.einsum('pij,pj->pi', inv, gxy)
+            ssr = np.maximum(gyy - np.einsum('pi,pi->p', b, gxy), 1e-300)
+            sigma2 = ssr / (nobs - (lag + 1))
+            tstat = b[:, 0] / np.sqrt(sigma2 * inv[:, 0, 0])
+            llf = -nobs / 2 * (np.log(2 * np.pi) + np.log(ssr / nobs) + 1)
+        return tstat, -2 * llf + 2 * (lag + 1)
+
+    def adf(self, lag=None):
+        """
+        ADF-тест остатков. lag=None — выбор лага 0..max_lag по AIC на общей выборке
+        (как autolag='aic' в statsmodels), затем пересчёт с выбранным лагом на полной выборке.
+        Возвращает (t-статистика, выбранный лаг).
+        """
+        Cw, e_head, e_tail = self._residual_products()
+        n_pairs = len(Cw)
+
+        if lag is None:
+            start = np.full(n_pairs, self.max_lag + 1)
+            E = self._lag_matrix(Cw, e_head, e_tail, self.max_lag + 2, start)
+            nobs = self.n - self.max_lag - 1
+            aics = np.column_stack([self._adf_from_lag_matrix(E, p, nobs)[1] for p in range(self.max_lag + 1)])
+            lags = np.argmin(np.nan_to_num(aics, nan=np.inf), axis=1)
+        else:
+            lags = np.full(n_pairs, lag)
+
+        tstat = np.full(n_pairs, np.nan)
+        for p in np.unique(lags):
+            sel = np.flatnonzero(lags == p)
+            start = np.full(len(sel), p + 1)
+            E = self._lag_matrix(Cw[sel], e_head[sel], e_tail[sel], p + 2, start)
+            tstat[sel] = self._adf_from_lag_matrix(E, p, self.n[sel] - p - 1)[0]
+        return tstat, lags
+
+    def durbin_watson(self):
+        """
+        Статистика Дарбина-Уотсона остатков коинтеграционной регрессии (CRDW):
+        Σ(e_t - e_{t-1})² / Σe_t². У стационарного остатка она заметно больше нуля,
+        у случайного блуждания стремится к нулю.
+        """
+        Cw, e_head, e_tail = self._residual_products()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return (2 * Cw[:, 0] - e_head[:, 0] ** 2 - e_tail[:, -1] ** 2 - 2 * Cw[:, 1]) / Cw[:, 0]
+
+    def coint(self, lag=None):
+        """
+        Тест Энгла-Грейнджера по накопленным моментам: (t-статистика, p-value MacKinnon, лаг).
+        """
+        tstat, lags = self.adf(lag)
+        # Слишком короткие ряды не тестируются: голова и хвост должны полностью помещаться в историю
+        tstat[self.n < 2 * self.depth + 2] = np.nan
+        pvalues = mackinnonp_vec(tstat, regression='c', N=2)
+        return tstat, pvalues, lags
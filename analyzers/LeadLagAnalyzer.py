@@ -0,0 +1,195 @@
+import os
+import numpy as np
+import pandas as pd
+from scipy import fft as sp_fft
+from scipy.stats import norm
+from tqdm import tqdm
+from processors.AlignedPanel import AlignedPanel
+from processors.TimeframeResampler import resolve_timeframe_dir
+from utils.symbols import SymbolDictionary
+
+
+def lead_lag_xcorr(spec_a, spec_b, n_fft, max_lag, workers=-1):
+    """
+    Взаимные суммы za[t] * zb[t + k] пачки пар на лагах -max_lag..max_lag через FFT.
+
+    spec_* — rfft рядов (NaN заменены нулями), массивы [пары × частоты] одной длины n_fft
+    (с запасом от кольцевого наложения). k > 0 означает, что a опережает b на k баров.
+    """
+    lags = np.r_[np.arange(n_fft - max_lag, n_fft), np.arange(max_lag + 1)]
+    return sp_fft.irfft(np.conj(spec_a) * spec_b, n=n_fft, axis=1, workers=workers)[:, lags]
+
+
+def block_overlap(start_a, end_a, start_b, end_b, lags):
+    """
+    Число t, для которых t в [start_a, end_a] и t + k в [start_b, end_b], для всех лагов k —
+    общие бары пар со сплошными (без пропусков) рядами без FFT масок.
+    """
+    lo = np.maximum(start_a[:, None], start_b[:, None] - lags)
+    hi = np.minimum(end_a[:, None], end_b[:, None] - lags)
+    return np.maximum(hi - lo + 1, 0).astype(np.float64)
+
+
+class LeadLagAnalyzer:
+    """
+    Поиск опережения-запаздывания (lead-lag) для всех пар-кандидатов.
+
+    Для каждой пары считается взаимная корреляция часовых лог-доходностей на лагах ±max_lag баров
+    на общей оси выровненной панели. Спектр доходностей каждой монеты считается один раз,
+    а корреляции всех лагов пачки пар получаются одним обратным FFT произведения спектров,
+    поэтому весь диапазон лагов для всех пар стоит порядка одного FFT на пару.
+
+    Лучший лаг выбирается по максимуму |корреляции| среди ненулевых лагов (нулевой лаг —
+    синхронное движение, а не опережение) и задаёт направление: leader опережает follower
+    на lag баров. Стандартизованные доходности винзоризуются на ±winsorize σ, чтобы пик
+    не создавали несколько выбросов.
+
+    Максимум из 2·max_lag лагов почти всегда находится и у независимых рядов, поэтому лаг считается
+    значимым (столбец significant), только если xcorr_z = |xcorr|·√n выше порога с поправкой Бонферрони
+    на число лагов (norm.isf(alpha / (2 · 2·max_lag))) и |xcorr| больше |xcorr_0|.
+    В PairPermutationTestEvaluator передаются только значимые пары, остальные сохраняют фиксированный lag.
+    """
+
+    def __init__(self, data_dir, timeframe='h1', max_lag=48, min_overlap=100, batch_size=1024, workers=-1,
+                 alpha=0.05, winsorize=4.0):
+        self.data_dir = data_dir
+        self.timeframe = timeframe
+        self.max_lag = max_lag
+        self.alpha = alpha
+        self.winsorize = winsorize
+        self.min_overlap = min_overlap
+        self.batch_size = batch_size
+        self.workers = workers
+        self.panel = None
+        self.results = pd.DataFrame()
+
+    def load_panel(self):
+        self.panel = AlignedPanel.from_dir(resolve_timeframe_dir(self.data_dir, self.timeframe))
+
+    def _spectra(self):
+        """
+        Спектры стандартизованных доходностей и масок валидности всех монет панели,
+        а также границы валидных доходностей и признак сплошного ряда (без пропусков внутри).
+        """
+        values = self.panel.values
+        returns = np.full(values.shape, np.nan)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            returns[:, 1:] = np.log(values[:, 1:] / values[:, :-1])
+        valid = np.isfinite(returns)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = np.nanmean(np.where(valid, returns, np.nan), axis=1, keepdims=True)
+            std = np.nanstd(np.where(valid, returns, np.nan), axis=1, keepdims=True)
+            z = np.where(valid, (returns - mean) / std, 0.0)
+        z[~np.isfinite(z)] = 0.0
+        if self.winsorize:
+            # Выбросы обрезаются, ряд стандартизуется заново (корреляция = сумма / число баров)
+            z = np.clip(z, -self.winsorize, self.winsorize)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                mean = np.nanmean(np.where(valid, z, np.nan), axis=1, keepdims=True)
+                std = np.nanstd(np.where(valid, z, np.nan), axis=1, keepdims=True)
+                z = np.where(valid, (z - mean) / std, 0.0)
+            z[~np.isfinite(z)] = 0.0
+
+        n_fft = sp_fft.next_fast_len(values.shape[1] + self.max_lag, real=True)
+        # float32 достаточно для корреляций и вдвое ускоряет произведение спектров и обратный FFT
+        spec = sp_fft.rfft(z.astype(np.float32), n=n_fft, axis=1, workers=self.workers)
+        mask_spec = sp_fft.rfft(valid.astype(np.float64), n=n_fft, axis=1, workers=self.workers)
+
+        first = np.where(valid.any(axis=1), valid.argmax(axis=1), 0)
+        last = valid.shape[1] - 1 - valid[:, ::-1].argmax(axis=1)
+        contiguous = valid.sum(axis=1) == last - first + 1
+        return spec, mask_spec, n_fft, first, last, contiguous
+
+    def _pairs(self, pairs_df):
+        if pairs_df is None:
+            ii, jj = np.triu_indices(len(self.panel), k=1)
+            keep = self.panel.overlap_counts[ii, jj] >= self.min_overlap
+            return ii[keep].astype(np.int64), jj[keep].astype(np.int64)
+        pairs = SymbolDictionary.from_panel(self.panel).encode_pairs(pairs_df)
+        pairs = pairs.take(pairs.known)
+        return pairs.a.astype(np.int64), pairs.b.astype(np.int64)
+
+    def run(self, pairs_df=None):
+        """
+        pairs_df — пары-кандидаты (столбец 'pair' вида 'A_h1/B_h1'); по умолчанию все пары панели
+        с пересечением не короче min_overlap.
+        """
+        if self.panel is None:
+            self.load_panel()
+        spec, mask_spec, n_fft, first, last, contiguous = self._spectra()
+        ia, ib = self._pairs(pairs_df)
+        lags = np.arange(-self.max_lag, self.max_lag + 1)
+        nonzero = lags != 0
+
+        best_lag = np.zeros(len(ia), dtype=np.int64)
+        best_corr = np.full(len(ia), np.nan)
+        zero_corr = np.full(len(ia), np.nan)
+        n_obs = np.zeros(len(ia), dtype=np.int64)
+        for start in tqdm(range(0, len(ia), self.batch_size), desc=f"Lead-lag ±{self.max_lag}"):
+            part = slice(start, start + self.batch_size)
+            pa, pb = ia[part], ib[part]
+            cross = lead_lag_xcorr(spec[pa], spec[pb], n_fft, self.max_lag, workers=self.workers)
+            # Общие бары на каждом лаге: для сплошных рядов — аналитически, иначе FFT масок
+            counts = block_overlap(first[pa], last[pa], first[pb], last[pb], lags)
+            gaps = ~(contiguous[pa] & contiguous[pb])
+            if gaps.any():
+                counts[gaps] = np.rint(lead_lag_xcorr(mask_spec[pa[gaps]], mask_spec[pb[gaps]], n_fft, self.max_lag,
+                                                      workers=self.workers))
+            with np.errstate(divide='ignore', invalid='ignore'):
+                corr = cross / counts
+            corr[counts < self.min_overlap] = np.nan
+            scored = np.where(np.isfinite(corr[:, nonzero]), np.abs(corr[:, nonzero]), -1.0)
+            k = scored.argmax(axis=1)
+            rows = np.arange(len(k))
+            best_lag[part] = lags[nonzero][k]
+            best_corr[part] = corr[:, nonzero][rows, k]
+            zero_corr[part] = corr[:, self.max_lag]
+            n_obs[part] = counts[:, self.max_lag]
+
+        symbols = np.asarray(self.panel.symbols, dtype=object)
+        a, b = symbols[ia], symbols[ib]
+        a_leads = best_lag > 0
+        self.results = pd.DataFrame({
+            'pair': [f"{x}/{y}" for x, y in zip(a, b)],
+            'asset_a': a,
+            'asset_b': b,
+            'leader': np.where(a_leads, a, b),
+            'follower': np.where(a_leads, b, a),
+            'lag': np.abs(best_lag),
+            'xcorr': best_corr,
+            'xcorr_0': zero_corr,
+            'n_obs': n_obs,
+        })
+        # Значимость пика: под нулевой гипотезой корреляция ~ N(0, 1/n), порог — с поправкой на число лагов
+        self.results['xcorr_z'] = self.results['xcorr'].abs() * np.sqrt(self.results['n_obs'])
+        self.results['significant'] = (self.results['xcorr_z'] > self.z_threshold()) \
+            & (self.results['xcorr'].abs() > self.results['xcorr_0'].abs())
+        self.results = self.results[np.isfinite(self.results['xcorr'])] \
+            .sort_values('xcorr_z', ascending=False).reset_index(drop=True)
+        significant = self.significant()
+        print(f"⏩ Lead-lag: {len(self.results)} пар, лаги ±{self.max_lag} баров, значимый лаг у {len(significant)} "
+              f"(порог xcorr_z {self.z_threshold():.2f}), медианный значимый лаг "
+              f"{significant['lag'].median() if len(significant) else 0:.0f}")
+        return self.results
+
+    def z_threshold(self):
+        """
+        Порог xcorr_z: двусторонний уровень alpha с поправкой Бонферрони на 2·max_lag проверенных лагов.
+        """
+        return float(norm.isf(self.alpha / (2 * 2 * self.max_lag)))
+
+    def significant(self):
+        """
+        Пары со значимым лагом — только их имеет смысл передавать в оценщик вместо фиксированного lag.
+        """
+        if self.results.empty:
+            return self.results
+        return self.results[self.results['significant']].reset_index(drop=True)
+
+    def save_results(self, filepath="lead_lag_pairs.csv"):
+        if self.results.empty:
+            print("⚠️ Нет результатов для сохранения.")
+            return
+        os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+        self.results.to_csv(filepath, index=False)
+        print(f"💾 Lead-lag сохранён в {filepath}")
@@ -0,0 +1,170 @@
+import os
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+from analyzers.EngleGrangerMoments import EngleGrangerMoments
+from processors.ChunkedPriceReader import ChunkedPriceReader
+from processors.TimeframeResampler import resolve_timeframe_dir
+from utils.symbols import SymbolDictionary
+
+
+def merge_moments(n_a, mean_a, m2_a, n_b, mean_b, m2_b):
+    """
+    Объединение (число, среднее, центрированные суммы) двух частей выборки (формула Чана).
+    m2 — суммы квадратов отклонений (векторы) или центрированные кросс-произведения (матрицы).
+    """
+    n = n_a + n_b
+    with np.errstate(divide='ignore', invalid='ignore'):
+        w = np.where(n > 0, n_b / np.maximum(n, 1), 0.0)
+    delta = mean_b - mean_a
+    mean = mean_a + w * delta
+    if np.ndim(m2_a) == 2 and np.ndim(delta) == 1:
+        m2 = m2_a + m2_b + np.outer(delta, delta) * (n_a * n_b / max(n, 1))
+    else:
+        m2 = m2_a + m2_b + delta * delta * n_a * w
+    return n, mean, m2
+
+
+class StreamingStatsAnalyzer:
+    """
+    Потоковый режим коинтеграции и корреляции для длинных историй (минутные бары за год и т.п.).
+
+    Обычные анализаторы грузят всю историю в AlignedPanel и держат её в памяти целиком.
+    Здесь хранилище цен читается окнами по времени (processors.ChunkedPriceReader), а по окнам
+    накапливаются только достаточные статистики тестов:
+    - коинтеграция: моменты Энгла-Грейнджера по парам (analyzers.EngleGrangerMoments —
+      суммы, кросс-произведения и лаговые ковариации; хвост ряда переносится между окнами),
+      тест достраивается из них (лаг ADF по AIC в 0..max_lag, как в run_incremental);
+    - корреляция: число, средние и центрированные кросс-произведения лог-доходностей
+      (объединение окон по формуле Чана), затем второй проход по отобранным парам —
+      среднее, дисперсия и последнее значение спреда для z-score, как в CorrAnalyzer.
+
+    Память — O(окно × монеты + состояние пар) и не зависит от длины истории.
+    """
+
+    def __init__(self, data_dir, timeframe='h1', chunk_bars=20_000, bar_ms=None, min_data_points=100,
+                 pvalue_threshold=0.05, corr_threshold=0.9, zscore_threshold=2, max_lag=12, universe=None):
+        self.data_dir = data_dir
+        self.timeframe = timeframe
+        self.chunk_bars = chunk_bars
+        self.bar_ms = bar_ms
+        self.min_data_points = min_data_points
+        self.pvalue_threshold = pvalue_threshold
+        self.corr_threshold = corr_threshold
+        self.zscore_threshold = zscore_threshold
+        self.max_lag = max_lag
+        self.universe = set(universe) if universe is not None else None
+        self.reader = ChunkedPriceReader(resolve_timeframe_dir(data_dir, timeframe), timeframe=timeframe,
+                                         chunk_bars=chunk_bars, bar_ms=bar_ms, symbols=self.universe,
+                                         min_data_points=min_data_points)
+        self.results = []
+        self.high_corr_pairs = []
+        self.signals = []
+
+    def _pair_indices(self, pairs_df):
+        if pairs_df is None:
+            ii, jj = np.triu_indices(len(self.reader.symbols), k=1)
+            return ii.astype(np.int64), jj.astype(np.int64)
+        pairs = SymbolDictionary(self.reader.symbols).encode_pairs(pairs_df)
+        pairs = pairs.take(pairs.known)
+        return pairs.a.astype(np.int64), pairs.b.astype(np.int64)
+
+    def run_coint(self, pairs_df=None):
+        """
+        Коинтеграция пар (по умолчанию — все пары монет; для тысяч монет лучше передать кандидатов).
+        a — зависимая, b — регрессор, как в coint(close_a, close_b).
+        """
+        ia, ib = self._pair_indices(pairs_df)
+        moments = EngleGrangerMoments(len(ia), self.max_lag)
+        pairs = np.arange(len(ia))
+        print(f"🌊 Потоковая коинтеграция {len(ia)} пар, окна по {self.chunk_bars} баров...")
+        for _, values, mask in tqdm(self.reader, desc="Окна истории", total=self.reader.n_chunks()):
+            xs, ys = [], []
+            for a, b in zip(ia, ib):
+                idx = np.flatnonzero(mask[a] & mask[b])
+                xs.append(values[b, idx])
+                ys.append(values[a, idx])
+            moments.update(pairs, xs, ys)
+
+        _, pvalues, _ = moments.coint()
+        symbols = self.reader.symbols
+        keep = np.flatnonzero((moments.n >= self.min_data_points) & (pvalues < self.pvalue_threshold))
+        self.results = [{'pair': f'{symbols[ia[k]]}/{symbols[ib[k]]}', 'p-value': round(float(pvalues[k]), 5)}
+                        for k in keep]
+        print(f"✅ Найдено {len(self.results)} коинтегрированных пар.")
+        return self.results
+
+    def run_corr(self, limit=5000):
+        """
+        Корреляция лог-доходностей (к предыдущему бару самой монеты, только бары, где валидны все монеты,
+        как в CorrAnalyzer) и z-score последнего спреда отобранных пар — в два потоковых прохода.
+        """
+        n_symbols = len(self.reader.symbols)
+        n, mean, cross = 0, np.zeros(n_symbols), np.zeros((n_symbols, n_symbols))
+        last_price = np.full(n_symbols, np.nan)
+        for _, values, mask in tqdm(self.reader, desc="Окна истории: корреляция", total=self.reader.n_chunks()):
+            # Предыдущее валидное значение монеты: внутри окна ffill, на границе — цена из прошлого окна
+            filled = pd.DataFrame(np.column_stack([last_price, values]).T).ffill().to_numpy().T
+            with np.errstate(divide='ignore', invalid='ignore'):
+                returns = np.log(values / filled[:, :-1])
+            returns = returns[:, np.isfinite(returns).all(axis=0)]
+            last_price = filled[:, -1]
+            if returns.shape[1]:
+                chunk_mean = returns.mean(axis=1)
+                centered = returns - chunk_mean[:, None]
+                n, mean, cross = merge_moments(n, mean, cross, returns.shape[1], chunk_mean, centered @ centered.T)
+
+        symbols = self.reader.symbols
+        pairs = []
+        if n > 1:
+            std = np.sqrt(np.diag(cross))
+            with np.errstate(divide='ignore', invalid='ignore'):
+                corr = cross / np.outer(std, std)
+            ii, jj = np.nonzero(np.triu(corr > self.corr_threshold, k=1))
+            pairs = list(zip(ii, jj))
+        self.high_corr_pairs = [(symbols[i], symbols[j]) for i, j in pairs]
+        print(f"🔗 Найдено {len(pairs)} пар с корреляцией > {self.corr_threshold}")
+
+        # Второй проход: статистики спреда a - b по общим барам отобранных пар
+        selected = pairs[:limit]
+        ia = np.array([i for i, _ in selected], dtype=np.int64)
+        ib = np.array([j for _, j in selected], dtype=np.int64)
+        count, s_mean, s_m2 = np.zeros(len(selected)), np.zeros(len(selected)), np.zeros(len(selected))
+        last_spread = np.full(len(selected), np.nan)
+        if len(selected):
+            for _, values, mask in tqdm(self.reader, desc="Окна истории: спреды", total=self.reader.n_chunks()):
+                common = mask[ia] & mask[ib]
+                spread = np.where(common, values[ia] - values[ib], 0.0)
+                k = common.sum(axis=1)
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    chunk_mean = np.where(k > 0, spread.sum(axis=1) / np.maximum(k, 1), 0.0)
+                chunk_m2 = (np.where(common, spread - chunk_mean[:, None], 0.0) ** 2).sum(axis=1)
+                count, s_mean, s_m2 = merge_moments(count, s_mean, s_m2, k, chunk_mean, chunk_m2)
+                has = k > 0
+                last_col = common.shape[1] - 1 - np.argmax(common[:, ::-1], axis=1)
+                last_spread[has] = spread[has, last_col[has]]
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            zscores = (last_spread - s_mean) / np.sqrt(s_m2 / (count - 1))
+        self.signals = [{'pair': f'{symbols[ia[k]]}/{symbols[ib[k]]}', 'zscore': zscores[k]}
+                        for k in range(len(selected))
+                        if count[k] >= 30 and abs(zscores[k]) > self.zscore_threshold]
+        print(f"📊 Найдено {len(self.signals)} сильных расхождений.")
+        return self.signals
+
+    def save_results(self, filepath="cointegrated_pairs.csv"):
+        if not self.results:
+            print("⚠️ Нет результатов для сохранения.")
+            return
+        os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+        pd.DataFrame(self.results).to_csv(filepath, index=False)
+        print(f"💾 Сохранено в {filepath}")
+
+    def save_signals(self, filename='corr_signals.csv'):
+        if not self.signals:
+            print("🔍 Нет сигналов для сохранения.")
+            return
+        df_signals = pd.DataFrame(self.signals)
+        df_signals['abs_zscore'] = df_signals['zscore'].abs()
+        df_signals.sort_values('abs_zscore', ascending=False).to_csv(filename, index=False)
+        print(f"✅ Сигналы сохранены в {filename}")
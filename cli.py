@@ -0,0 +1,721 @@
+import argparse
+import importlib
+import os
+import time
+
+'''
+Единая точка входа в проект.
+
+Тяжёлые зависимости (statsmodels, sklearn, pybit, matplotlib) импортируются
+только внутри выбранной подкоманды, поэтому служебные команды стартуют за доли секунды.
+
+Примеры:
+    python cli.py collect --save-dir futures_data
+    python cli.py import-archives archives/ --interval 60
+    python cli.py universe --min-turnover 20000
+    python cli.py coint --data-dir futures_data --output cointegrated_pairs.csv
+    python cli.py coint --universe universe.csv
+    python cli.py candidates --k 20 --recall --reference cointegrated_pairs.csv
+    python cli.py coint --candidates candidate_pairs.csv
+    python cli.py coint --streaming --chunk-bars 50000 --bar-ms 60000 --candidates candidate_pairs.csv
+    python cli.py coint --stability --window 336 --step 24
+    python cli.py coint --expand-universe --stale-bars 24
+    python cli.py corr --data-dir futures_data
+    python cli.py features --windows 24 72 168
+    python cli.py corr --features
+    python cli.py mean-reversion --pairs-csv cointegrated_pairs.csv --max-half-life 48
+    python cli.py lead-lag --pairs-csv cointegrated_pairs.csv --max-lag 48
+    python cli.py evaluate --pairs-csv cointegrated_pairs.csv --top-percent 0.01 --plot
+    python cli.py evaluate --lead-lag lead_lag_pairs.csv
+    python cli.py perm-results --top-percent 0.05 --thresholds 0 0.05 0.1 0.2 --plot
+    python cli.py simulate --pairs-file top_1pct_significant_pairs.csv
+    python cli.py robustness --resamples 5000
+    python cli.py replay --pairs-file top_1pct_significant_pairs.csv --speed 3600 --compare
+    python cli.py plot APEUSDT ACXUSDT
+    python cli.py resample h4 d1
+    python cli.py coint --timeframe h4
+    python cli.py plot --report report_data_coin_method/pair_trading_results.csv
+    python cli.py report --simulation report_data_coin_method/pair_trading_results.csv --output reports/run.html
+    python cli.py run --now
+    python cli.py results --stage coint --metric p-value --pair KERNELUSDT ZRXUSDT
+    python cli.py results --stage permutation --metric delta --since 2025-05-01
+    python cli.py shard-plan coint --shards 16 --queue-dir shards
+    python cli.py shard-worker --queue-dir shards --local-workers 4
+    python cli.py shard-merge --queue-dir shards --output cointegrated_pairs.csv
+    python cli.py --profile-import plot APEUSDT ACXUSDT
+'''
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(BASE_DIR, "futures_data")
+
+TIMEFRAME_CHOICES = ['h1', 'h2', 'h4', 'h12', 'd1']
+BACKEND_CHOICES = ['auto', 'serial', 'thread', 'process', 'asyncio']
+
+_import_timings = []
+
+
+def lazy_import(module_name, attr=None):
+    """
+    Импортирует модуль (и при необходимости атрибут из него) в момент вызова
+    и запоминает время импорта для --profile-import.
+    """
+    start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    _import_timings.append((module_name, time.perf_counter() - start))
+    return getattr(module, attr) if attr else module
+
+
+def print_import_profile(startup_time):
+    print("\n⏱ Профиль импортов:")
+    for module_name, elapsed in _import_timings:
+        print(f"   {module_name:<50} {elapsed * 1000:8.1f} ms")
+    total = sum(elapsed for _, elapsed in _import_timings)
+    print(f"   {'итого ленивых импортов':<50} {total * 1000:8.1f} ms")
+    print(f"   {'старт CLI до выполнения команды':<50} {startup_time * 1000:8.1f} ms")
+
+
+def cmd_collect(args):
+    FuturesDataCollector = lazy_import("collectors.FuturesDataCollector", "FuturesDataCollector")
+    collector = FuturesDataCollector(
+        api_key=args.api_key,
+        api_secret=args.api_secret,
+        save_dir=args.save_dir,
+        testnet=args.testnet,
+        interval=args.interval,
+        limit=args.limit
+    )
+    collector.get_usdt_futures_tickers()
+    collector.collect_all_data(max_workers=args.max_workers)
+
+
+def cmd_import_archives(args):
+    KlineArchiveImporter = lazy_import("collectors.KlineArchiveImporter", "KlineArchiveImporter")
+    importer = KlineArchiveImporter(
+        archive_dir=args.archive_dir,
+        save_dir=args.save_dir,
+        interval=args.interval,
+        max_workers=args.max_workers
+    )
+    importer.run()
+
+
+def load_universe(path):
+    if not path:
+        return None
+    UniverseFilter = lazy_import("processors.UniverseFilter", "UniverseFilter")
+    return UniverseFilter.load_selected(path)
+
+
+def cmd_universe(args):
+    UniverseFilter = lazy_import("processors.UniverseFilter", "UniverseFilter")
+    universe = UniverseFilter(
+        data_dir=args.data_dir,
+        timeframe=args.timeframe,
+        window=args.window,
+        min_turnover=args.min_turnover,
+        min_completeness=args.min_completeness,
+        max_relative_tick=args.max_relative_tick
+    )
+    universe.run()
+    universe.save(args.output)
+
+
+def streaming_analyzer(args):
+    StreamingStatsAnalyzer = lazy_import("analyzers.StreamingStatsAnalyzer", "StreamingStatsAnalyzer")
+    return StreamingStatsAnalyzer(
+        data_dir=args.data_dir,
+        timeframe=args.timeframe,
+        chunk_bars=args.chunk_bars,
+        bar_ms=args.bar_ms,
+        min_data_points=args.min_data_points,
+        pvalue_threshold=getattr(args, 'pvalue_threshold', 0.05),
+        corr_threshold=getattr(args, 'corr_threshold', 0.9),
+        zscore_threshold=getattr(args, 'zscore_threshold', 2),
+        universe=load_universe(args.universe)
+    )
+
+
+def cmd_coint(args):
+    if args.streaming:
+        analyzer = streaming_analyzer(args)
+        analyzer.run_coint(lazy_import("pandas").read_csv(args.candidates) if args.candidates else None)
+        analyzer.save_results(args.output)
+        return
+
+    CointegrationAnalyzerAsync = lazy_import("analyzers.CointegrationAnalyzerAsync", "CointegrationAnalyzerAsync")
+    analyzer = CointegrationAnalyzerAsync(
+        data_dir=args.data_dir,
+        min_data_points=args.min_data_points,
+        pvalue_threshold=args.pvalue_threshold,
+        max_workers=args.max_workers,
+        timeframe=args.timeframe,
+        memory_budget_mb=args.memory_budget,
+        universe=load_universe(args.universe),
+        backend=args.backend,
+        candidates=lazy_import("pandas").read_csv(args.candidates) if args.candidates else None,
+        prefilter=None if args.prefilter == "none" else args.prefilter,
+        prefilter_lag=args.prefilter_lag,
+        prefilter_pvalue=args.prefilter_pvalue,
+        dw_threshold=args.dw_threshold,
+        both_directions=args.both_directions
+    )
+    if args.incremental:
+        analyzer.run_incremental(state_path=args.state)
+        analyzer.save_status_changes(args.status_changes)
+    elif args.expand_universe:
+        analyzer.run_expansion(state_path=args.universe_state, stale_bars=args.stale_bars,
+                               checkpoint_path=args.checkpoint, resume=args.resume)
+        analyzer.save_universe_diff(args.universe_diff)
+    else:
+        analyzer.run(checkpoint_path=args.checkpoint, resume=args.resume)
+    if args.stability:
+        analyzer.run_stability(window=args.window, step=args.step, min_stability=args.min_stability)
+        analyzer.save_stability(args.stability_output)
+    analyzer.save_results(args.output)
+
+
+def cmd_candidates(args):
+    PairCandidateSearch = lazy_import("processors.PairCandidateSearch", "PairCandidateSearch")
+    pd = lazy_import("pandas")
+    search = PairCandidateSearch(
+        data_dir=args.data_dir,
+        timeframe=args.timeframe,
+        k=args.k,
+        window=args.window,
+        method=args.method,
+        dim=args.dim,
+        n_tables=args.tables,
+        n_bits=args.bits
+    )
+    search.run()
+    search.save_results(args.output)
+    if args.recall:
+        reference = pd.read_csv(args.reference) if args.reference else None
+        pd.DataFrame([search.recall(reference)]).to_csv(args.recall_output, index=False)
+
+
+def cmd_features(args):
+    FeatureStore = lazy_import("processors.FeatureStore", "FeatureStore")
+    FeatureStore(args.data_dir, timeframe=args.timeframe, windows=args.windows).update_all()
+
+
+def cmd_corr(args):
+    if args.streaming:
+        analyzer = streaming_analyzer(args)
+        analyzer.run_corr()
+        analyzer.save_signals()
+        return
+
+    CorrAnalyzer = lazy_import("analyzers.CorrAnalyzer", "CorrAnalyzer")
+    feature_store = None
+    if args.features:
+        FeatureStore = lazy_import("processors.FeatureStore", "FeatureStore")
+        feature_store = FeatureStore(args.data_dir, timeframe=args.timeframe)
+    analyzer = CorrAnalyzer(
+        data_dir=args.data_dir,
+        corr_threshold=args.corr_threshold,
+        zscore_threshold=args.zscore_threshold,
+        min_data_points=args.min_data_points,
+        timeframe=args.timeframe,
+        memory_budget_mb=args.memory_budget,
+        universe=load_universe(args.universe),
+        feature_store=feature_store
+    )
+    analyzer.run_full_analysis()
+
+
+def cmd_mean_reversion(args):
+    MeanReversionEvaluator = lazy_import("evaluators.MeanReversionEvaluator", "MeanReversionEvaluator")
+    pd = lazy_import("pandas")
+    evaluator = MeanReversionEvaluator(
+        data_dir=args.data_dir,
+        timeframe=args.timeframe,
+        max_half_life=args.max_half_life,
+        max_hurst=args.max_hurst,
+        min_zero_crossing_rate=args.min_zero_crossing_rate
+    )
+    evaluator.run(pd.read_csv(args.pairs_csv))
+    evaluator.save_results(args.output, all_pairs=args.all_pairs)
+
+
+def cmd_lead_lag(args):
+    pd = lazy_import("pandas")
+    LeadLagAnalyzer = lazy_import("analyzers.LeadLagAnalyzer", "LeadLagAnalyzer")
+    analyzer = LeadLagAnalyzer(data_dir=args.data_dir, timeframe=args.timeframe, max_lag=args.max_lag,
+                               min_overlap=args.min_overlap, alpha=args.alpha,
+                               winsorize=args.winsorize or None)
+    # Без --pairs-csv проверяются все пары панели
+    analyzer.run(pd.read_csv(args.pairs_csv) if args.pairs_csv else None)
+    analyzer.save_results(args.output)
+
+
+def cmd_evaluate(args):
+    PairPermutationTestEvaluator = lazy_import("evaluators.PairPermutationTestEvaluator",
+                                               "PairPermutationTestEvaluator")
+    evaluator = PairPermutationTestEvaluator(
+        pairs_csv=args.pairs_csv,
+        data_dir=args.data_dir,
+        output_csv=args.output_csv,
+        r2_threshold=args.r2_threshold,
+        lag=args.lag,
+        max_workers=args.max_workers,
+        timeframe=args.timeframe,
+        backend=args.backend,
+        table_path=args.table
+    )
+    if args.lead_lag:
+        pd = lazy_import("pandas")
+        evaluator.set_lead_lag(pd.read_csv(args.lead_lag))
+    evaluator.run(checkpoint_path=args.checkpoint, resume=args.resume)
+    if args.top_percent:
+        evaluator.filter_top_percent(top_percent=args.top_percent)
+    if args.plot:
+        evaluator.plot_delta_distribution()
+
+
+def cmd_perm_results(args):
+    PermutationResults = lazy_import("evaluators.PermutationResults", "PermutationResults")
+    table = PermutationResults.load(args.table)
+    print(f"📂 {len(table)} оценённых пар в {args.table}")
+    if args.thresholds:
+        print(table.threshold_table(args.thresholds).to_string(index=False))
+    if args.top_percent:
+        top = table.top_percent(args.top_percent, r2_threshold=args.r2_threshold)
+        top.to_csv(args.output, index=False)
+        print(f"🔎 Сохранено {len(top)} самых значимых пар в файл: {args.output}")
+    if args.plot:
+        table.plot_delta_distribution(args.plot_path, bins=args.bins, r2_threshold=args.r2_threshold)
+
+
+def cmd_simulate(args):
+    PairTradingSimulatorCoin = lazy_import("simulators.PairTradingSimulatorCoin", "PairTradingSimulatorCoin")
+    sim = PairTradingSimulatorCoin(
+        data_dir=args.data_dir,
+        pairs_file=args.pairs_file,
+        save_dir=args.save_dir,
+        timeframe=args.timeframe,
+        max_workers=args.max_workers,
+        backend=args.backend
+    )
+    sim.run_batch()
+
+
+def cmd_robustness(args):
+    BootstrapRobustnessTester = lazy_import("simulators.BootstrapRobustnessTester", "BootstrapRobustnessTester")
+    pd = lazy_import("pandas")
+    tester = BootstrapRobustnessTester(
+        data_dir=args.data_dir,
+        timeframe=args.timeframe,
+        n_resamples=args.resamples,
+        mean_block=args.mean_block,
+        confidence=args.confidence,
+        seed=args.seed
+    )
+    tester.run(pd.read_csv(args.pairs_file))
+    tester.save_results(args.output)
+
+
+def cmd_replay(args):
+    ReplayDriver = lazy_import("simulators.ReplayDriver", "ReplayDriver")
+    pd = lazy_import("pandas")
+    driver = ReplayDriver(
+        data_dir=args.data_dir,
+        pairs_df=pd.read_csv(args.pairs_file),
+        timeframe=args.timeframe,
+        zscore_threshold=args.zscore_threshold,
+        beta=None if args.online_beta else 'batch',
+        speed=args.speed
+    )
+    driver.run(max_bars=args.max_bars)
+    driver.save(args.output_dir)
+    if args.compare:
+        driver.compare_batch().to_csv(os.path.join(args.output_dir, "replay_vs_batch.csv"), index=False)
+
+
+def cmd_plot(args):
+    if args.report:
+        CoinReportPlotter = lazy_import("plotters.CoinReportPlotter", "CoinReportPlotter")
+        CoinReportPlotter(args.report, output_dir=args.output_dir, top_n=args.top_n).generate()
+        return
+
+    if not args.coins or len(args.coins) != 2:
+        print("❗ Укажите две монеты (например: APEUSDT ACXUSDT) или --report <csv>.")
+        return
+
+    PairSpreadPlotter = lazy_import("plotters.CorrSpreadPlotter", "PairSpreadPlotter")
+    plotter = PairSpreadPlotter(data_dir=args.data_dir, timeframe=args.timeframe)
+    plotter.plot_pair_spread(*args.coins)
+
+
+def cmd_report(args):
+    pd = lazy_import("pandas")
+    build_run_report = lazy_import("plotters.HtmlRunReport", "build_run_report")
+    PairTradingSimulatorCoin = lazy_import("simulators.PairTradingSimulatorCoin", "PairTradingSimulatorCoin")
+    simulator = PairTradingSimulatorCoin(data_dir=args.data_dir, pairs_file=None, save_dir=args.save_dir,
+                                         timeframe=args.timeframe)
+    pair_results = pd.read_csv(args.simulation) if args.simulation else None
+    deltas = None
+    if args.permutation and args.permutation.endswith(".npz"):
+        deltas = lazy_import("evaluators.PermutationResults", "PermutationResults").load(args.permutation).delta
+    elif args.permutation:
+        deltas = pd.read_csv(args.permutation)['delta']
+    robustness = pd.read_csv(args.robustness) if args.robustness else None
+    build_run_report(args.output, simulator=simulator, pair_results=pair_results, deltas=deltas,
+                     robustness=robustness, max_pairs=args.max_pairs)
+
+
+def cmd_resample(args):
+    TimeframeResampler = lazy_import("processors.TimeframeResampler", "TimeframeResampler")
+    resampler = TimeframeResampler(args.data_dir)
+    for timeframe in args.timeframes:
+        resampler.update_all(timeframe)
+
+
+def cmd_results(args):
+    ResultsStore = lazy_import("utils.results_store", "ResultsStore")
+    store = ResultsStore(args.db)
+    if args.pair:
+        df = store.pair_history(args.pair[0], args.pair[1], args.stage, args.metric, last_runs=args.limit)
+    else:
+        df = store.top_pairs(args.stage, args.metric, since=args.since, limit=args.limit, ascending=args.ascending)
+    print(df.to_string(index=False) if not df.empty else "⚠️ Нет результатов.")
+    store.close()
+
+
+def cmd_shard_plan(args):
+    ShardQueue = lazy_import("utils.sharding", "ShardQueue")
+    params = {'data_dir': args.data_dir, 'timeframe': args.timeframe}
+    if args.stage == 'coint':
+        params.update(min_data_points=args.min_data_points, pvalue_threshold=args.pvalue_threshold,
+                      max_workers=args.max_workers)
+    elif args.stage == 'permutation':
+        params.update(pairs_csv=os.path.abspath(args.pairs_csv), r2_threshold=args.r2_threshold, lag=args.lag,
+                      max_workers=args.max_workers, min_data_points=args.min_data_points)
+    else:
+        params.update(pairs_file=os.path.abspath(args.pairs_csv), min_data_points=args.min_data_points,
+                      max_workers=args.max_workers)
+    ShardQueue(args.queue_dir).plan(args.stage, args.shards, params)
+
+
+def cmd_shard_worker(args):
+    if args.local_workers > 1:
+        run_local_workers = lazy_import("utils.sharding", "run_local_workers")
+        run_local_workers(args.queue_dir, args.local_workers, max_workers=args.max_workers, heartbeat=args.heartbeat)
+        return
+    ShardWorker = lazy_import("utils.sharding", "ShardWorker")
+    ShardQueue = lazy_import("utils.sharding", "ShardQueue")
+    if args.requeue_after:
+        requeued = ShardQueue(args.queue_dir).requeue_stale(args.requeue_after)
+        if requeued:
+            print(f"♻️ Возвращено в очередь зависших шардов: {requeued}")
+    ShardWorker(args.queue_dir, worker_id=args.worker_id, max_workers=args.max_workers,
+                heartbeat=args.heartbeat).run(args.max_shards)
+
+
+def cmd_shard_merge(args):
+    merge_shards = lazy_import("utils.sharding", "merge_shards")
+    ShardQueue = lazy_import("utils.sharding", "ShardQueue")
+    print(f"🧩 Статус очереди: {ShardQueue(args.queue_dir).status()}")
+    merge_shards(args.queue_dir, output=args.output, allow_partial=args.allow_partial)
+
+
+def cmd_run(args):
+    setup_logger = lazy_import("utils.logger", "setup_logger")
+    setup_logger()
+
+    if args.now:
+        print("🚨 Принудительный запуск пайплайна")
+        MainPipelineRunner = lazy_import("pipeline_runner", "MainPipelineRunner")
+        MainPipelineRunner().run()
+    else:
+        schedule_weekly = lazy_import("main", "schedule_weekly")
+        schedule_weekly()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="cli.py", description="Solomon_bot: единая точка входа в пайплайн")
+    parser.add_argument("--profile-import", action="store_true",
+                        help="вывести время ленивых импортов выбранной подкоманды")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    p = subparsers.add_parser("collect", help="сбор исторических данных фьючерсов с Bybit")
+    p.add_argument("--save-dir", default=DATA_DIR)
+    p.add_argument("--api-key", default=os.environ.get("BYBIT_API_KEY", ""))
+    p.add_argument("--api-secret", default=os.environ.get("BYBIT_API_SECRET", ""))
+    p.add_argument("--testnet", action="store_true")
+    p.add_argument("--interval", default="60")
+    p.add_argument("--limit", type=int, default=3600)
+    p.add_argument("--max-workers", type=int, help="по умолчанию — ядра + 4, не больше 32 (сетевые задачи)")
+    p.set_defaults(func=cmd_collect)
+
+    p = subparsers.add_parser("import-archives", help="офлайн-импорт дневных архивов свечей (zip / csv.gz)")
+    p.add_argument("archive_dir", help="директория с архивами, например BTCUSDT-1h-2024-01-01.zip")
+    p.add_argument("--save-dir", default=DATA_DIR)
+    p.add_argument("--interval", default="60", help="интервал свечей архивов в терминах Bybit (60, 240, D)")
+    p.add_argument("--max-workers", type=int, help="процессов распаковки (по умолчанию — число ядер)")
+    p.set_defaults(func=cmd_import_archives)
+
+    p = subparsers.add_parser("universe", help="отбор ликвидной вселенной монет до генерации пар")
+    p.add_argument("--data-dir", default=DATA_DIR)
+    p.add_argument("--output", default=os.path.join(BASE_DIR, "universe.csv"))
+    p.add_argument("--window", type=int, default=720, help="окно метрик, баров")
+    p.add_argument("--min-turnover", type=float, default=10_000, help="минимальная медиана оборота бара, USDT")
+    p.add_argument("--min-completeness", type=float, default=0.95, help="минимальная доля присутствующих баров")
+    p.add_argument("--max-relative-tick", type=float, default=0.002, help="максимальный шаг цены к цене")
+    p.add_argument("--timeframe", choices=TIMEFRAME_CHOICES, default="h1")
+    p.set_defaults(func=cmd_universe)
+
+    p = subparsers.add_parser("coint", help="поиск коинтегрированных пар (тест Энгла-Грейнджера)")
+    p.add_argument("--data-dir", default=DATA_DIR)
+    p.add_argument("--min-data-points", type=int, default=100)
+    p.add_argument("--pvalue-threshold", type=float, default=0.05)
+    p.add_argument("--max-workers", type=int, help="по умолчанию — по числу ядер (utils.executor)")
+    p.add_argument("--backend", choices=BACKEND_CHOICES, default="auto", help="как выполнять задачи этапа (utils.executor)")
+    p.add_argument("--output", default=os.path.join(BASE_DIR, "cointegrated_pairs.csv"))
+    p.add_argument("--incremental", action="store_true",
+                   help="обновить сохранённые статистики пар только новыми барами")
+    p.add_argument("--state", default=os.path.join(BASE_DIR, "coint_state.npz"))
+    p.add_argument("--status-changes", default=os.path.join(BASE_DIR, "coint_status_changes.csv"))
+    p.add_argument("--expand-universe", action="store_true",
+                   help="проверить только пары с новыми монетами, списать делистинг, перенести прошлые результаты")
+    p.add_argument("--universe-state", default=os.path.join(BASE_DIR, "coint_universe.npz"))
+    p.add_argument("--universe-diff", default=os.path.join(BASE_DIR, "coint_universe_diff.csv"))
+    p.add_argument("--stale-bars", type=int, default=24,
+                   help="монета считается снятой с торгов, если её последний бар старше стольких баров")
+    p.add_argument("--timeframe", choices=TIMEFRAME_CHOICES, default="h1")
+    p.add_argument("--memory-budget", type=float, default=256, help="бюджет памяти на плитки пар, МБ")
+    p.add_argument("--universe", help="CSV вселенной (python cli.py universe): пары только из отобранных монет")
+    p.add_argument("--candidates", help="CSV пар-кандидатов (python cli.py candidates): проверять только их")
+    p.add_argument("--prefilter", choices=["adf", "dw", "none"], default="none",
+                   help="дешёвая первая ступень каскада (ADF с фиксированным лагом или Дарбин-Уотсон): "
+                        "примерно вдвое быстрее, но может терять пары, которые прошёл бы полный тест")
+    p.add_argument("--prefilter-lag", type=int, default=0, help="лаг ADF первой ступени")
+    p.add_argument("--prefilter-pvalue", type=float, default=0.3, help="мягкий порог p-value первой ступени")
+    p.add_argument("--dw-threshold", type=float, default=0.02, help="минимальная статистика Дарбина-Уотсона (--prefilter dw)")
+    p.add_argument("--both-directions", action="store_true", help="требовать коинтеграцию и в обратной регрессии")
+    p.add_argument("--checkpoint", default=os.path.join(BASE_DIR, "checkpoints", "coint.jsonl"),
+                   help="файл контрольной точки завершённых плиток пар")
+    p.add_argument("--resume", action="store_true", help="продолжить с контрольной точки")
+    p.add_argument("--stability", action="store_true",
+                   help="оставить только пары, коинтегрированные на последнем скользящем окне")
+    p.add_argument("--window", type=int, default=336, help="длина скользящего окна, баров")
+    p.add_argument("--step", type=int, default=24, help="шаг окна, баров")
+    p.add_argument("--min-stability", type=float, default=0.0, help="минимальная доля коинтегрированных окон")
+    p.add_argument("--stability-output", default=os.path.join(BASE_DIR, "coint_stability.csv"))
+    p.add_argument("--streaming", action="store_true",
+                   help="потоковый режим: история читается окнами по времени, память не зависит от её длины")
+    p.add_argument("--chunk-bars", type=int, default=20_000, help="баров в окне потокового режима")
+    p.add_argument("--bar-ms", type=int, help="шаг баров в мс для потокового режима (по умолчанию шаг таймфрейма)")
+    p.set_defaults(func=cmd_coint)
+
+    p = subparsers.add_parser("candidates", help="пары-кандидаты через приближённый поиск ближайших соседей (PCA + LSH)")
+    p.add_argument("--data-dir", default=DATA_DIR)
+    p.add_argument("--output", default=os.path.join(BASE_DIR, "candidate_pairs.csv"))
+    p.add_argument("--k", type=int, default=20, help="соседей на монету")
+    p.add_argument("--window", type=int, default=720, help="длина лог-ценового пути, баров")
+    p.add_argument("--method", choices=["pca", "random"], default="pca", help="сжатие пути: PCA или случайная проекция")
+    p.add_argument("--dim", type=int, default=32, help="размерность вектора монеты")
+    p.add_argument("--tables", type=int, default=8, help="число таблиц LSH")
+    p.add_argument("--bits", type=int, help="бит на таблицу (по умолчанию — корзины порядка 4k монет)")
+    p.add_argument("--recall", action="store_true", help="сравнить с точным перебором")
+    p.add_argument("--reference", help="CSV пар полного перебора (например, cointegrated_pairs.csv) для покрытия")
+    p.add_argument("--recall-output", default=os.path.join(BASE_DIR, "candidate_recall.csv"))
+    p.add_argument("--timeframe", choices=TIMEFRAME_CHOICES, default="h1")
+    p.set_defaults(func=cmd_candidates)
+
+    p = subparsers.add_parser("corr", help="поиск коррелированных пар с сильным расхождением")
+    p.add_argument("--data-dir", default=DATA_DIR)
+    p.add_argument("--corr-threshold", type=float, default=0.9)
+    p.add_argument("--zscore-threshold", type=float, default=2)
+    p.add_argument("--min-data-points", type=int, default=100)
+    p.add_argument("--timeframe", choices=TIMEFRAME_CHOICES, default="h1")
+    p.add_argument("--memory-budget", type=float, default=256, help="бюджет памяти на плитки пар, МБ")
+    p.add_argument("--universe", help="CSV вселенной (python cli.py universe): пары только из отобранных монет")
+    p.add_argument("--features", action="store_true", help="брать лог-доходности из хранилища признаков")
+    p.add_argument("--streaming", action="store_true",
+                   help="потоковый режим: история читается окнами по времени, память не зависит от её длины")
+    p.add_argument("--chunk-bars", type=int, default=20_000, help="баров в окне потокового режима")
+    p.add_argument("--bar-ms", type=int, help="шаг баров в мс для потокового режима (по умолчанию шаг таймфрейма)")
+    p.set_defaults(func=cmd_corr)
+
+    p = subparsers.add_parser("features", help="обновить хранилище признаков: лог-доходности, скользящие средние и волатильность")
+    p.add_argument("--data-dir", default=DATA_DIR)
+    p.add_argument("--windows", type=int, nargs="+", default=[24, 72, 168], help="окна скользящих статистик, баров")
+    p.add_argument("--timeframe", choices=TIMEFRAME_CHOICES, default="h1")
+    p.set_defaults(func=cmd_features)
+
+    p = subparsers.add_parser("mean-reversion", help="half-life, Хёрст, variance ratio спреда и отсев медленных пар")
+    p.add_argument("--pairs-csv", default=os.path.join(BASE_DIR, "cointegrated_pairs.csv"))
+    p.add_argument("--data-dir", default=DATA_DIR)
+    p.add_argument("--output", default=os.path.join(BASE_DIR, "mean_reversion_pairs.csv"))
+    p.add_argument("--max-half-life", type=float, default=72, help="максимальный half-life спреда, баров")
+    p.add_argument("--max-hurst", type=float, help="максимальный показатель Хёрста")
+    p.add_argument("--min-zero-crossing-rate", type=float, help="минимальная доля пересечений среднего")
+    p.add_argument("--all-pairs", action="store_true", help="сохранить метрики всех пар, а не только прошедших")
+    p.add_argument("--timeframe", choices=TIMEFRAME_CHOICES, default="h1")
+    p.set_defaults(func=cmd_mean_reversion)
+
+    p = subparsers.add_parser("lead-lag", help="лучший лаг и направление опережения пар (FFT-корреляция доходностей)")
+    p.add_argument("--pairs-csv", help="пары-кандидаты; по умолчанию все пары")
+    p.add_argument("--data-dir", default=DATA_DIR)
+    p.add_argument("--output", default=os.path.join(BASE_DIR, "lead_lag_pairs.csv"))
+    p.add_argument("--max-lag", type=int, default=48, help="диапазон лагов ±, баров")
+    p.add_argument("--min-overlap", type=int, default=100)
+    p.add_argument("--alpha", type=float, default=0.05, help="уровень значимости лага (с поправкой на число лагов)")
+    p.add_argument("--winsorize", type=float, default=4.0, help="обрезка доходностей, σ (0 — без обрезки)")
+    p.add_argument("--timeframe", choices=TIMEFRAME_CHOICES, default="h1")
+    p.set_defaults(func=cmd_lead_lag)
+
+    p = subparsers.add_parser("evaluate", help="пермутационный тест значимости пар")
+    p.add_argument("--pairs-csv", default=os.path.join(BASE_DIR, "cointegrated_pairs.csv"))
+    p.add_argument("--data-dir", default=DATA_DIR)
+    p.add_argument("--output-csv", default=os.path.join(BASE_DIR, "significant_pairs.csv"))
+    p.add_argument("--r2-threshold", type=float, default=0.1)
+    p.add_argument("--lag", type=int, default=3)
+    p.add_argument("--lead-lag", help="CSV lead-lag (python cli.py lead-lag): лаг и направление по парам вместо --lag")
+    p.add_argument("--max-workers", type=int, help="по умолчанию — по числу ядер (utils.executor)")
+    p.add_argument("--backend", choices=BACKEND_CHOICES, default="auto", help="как выполнять задачи этапа (utils.executor)")
+    p.add_argument("--top-percent", type=float, default=0.01,
+                   help="доля самых значимых пар для top-файла (0 — не фильтровать)")
+    p.add_argument("--plot", action="store_true", help="построить распределение delta R²")
+    p.add_argument("--timeframe", choices=TIMEFRAME_CHOICES, default="h1")
+    p.add_argument("--checkpoint", default=os.path.join(BASE_DIR, "checkpoints", "permutation.jsonl"),
+                   help="файл контрольной точки посчитанных пар")
+    p.add_argument("--resume", action="store_true", help="продолжить с контрольной точки")
+    p.add_argument("--table", help="таблица всех оценённых пар (.npz), по умолчанию рядом с --output-csv")
+    p.set_defaults(func=cmd_evaluate)
+
+    p = subparsers.add_parser("perm-results", help="отбор, пороги и гистограмма delta из сохранённой таблицы пермутационного теста")
+    p.add_argument("--table", default=os.path.join(BASE_DIR, "significant_pairs_all.npz"))
+    p.add_argument("--r2-threshold", type=float, default=0.1, help="порог delta перед отбором top-процента")
+    p.add_argument("--top-percent", type=float, help="сохранить долю самых значимых пар в --output")
+    p.add_argument("--output", default=os.path.join(BASE_DIR, "top_significant_pairs.csv"))
+    p.add_argument("--thresholds", type=float, nargs="+", help="сколько пар проходит каждый порог delta")
+    p.add_argument("--plot", action="store_true", help="гистограмма delta по всем оценённым парам")
+    p.add_argument("--plot-path", default=os.path.join(BASE_DIR, "delta_distribution.png"))
+    p.add_argument("--bins", type=int, default=50)
+    p.set_defaults(func=cmd_perm_results)
+
+    p = subparsers.add_parser("simulate", help="симуляция парной торговли по отобранным парам")
+    p.add_argument("--data-dir", default=DATA_DIR)
+    p.add_argument("--pairs-file", default=os.path.join(BASE_DIR, "top_1pct_significant_pairs.csv"))
+    p.add_argument("--save-dir", default="report_data_coin_method")
+    p.add_argument("--timeframe", choices=TIMEFRAME_CHOICES, default="h1")
+    p.add_argument("--max-workers", type=int, help="по умолчанию — по числу ядер (utils.executor)")
+    p.add_argument("--backend", choices=BACKEND_CHOICES, default="auto", help="как выполнять задачи этапа (utils.executor)")
+    p.set_defaults(func=cmd_simulate)
+
+    p = subparsers.add_parser("robustness", help="блочный бутстрап результатов симуляции: интервалы PnL, win rate, просадки")
+    p.add_argument("--pairs-file", default=os.path.join(BASE_DIR, "report_data_coin_method", "pair_trading_results.csv"))
+    p.add_argument("--data-dir", default=DATA_DIR)
+    p.add_argument("--output", default=os.path.join(BASE_DIR, "report_data_coin_method", "bootstrap_robustness.csv"))
+    p.add_argument("--resamples", type=int, default=2000)
+    p.add_argument("--mean-block", type=float, default=24, help="средняя длина блока, баров")
+    p.add_argument("--confidence", type=float, default=0.95)
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--timeframe", choices=TIMEFRAME_CHOICES, default="h1")
+    p.set_defaults(func=cmd_robustness)
+
+    p = subparsers.add_parser("replay", help="ускоренное воспроизведение истории через живой путь сигналов")
+    p.add_argument("--pairs-file", default=os.path.join(BASE_DIR, "top_1pct_significant_pairs.csv"))
+    p.add_argument("--data-dir", default=DATA_DIR)
+    p.add_argument("--output-dir", default=os.path.join(BASE_DIR, "report_data_coin_method", "replay"))
+    p.add_argument("--speed", type=float, help="ускорение относительно реального времени (3600 — час за секунду); "
+                                               "по умолчанию — максимальная скорость")
+    p.add_argument("--max-bars", type=int, help="воспроизвести только первые N баров")
+    p.add_argument("--zscore-threshold", type=float, default=2.0, help="порог расхождения как в corr")
+    p.add_argument("--online-beta", action="store_true",
+                   help="оценивать beta онлайн по прошедшим барам вместо beta по всей истории")
+    p.add_argument("--compare", action="store_true", help="сверить сделки и z-score с пакетным расчётом")
+    p.add_argument("--timeframe", choices=TIMEFRAME_CHOICES, default="h1")
+    p.set_defaults(func=cmd_replay)
+
+    p = subparsers.add_parser("plot", help="график спреда пары или сводный отчёт симуляции")
+    p.add_argument("coins", nargs="*", help="две монеты без суффикса _h1, например APEUSDT ACXUSDT")
+    p.add_argument("--data-dir", default=DATA_DIR)
+    p.add_argument("--report", help="CSV с результатами симуляции для сводного графика")
+    p.add_argument("--output-dir", default=os.path.join(BASE_DIR, "report_data_coin_method"))
+    p.add_argument("--top-n", type=int, default=10)
+    p.add_argument("--timeframe", choices=TIMEFRAME_CHOICES, default="h1")
+    p.set_defaults(func=cmd_plot)
+
+    p = subparsers.add_parser("report", help="самодостаточный HTML-отчёт: delta, PnL, спреды и сделки пар")
+    p.add_argument("--simulation", help="CSV с результатами симуляции (pair, trades, total_pnl, ...)")
+    p.add_argument("--permutation", help="CSV пермутационного теста (столбец delta) или таблица всех пар .npz")
+    p.add_argument("--robustness", help="CSV интервалов бутстрапа")
+    p.add_argument("--data-dir", default=DATA_DIR)
+    p.add_argument("--save-dir", default=os.path.join(BASE_DIR, "report_data_coin_method"))
+    p.add_argument("--output", default=os.path.join(BASE_DIR, "reports", "run_report.html"))
+    p.add_argument("--max-pairs", type=int, default=300, help="сколько пар (по убыванию PnL) получают график")
+    p.add_argument("--timeframe", choices=TIMEFRAME_CHOICES, default="h1")
+    p.set_defaults(func=cmd_report)
+
+    p = subparsers.add_parser("resample", help="построить/обновить кэш старших таймфреймов из часовых баров")
+    p.add_argument("timeframes", nargs="+", choices=TIMEFRAME_CHOICES[1:])
+    p.add_argument("--data-dir", default=DATA_DIR)
+    p.set_defaults(func=cmd_resample)
+
+    p = subparsers.add_parser("results", help="запросы к базе результатов прогонов (results.db)")
+    p.add_argument("--db", default=os.path.join(BASE_DIR, "results.db"))
+    p.add_argument("--stage", default="coint", help="coint, permutation, simulation")
+    p.add_argument("--metric", default="p-value")
+    p.add_argument("--pair", nargs=2, metavar=("ASSET_A", "ASSET_B"), help="история метрики пары по прогонам")
+    p.add_argument("--since", help="ISO-дата: лучшие пары по прогонам начиная с даты")
+    p.add_argument("--limit", type=int, default=20)
+    p.add_argument("--ascending", action="store_true", help="сортировать по возрастанию (например, p-value)")
+    p.set_defaults(func=cmd_results)
+
+    p = subparsers.add_parser("shard-plan", help="разбить пространство пар этапа на шарды в очереди-директории")
+    p.add_argument("stage", choices=["coint", "permutation", "simulation"])
+    p.add_argument("--shards", type=int, default=16)
+    p.add_argument("--queue-dir", default=os.path.join(BASE_DIR, "shards"))
+    p.add_argument("--data-dir", default=DATA_DIR)
+    p.add_argument("--pairs-csv", default=os.path.join(BASE_DIR, "cointegrated_pairs.csv"),
+                   help="входные пары для permutation/simulation")
+    p.add_argument("--min-data-points", type=int, default=100)
+    p.add_argument("--pvalue-threshold", type=float, default=0.05)
+    p.add_argument("--r2-threshold", type=float, default=0.1)
+    p.add_argument("--lag", type=int, default=3)
+    p.add_argument("--max-workers", type=int, help="по умолчанию — по числу ядер (utils.executor)")
+    p.add_argument("--timeframe", choices=TIMEFRAME_CHOICES, default="h1")
+    p.set_defaults(func=cmd_shard_plan)
+
+    p = subparsers.add_parser("shard-worker", help="обрабатывать шарды из очереди (на этом или другом узле)")
+    p.add_argument("--queue-dir", default=os.path.join(BASE_DIR, "shards"))
+    p.add_argument("--worker-id", help="имя воркера (по умолчанию host-pid)")
+    p.add_argument("--max-workers", type=int, help="потоков внутри воркера (по умолчанию из плана)")
+    p.add_argument("--max-shards", type=int, help="остановиться после N шардов")
+    p.add_argument("--local-workers", type=int, default=1, help="запустить N локальных процессов-воркеров")
+    p.add_argument("--requeue-after", type=float, default=0,
+                   help="вернуть в очередь шарды без heartbeat воркера дольше N секунд "
+                        "(в несколько раз больше --heartbeat)")
+    p.add_argument("--heartbeat", type=float, default=30,
+                   help="как часто воркер отмечает взятый шард, секунд")
+    p.set_defaults(func=cmd_shard_worker)
+
+    p = subparsers.add_parser("shard-merge", help="объединить частичные результаты шардов")
+    p.add_argument("--queue-dir", default=os.path.join(BASE_DIR, "shards"))
+    p.add_argument("--output", required=True)
+    p.add_argument("--allow-partial", action="store_true", help="объединить, даже если не все шарды готовы")
+    p.set_defaults(func=cmd_shard_merge)
+
+    p = subparsers.add_parser("run", help="полный пайплайн: по расписанию или немедленно")
+    p.add_argument("--now", action="store_true", help="запустить пайплайн сразу, без планировщика")
+    p.set_defaults(func=cmd_run)
+
+    return parser
+
+
+def main(argv=None):
+    start = time.perf_counter()
+    args = build_parser().parse_args(argv)
+    startup_time = time.perf_counter() - start
+
+    args.func(args)
+
+    if args.profile_import:
+        print_import_profile(startup_time)
+
+
+if __name__ == "__main__":
+    main()
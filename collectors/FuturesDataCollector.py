@@ -2,9 +2,10 @@ import os
 import pandas as pd
 import datetime as dt
 import pytz
-from tqdm import tqdm
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from pybit.unified_trading import HTTP
+from collectors.KlineArchiveImporter import OUTPUT_HEADER
+from processors.TimeframeResampler import timeframe_suffix
+from utils.executor import StageExecutor
 
 class FuturesDataCollector:
     """
@@ -19,6 +20,7 @@ class FuturesDataCollector:
         self.save_dir = save_dir
         self.testnet = testnet
         self.interval = interval
+        self.timeframe = timeframe_suffix(interval)
         self.limit = limit
         self.session = HTTP(api_key=self.api_key, api_secret=self.api_secret, testnet=self.testnet)
         self.tickers = []
@@ -50,6 +52,35 @@ class FuturesDataCollector:
         )
         return df[::-1].apply(pd.to_numeric)
 
+    @staticmethod
+    def merge_into_file(latest, file_path):
+        """
+        Дописывает свежие бары в файл монеты, не теряя историю (в том числе импортированную
+        KlineArchiveImporter): повторы убираются по timestamp в мс, при совпадении остаётся свежий бар
+        (последний бар прошлого запуска мог быть ещё не закрыт). Запись — во временный файл
+        с атомарной заменой. Возвращает число новых баров.
+        """
+        combined = latest
+        n_existing = 0
+        if os.path.exists(file_path):
+            existing = pd.read_csv(file_path, header=0, names=['time'] + OUTPUT_HEADER[1:], index_col='time')
+            existing = existing.dropna(subset=['timestamp', 'close'])
+            existing['timestamp'] = existing['timestamp'].astype('int64')
+            n_existing = len(existing)
+            combined = pd.concat([existing, latest])
+        combined = combined[~combined['timestamp'].duplicated(keep='last')].sort_values('timestamp', kind='stable')
+        combined.index.name = OUTPUT_HEADER[0]
+
+        tmp_path = f"{file_path}.{os.getpid()}.tmp"
+        try:
+            combined.to_csv(tmp_path)
+            os.replace(tmp_path, file_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return len(combined) - n_existing
+
     def collect_data_for_symbol(self, symbol):
         """
         Скачивает и сохраняет исторические данные по указанному тикеру.
@@ -65,29 +96,26 @@ class FuturesDataCollector:
 
             latest = self.format_data(response)
             if isinstance(latest, pd.DataFrame):
-                file_path = os.path.join(self.save_dir, f"{symbol}_h1.csv")
-                latest.to_csv(file_path)
-                return f"💾 {symbol} — сохранён"
+                file_path = os.path.join(self.save_dir, f"{symbol}_{self.timeframe}.csv")
+                added = self.merge_into_file(latest, file_path)
+                return f"💾 {symbol} — сохранён (+{added} баров)"
             else:
                 return f"⚠️ {symbol} — нет данных"
         except Exception as e:
             return f"❌ {symbol} — ошибка: {e}"
 
-    def collect_all_data(self, max_workers=8):
+    def collect_all_data(self, max_workers=None):
         """
-        Параллельно собирает исторические данные по всем тикерам.
+        Параллельно собирает исторические данные по всем тикерам
+        (сетевые задачи: по умолчанию ядра + 4 потока, см. utils.executor).
         """
         if not self.tickers:
             self.get_usdt_futures_tickers()
 
         print("📊 Начинаем параллельный сбор данных...")
 
-        results = []
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            futures = {executor.submit(self.collect_data_for_symbol, symbol): symbol for symbol in self.tickers}
-            for future in tqdm(as_completed(futures), total=len(futures), desc="Сбор данных"):
-                result = future.result()
-                results.append(result)
+        executor = StageExecutor(kind='io', max_workers=max_workers)
+        results = [result for _, result in executor.map(self.collect_data_for_symbol, self.tickers, desc="Сбор данных")]
 
         # Выводим только ошибки и предупреждения после завершения
         print("\n📋 Результаты:")
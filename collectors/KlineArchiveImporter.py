@@ -0,0 +1,248 @@
+import gzip
+import io
+import os
+import re
+import zipfile
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+from processors.TimeframeResampler import timeframe_suffix
+from utils.executor import StageExecutor, default_workers
+
+PRICE_COLUMNS = ['open', 'high', 'low', 'close', 'volume', 'turnover']
+OUTPUT_HEADER = ['timestamp', 'timestamp'] + PRICE_COLUMNS
+
+# Варианты названий столбцов в дампах бирж → столбцы хранилища
+COLUMN_ALIASES = {
+    'timestamp': ('timestamp', 'open_time', 'opentime', 'start_time', 'starttime', 'start', 'time'),
+    'open': ('open', 'open_price'),
+    'high': ('high', 'high_price'),
+    'low': ('low', 'low_price'),
+    'close': ('close', 'close_price'),
+    'volume': ('volume', 'vol'),
+    'turnover': ('turnover', 'quote_volume', 'quote_asset_volume', 'quotevolume'),
+}
+# Порядок столбцов дампов без заголовка (open_time, open, high, low, close, volume, close_time, quote_volume, ...)
+HEADERLESS_COLUMNS = {0: 'timestamp', 1: 'open', 2: 'high', 3: 'low', 4: 'close', 5: 'volume', 7: 'turnover'}
+
+ARCHIVE_NAME = re.compile(r"^(?P<symbol>[A-Z0-9]+?)[-_]?(?:(?:\d+[mhdHD]|\d+)[-_])?(?P<date>\d{4}-\d{2}(?:-\d{2})?)")
+ARCHIVE_EXTENSIONS = ('.zip', '.csv.gz', '.gz', '.csv')
+
+
+def parse_archive_name(file):
+    """
+    'BTCUSDT-1h-2024-01-01.zip', 'BTCUSDT_2024-01-01.csv.gz', 'BTCUSDT2024-01-01.csv.gz' → ('BTCUSDT', '2024-01-01').
+    """
+    match = ARCHIVE_NAME.match(os.path.basename(file))
+    if not match:
+        return None, None
+    return match.group('symbol'), match.group('date')
+
+
+def _open_text(path):
+    if path.endswith('.zip'):
+        archive = zipfile.ZipFile(path)
+        names = [name for name in archive.namelist() if not name.endswith('/')]
+        return io.TextIOWrapper(archive.open(names[0]), encoding='utf-8')
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, encoding='utf-8')
+
+
+def _to_ms(values):
+    """
+    Метки времени дампа → int64 миллисекунды UTC (секунды, мс, мкс или строки дат).
+    """
+    if values.dtype == object:
+        numeric = pd.to_numeric(values, errors='coerce')
+        if numeric.isna().any():
+            return pd.to_datetime(values, utc=True).astype('int64').to_numpy() // 1_000_000
+        values = numeric
+    ts = values.to_numpy(dtype=np.float64)
+    scale = np.where(ts < 1e11, 1000.0, np.where(ts > 1e14, 1e-3, 1.0))
+    return np.rint(ts * scale).astype(np.int64)
+
+
+def read_archive(path):
+    """
+    Распаковывает и нормализует один архив: DataFrame с int64 timestamp (мс UTC) и OHLCV+turnover,
+    отсортированный по времени, без повторов. Выполняется в процессе-воркере.
+    """
+    with _open_text(path) as f:
+        text = f.read()
+    first = text.split('\n', 1)[0]
+    has_header = not first.split(',')[0].strip().lstrip('-').replace('.', '', 1).isdigit()
+
+    if has_header:
+        raw = pd.read_csv(io.StringIO(text))
+        lower = {column.strip().lower(): column for column in raw.columns}
+        data = {}
+        for target, aliases in COLUMN_ALIASES.items():
+            source = next((lower[a] for a in aliases if a in lower), None)
+            if source is not None:
+                data[target] = raw[source]
+        df = pd.DataFrame(data)
+    else:
+        raw = pd.read_csv(io.StringIO(text), header=None)
+        df = raw[[k for k in HEADERLESS_COLUMNS if k in raw.columns]].rename(columns=HEADERLESS_COLUMNS)
+
+    missing = {'timestamp', 'open', 'high', 'low', 'close', 'volume'} - set(df.columns)
+    if missing:
+        raise ValueError(f"{os.path.basename(path)}: нет столбцов {sorted(missing)}")
+
+    out = pd.DataFrame({'timestamp': _to_ms(df['timestamp'])})
+    for column in PRICE_COLUMNS:
+        if column in df.columns:
+            out[column] = pd.to_numeric(df[column], errors='coerce').to_numpy()
+    if 'turnover' not in out.columns:
+        # В дампе нет оборота в котируемой валюте — приближаем как close * volume
+        out['turnover'] = out['close'] * out['volume']
+    out = out.dropna(subset=['close'])
+    return out.drop_duplicates('timestamp', keep='last').sort_values('timestamp').reset_index(drop=True)
+
+
+class KlineArchiveImporter:
+    """
+    Офлайн-импорт исторических свечей из дневных архивов биржи (zip / csv.gz) в хранилище цен проекта.
+
+    - Архивы распаковываются и разбираются параллельно в процессах (utils.executor.StageExecutor),
+      но одновременно в работе не больше 2 * max_workers архивов (по одному дню на архив).
+    - Результат пишется в формат коллектора ({SYMBOL}_{timeframe}.csv: строковое время МСК,
+      timestamp в мс как int64, OHLCV, turnover).
+    - С существующим файлом выполняется потоковое слияние двух отсортированных потоков
+      (существующий файл читается кусками по chunksize строк): бары с уже сохранённым
+      timestamp не дублируются (приоритет у существующих), файл целиком в память не грузится.
+    - Запись идёт во временный файл с атомарной заменой в конце.
+    """
+
+    def __init__(self, archive_dir, save_dir, interval='60', max_workers=None, chunksize=200_000):
+        self.archive_dir = archive_dir
+        self.save_dir = save_dir
+        self.interval = interval
+        self.timeframe = timeframe_suffix(interval)
+        self.max_workers = max_workers or default_workers('cpu')
+        self.chunksize = chunksize
+        os.makedirs(self.save_dir, exist_ok=True)
+
+    def discover(self):
+        """
+        Архивы по монетам, отсортированные по дате: {symbol: [path, ...]}.
+        """
+        archives = defaultdict(list)
+        for root, _, files in os.walk(self.archive_dir):
+            for file in files:
+                if not file.endswith(ARCHIVE_EXTENSIONS):
+                    continue
+                symbol, date = parse_archive_name(file)
+                if symbol is None:
+                    print(f"⚠️ Не удалось разобрать имя архива: {file}")
+                    continue
+                archives[symbol].append((date, os.path.join(root, file)))
+        return {symbol: [path for _, path in sorted(items)] for symbol, items in sorted(archives.items())}
+
+    def _existing_chunks(self, path):
+        if not os.path.exists(path):
+            return
+        for chunk in pd.read_csv(path, header=0, names=['time'] + OUTPUT_HEADER[1:], chunksize=self.chunksize):
+            chunk = chunk.dropna(subset=['timestamp', 'close'])
+            chunk['timestamp'] = chunk['timestamp'].astype(np.int64)
+            yield chunk[['timestamp'] + PRICE_COLUMNS]
+
+    @staticmethod
+    def _merge_streams(existing, imported):
+        """
+        Слияние двух отсортированных по timestamp потоков кусков с удалением повторов
+        (при совпадении меток остаётся бар из existing). Куски выдаются по возрастанию времени.
+        """
+        streams = [iter(existing), iter(imported)]
+        buffers = [None, None]
+        last_ts = None
+        while True:
+            for k in range(2):
+                while buffers[k] is None or buffers[k].empty:
+                    buffers[k] = next(streams[k], None)
+                    if buffers[k] is None:
+                        break
+            live = [buf for buf in buffers if buf is not None]
+            if not live:
+                return
+            # Граница: всё не позже минимального последнего timestamp живых буферов уже упорядочено
+            boundary = min(int(buf['timestamp'].iloc[-1]) for buf in live)
+            parts = []
+            for k in range(2):
+                if buffers[k] is None:
+                    continue
+                ready = buffers[k]['timestamp'].to_numpy() <= boundary
+                parts.append(buffers[k][ready].assign(_priority=k))
+                buffers[k] = buffers[k][~ready]
+            merged = pd.concat(parts).sort_values(['timestamp', '_priority'], kind='stable')
+            merged = merged.drop_duplicates('timestamp', keep='first')
+            if last_ts is not None:
+                merged = merged[merged['timestamp'] > last_ts]
+            if not merged.empty:
+                last_ts = int(merged['timestamp'].iloc[-1])
+                yield merged.drop(columns='_priority')
+
+    @staticmethod
+    def _write_chunk(df, f, header):
+        out = df.copy()
+        out.insert(0, 'time', pd.to_datetime(out['timestamp'], unit='ms', utc=True)
+                   .dt.tz_convert('Europe/Moscow').dt.strftime('%Y-%m-%d %H:%M:%S'))
+        out.to_csv(f, index=False, header=OUTPUT_HEADER if header else False)
+
+    def import_symbol(self, symbol, paths, executor):
+        """
+        Импортирует архивы одной монеты. Возвращает (число строк в файле, число новых баров).
+        """
+        target = os.path.join(self.save_dir, f"{symbol}_{self.timeframe}.csv")
+        tmp_path = f"{target}.{os.getpid()}.tmp"
+        existing_rows = 0
+        total = 0
+
+        def existing():
+            nonlocal existing_rows
+            for chunk in self._existing_chunks(target):
+                existing_rows += len(chunk)
+                yield chunk
+
+        # Архивы разбираются параллельно, но выдаются по порядку дат — это вход потокового слияния
+        imported = (df for _, df in executor.map(read_archive, paths, ordered=True))
+        try:
+            with open(tmp_path, 'w', newline='') as f:
+                for k, chunk in enumerate(self._merge_streams(existing(), imported)):
+                    self._write_chunk(chunk, f, header=(k == 0))
+                    total += len(chunk)
+            if total:
+                os.replace(tmp_path, target)
+            else:
+                os.remove(tmp_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return total, total - existing_rows
+
+    def run(self):
+        archives = self.discover()
+        n_archives = sum(len(paths) for paths in archives.values())
+        print(f"📦 Найдено {n_archives} архивов по {len(archives)} монетам в {self.archive_dir}")
+
+        summary = []
+        with StageExecutor(backend='process', max_workers=self.max_workers, chunksize=1, errors='raise',
+                           progress=False) as executor:
+            for symbol, paths in tqdm(archives.items(), desc="Импорт архивов"):
+                try:
+                    rows, added = self.import_symbol(symbol, paths, executor)
+                    summary.append({'symbol': symbol, 'archives': len(paths), 'rows': rows, 'added': added})
+                except Exception as e:
+                    print(f"❌ {symbol} — ошибка импорта: {e}")
+                    summary.append({'symbol': symbol, 'archives': len(paths), 'error': str(e)})
+
+        summary = pd.DataFrame(summary)
+        if 'added' in summary.columns:
+            print(f"🎯 Импорт завершён: добавлено {int(summary['added'].fillna(0).sum())} баров "
+                  f"в {self.save_dir}")
+        return summary
@@ -0,0 +1,163 @@
+import os
+import warnings
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+from processors.AlignedPanel import AlignedPanel
+from processors.TimeframeResampler import resolve_timeframe_dir
+from utils.symbols import split_pair, strip_timeframe
+
+
+def mean_reversion_metrics(a, b, variance_horizons=(2, 4, 8, 16, 24), hurst_lags=(2, 4, 8, 16, 32, 64)):
+    """
+    Метрики возврата к среднему для пачки пар сразу.
+
+    a, b — массивы [пары × бары] на общей оси времени (NaN там, где бара нет).
+    Спред — остаток регрессии a = alpha + beta * b по общим барам пары.
+    Разности берутся только между соседними валидными барами пары.
+
+    Возвращает словарь массивов по парам:
+    - half_life: период полураспада по AR(1) Δs_t = c + phi * s_{t-1}: -ln2 / ln(1 + phi), в барах;
+    - hurst: показатель Хёрста по наклону log std(s_{t+τ} - s_t) от log τ;
+    - vr_{q}: отношение дисперсий Var(s_t - s_{t-q}) / (q * Var(Δs_t)), < 1 — возврат к среднему;
+    - zero_crossing_rate: доля баров, на которых спред пересекает своё среднее.
+    """
+    valid = ~np.isnan(a) & ~np.isnan(b)
+    n = valid.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_a = np.where(valid, a, 0).sum(axis=1) / n
+        mean_b = np.where(valid, b, 0).sum(axis=1) / n
+        da = np.where(valid, a - mean_a[:, None], 0)
+        db = np.where(valid, b - mean_b[:, None], 0)
+        beta = (da * db).sum(axis=1) / (db * db).sum(axis=1)
+        spread = np.where(valid, da - beta[:, None] * db, np.nan)
+
+    metrics = {'n_bars': n}
+    with np.errstate(divide='ignore', invalid='ignore'), warnings.catch_warnings():
+        # nanmean/nanvar предупреждают о парах без данных — для них метрики и так NaN
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        # AR(1) на спреде
+        ds = spread[:, 1:] - spread[:, :-1]
+        lagged = np.where(np.isnan(ds), np.nan, spread[:, :-1])
+        phi = (np.nanmean((lagged - np.nanmean(lagged, axis=1, keepdims=True))
+                          * (ds - np.nanmean(ds, axis=1, keepdims=True)), axis=1)
+               / np.nanvar(lagged, axis=1))
+        metrics['half_life'] = np.where(phi < 0, -np.log(2) / np.log(np.clip(1 + phi, 1e-12, None)), np.inf)
+
+        # Дисперсии разностей на всех нужных горизонтах считаются один раз
+        lag_var = {1: np.nanvar(ds, axis=1)}
+        for q in sorted(set(variance_horizons) | set(hurst_lags)):
+            if q not in lag_var:
+                lag_var[q] = np.nanvar(spread[:, q:] - spread[:, :-q], axis=1)
+
+        log_tau = np.log(np.asarray(hurst_lags, dtype=np.float64))
+        log_sd = 0.5 * np.log(np.column_stack([lag_var[q] for q in hurst_lags]))
+        centered_tau = log_tau - log_tau.mean()
+        metrics['hurst'] = ((log_sd - log_sd.mean(axis=1, keepdims=True)) * centered_tau).sum(axis=1) \
+            / (centered_tau ** 2).sum()
+
+        for q in variance_horizons:
+            metrics[f'vr_{q}'] = lag_var[q] / (q * lag_var[1])
+
+        sign = np.sign(spread - np.nanmean(spread, axis=1, keepdims=True))
+        transitions = ~np.isnan(ds)
+        crossings = (sign[:, 1:] * sign[:, :-1] < 0) & transitions
+        metrics['zero_crossing_rate'] = crossings.sum(axis=1) / transitions.sum(axis=1)
+    return metrics
+
+
+class MeanReversionEvaluator:
+    """
+    Этап между анализатором коинтеграции и симуляцией: насколько быстро спред пары
+    возвращается к среднему (на часовых барах это решает, торгуема ли пара).
+
+    Метрики считаются пачками пар как операции над массивами выровненной панели
+    (см. mean_reversion_metrics), добавляются к входным парам как столбцы для ранжирования,
+    а медленно возвращающиеся пары отсеиваются до пермутационного теста и симуляции:
+    - half_life больше max_half_life баров;
+    - hurst больше max_hurst (если задан; 0.5 — случайное блуждание);
+    - zero_crossing_rate меньше min_zero_crossing_rate (если задан).
+    """
+
+    def __init__(self, data_dir, timeframe='h1', max_half_life=72, max_hurst=None, min_zero_crossing_rate=None,
+                 variance_horizons=(2, 4, 8, 16, 24), hurst_lags=(2, 4, 8, 16, 32, 64), batch_size=512):
+        self.data_dir = data_dir
+        self.timeframe = timeframe
+        self.max_half_life = max_half_life
+        self.max_hurst = max_hurst
+        self.min_zero_crossing_rate = min_zero_crossing_rate
+        self.variance_horizons = tuple(variance_horizons)
+        self.hurst_lags = tuple(hurst_lags)
+        self.batch_size = batch_size
+        self.panel = None
+        self.metrics = pd.DataFrame()
+        self.results = pd.DataFrame()
+
+    def load_panel(self):
+        self.panel = AlignedPanel.from_dir(resolve_timeframe_dir(self.data_dir, self.timeframe),
+                                           strip_suffix=f'_{self.timeframe}')
+
+    @staticmethod
+    def _pair_assets(pairs_df):
+        if 'asset_a' in pairs_df.columns and 'asset_b' in pairs_df.columns:
+            return [(strip_timeframe(a), strip_timeframe(b)) for a, b in zip(pairs_df['asset_a'], pairs_df['asset_b'])]
+        return [split_pair(p) for p in pairs_df['pair']]
+
+    def compute(self, pairs_df):
+        """
+        Метрики для всех пар pairs_df (столбец 'pair' вида 'A_h1/B_h1' или asset_a/asset_b).
+        Возвращает pairs_df с добавленными столбцами метрик, отсортированный по half_life.
+        """
+        if self.panel is None:
+            self.load_panel()
+
+        assets = self._pair_assets(pairs_df)
+        known = np.array([a in self.panel and b in self.panel for a, b in assets], dtype=bool)
+        ia = np.array([self.panel.index[a] if ok else 0 for (a, _), ok in zip(assets, known)], dtype=np.int64)
+        ib = np.array([self.panel.index[b] if ok else 0 for (_, b), ok in zip(assets, known)], dtype=np.int64)
+
+        columns = ['n_bars', 'half_life', 'hurst'] + [f'vr_{q}' for q in self.variance_horizons] \
+            + ['zero_crossing_rate']
+        out = {name: np.full(len(assets), np.nan) for name in columns}
+        rows = np.flatnonzero(known)
+        for start in tqdm(range(0, len(rows), self.batch_size), desc="Метрики возврата к среднему"):
+            batch = rows[start:start + self.batch_size]
+            metrics = mean_reversion_metrics(self.panel.values[ia[batch]], self.panel.values[ib[batch]],
+                                             self.variance_horizons, self.hurst_lags)
+            for name in columns:
+                out[name][batch] = metrics[name]
+
+        df = pairs_df.reset_index(drop=True).copy()
+        for name in columns:
+            df[name] = out[name]
+        self.metrics = df.sort_values('half_life', kind='stable').reset_index(drop=True)
+        return self.metrics
+
+    def filter(self, df):
+        keep = df['half_life'] <= self.max_half_life
+        if self.max_hurst is not None:
+            keep &= df['hurst'] <= self.max_hurst
+        if self.min_zero_crossing_rate is not None:
+            keep &= df['zero_crossing_rate'] >= self.min_zero_crossing_rate
+        return df[keep].reset_index(drop=True)
+
+    def run(self, pairs_df):
+        metrics = self.compute(pairs_df)
+        self.results = self.filter(metrics)
+        print(f"⏳ Возврат к среднему: {len(self.results)} из {len(metrics)} пар с half-life "
+              f"≤ {self.max_half_life} баров")
+        return self.results
+
+    def save_results(self, filepath="mean_reversion_pairs.csv", all_pairs=False):
+        df = self.metrics if all_pairs else self.results
+        if df.empty:
+            print("⚠️ Нет результатов для сохранения.")
+            return
+        df.to_csv(filepath, index=False)
+        print(f"💾 Метрики возврата к среднему сохранены в {filepath}")
+
+
+if __name__ == "__main__":
+    evaluator = MeanReversionEvaluator(data_dir="futures_data", max_half_life=72)
+    evaluator.run(pd.read_csv(os.path.join(os.path.dirname(__file__), "..", "cointegrated_pairs.csv")))
+    evaluator.save_results("mean_reversion_pairs.csv")
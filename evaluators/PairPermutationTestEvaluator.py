@@ -1,33 +1,104 @@
+import hashlib
 import os
 import pandas as pd
 import numpy as np
-from tqdm import tqdm
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.metrics import r2_score
 from sklearn.utils import shuffle
-from concurrent.futures import ThreadPoolExecutor, as_completed
 import matplotlib.pyplot as plt
+from evaluators.PermutationResults import PermutationResults
+from processors.AlignedPanel import AlignedPanel
+from processors.TimeframeResampler import resolve_timeframe_dir
+from utils.checkpoint import PairCheckpoint, params_fingerprint
+from utils.executor import StageExecutor, default_workers
+from utils.symbols import SymbolDictionary, pair_name_columns, strip_timeframe
 
 class PairPermutationTestEvaluator:
     """
     Этот оценщик прогоняет полученный датасет (От просчета коинтеграции)
     и проводит просчет Пермутационного теста
     В качесве дополнотильного этапа отбора самых значимых пар.
+
+    Результаты всех оценённых пар (а не только прошедших r2_threshold) сохраняются
+    в компактную таблицу table_path (evaluators.PermutationResults), поэтому
+    filter_top_percent и plot_delta_distribution работают и в отдельном процессе.
     """
 
     def __init__(self, pairs_csv, data_dir, output_csv='significant_pairs.csv',
-                 r2_threshold=0.1, lag=1, max_workers=8):
+                 r2_threshold=0.1, lag=1, max_workers=None, min_data_points=100, timeframe='h1', lead_lag=None,
+                 backend='auto', table_path=None):
         self.pairs_csv = pairs_csv
         self.data_dir = data_dir
+        self.timeframe = timeframe
+        self._timeframe_dir = None
         self.output_csv = output_csv
+        self.table_path = table_path or f"{os.path.splitext(output_csv)[0]}_all.npz"
         self.r2_threshold = r2_threshold
         self.lag = lag
-        self.max_workers = max_workers
+        # Случайный лес на паре — вычисления: по умолчанию по числу ядер (utils.executor)
+        self.max_workers = max_workers or default_workers('cpu')
+        self.backend = backend
+        self.min_data_points = min_data_points
         self.pairs_df = None
-        self.results = []
+        self.panel = None
+        self.symbols = None
+        # Прошедшие r2_threshold (DataFrame с именами монет) и таблица всех оценённых пар (PermutationResults)
+        self.results = pd.DataFrame()
+        self.table = None
+        # Лаг и направление по парам из LeadLagAnalyzer; для пар без оценки используется lag и a → b
+        self.lead_lag = {}
+        if lead_lag is not None:
+            self.set_lead_lag(lead_lag)
+
+    def set_lead_lag(self, lead_lag_df):
+        """
+        Принимает результаты LeadLagAnalyzer (pair, leader, lag): пара ищется в любом порядке монет.
+        Монеты хранятся без суффикса таймфрейма. Строки с significant=False отбрасываются —
+        для таких пар остаётся фиксированный lag.
+        """
+        self.lead_lag = {}
+        if 'significant' in lead_lag_df.columns:
+            lead_lag_df = lead_lag_df[lead_lag_df['significant'].astype(bool)]
+        a, b = pair_name_columns(lead_lag_df)
+        leaders = lead_lag_df['leader'].astype(str).map(strip_timeframe)
+        for a, b, leader, lag in zip(a, b, leaders, lead_lag_df['lag']):
+            self.lead_lag[(a, b)] = self.lead_lag[(b, a)] = (leader, int(lag))
+
+    def pair_lag(self, asset_a, asset_b):
+        """
+        (ведущая монета, ведомая монета, лаг) для пары.
+        """
+        leader, lag = self.lead_lag.get((strip_timeframe(asset_a), strip_timeframe(asset_b)), (None, self.lag))
+        if leader is None or leader == strip_timeframe(asset_a):
+            return asset_a, asset_b, lag
+        return asset_b, asset_a, lag
+
+    def pair_lags(self, pairs):
+        """
+        Ведущая монета, ведомая и лаг для PairSet: три массива (идентификаторы словаря и лаги).
+        """
+        ids = {}
+        for (a, b), (leader, lag) in self.lead_lag.items():
+            ids[(self.symbols.id(a), self.symbols.id(b))] = (self.symbols.id(leader), lag)
+        leader, follower = pairs.a.copy(), pairs.b.copy()
+        lags = np.full(len(pairs), self.lag, dtype=np.int16)
+        for k, pair in enumerate(pairs):
+            hit = ids.get(pair)
+            if hit is None:
+                continue
+            lags[k] = hit[1]
+            if hit[0] == pair[1]:
+                leader[k], follower[k] = pair[1], pair[0]
+        return leader, follower, lags
+
+    def timeframe_dir(self):
+        """Директория с CSV выбранного таймфрейма (кэш старших таймфреймов обновляется один раз)."""
+        if self._timeframe_dir is None:
+            self._timeframe_dir = resolve_timeframe_dir(self.data_dir, self.timeframe)
+        return self._timeframe_dir
 
     def load_asset_data(self, asset_name):
-        path = os.path.join(self.data_dir, f"{asset_name}.csv")
+        path = os.path.join(self.timeframe_dir(), f"{asset_name}.csv")
         if not os.path.exists(path):
             print(f"⚠️ Файл не найден: {path}")
             return None
@@ -35,18 +106,35 @@ class PairPermutationTestEvaluator:
         df = df[['timestamp', 'close']].rename(columns={'close': asset_name})
         return df.set_index('timestamp')
 
-    def evaluate_pair(self, asset_a, asset_b):
+    def load_pair_data(self, asset_a, asset_b):
+        """
+        Общие бары пары: из выровненной панели, если она загружена, иначе из CSV-файлов.
+        """
+        if self.panel is not None:
+            if asset_a not in self.panel or asset_b not in self.panel:
+                print(f"⚠️ Нет данных для пары: {asset_a}/{asset_b}")
+                return None
+            ts, values_a, values_b = self.panel.pair_view(asset_a, asset_b)
+            return pd.DataFrame({asset_a: values_a, asset_b: values_b},
+                                index=pd.DatetimeIndex(ts, name='timestamp'))
+
         df_a = self.load_asset_data(asset_a)
         df_b = self.load_asset_data(asset_b)
         if df_a is None or df_b is None:
             return None
+        return df_a.join(df_b, how='inner').sort_index()
 
-        df = df_a.join(df_b, how='inner').sort_index()
-        df[f'{asset_a}_lag'] = df[asset_a].shift(self.lag)
+    def evaluate_pair(self, asset_a, asset_b):
+        df = self.load_pair_data(asset_a, asset_b)
+        if df is None:
+            return None
+
+        leader, follower, lag = self.pair_lag(asset_a, asset_b)
+        df[f'{leader}_lag'] = df[leader].shift(lag)
         df = df.dropna()
 
-        X = df[[f'{asset_a}_lag']]
-        y = df[asset_b]
+        X = df[[f'{leader}_lag']]
+        y = df[follower]
 
         model = RandomForestRegressor(n_estimators=100, random_state=42)
         model.fit(X, y)
@@ -62,13 +150,52 @@ class PairPermutationTestEvaluator:
         return {
             'asset_a': asset_a,
             'asset_b': asset_b,
+            'leader': leader,
+            'lag': lag,
             'r2_real': r2_real,
             'r2_shuffled': r2_shuffled,
             'delta': delta
         }
 
+    def evaluate_rows(self, task):
+        """
+        (r2_real, r2_shuffled) для задачи (позиция, строка ведущей, строка ведомой, лаг) панели —
+        тот же тест, что evaluate_pair, но по индексам строк без DataFrame и имён.
+        """
+        _, leader, follower, lag = task
+        idx = np.flatnonzero(self.panel.mask[leader] & self.panel.mask[follower])
+        x, y = self.panel.values[leader, idx], self.panel.values[follower, idx]
+        if lag >= 0:
+            X, y = x[:len(x) - lag, None], y[lag:]
+        else:
+            X, y = x[-lag:, None], y[:len(y) + lag]
+
+        model = RandomForestRegressor(n_estimators=100, random_state=42)
+        model.fit(X, y)
+        r2_real = r2_score(y, model.predict(X))
+
+        X_shuffled = shuffle(X, random_state=42)
+        model.fit(X_shuffled, y)
+        r2_shuffled = r2_score(y, model.predict(X_shuffled))
+        return r2_real, r2_shuffled
+
+    def load_table(self, path=None):
+        """
+        Загружает сохранённую таблицу всех пар; self.results — прошедшие r2_threshold, как после прогона.
+        """
+        path = path or self.table_path
+        if not os.path.exists(path):
+            print(f"⚠️ Таблица результатов не найдена: {path}")
+            return None
+        self.table = PermutationResults.load(path)
+        self.results = self.table.above(self.r2_threshold)
+        print(f"📂 Загружено {len(self.table)} пар из {path}, прошли порог {self.r2_threshold}: {len(self.results)}")
+        return self.table
+
     def filter_top_percent(self, top_percent=0.01):
-        if not self.results:
+        if self.results.empty and self.table is None:
+            self.load_table()
+        if self.results.empty:
             print("⚠️ Нет результатов для фильтрации.")
             return
 
@@ -80,10 +207,19 @@ class PairPermutationTestEvaluator:
         filename = os.path.basename(self.output_csv)
         df_top.to_csv(f'top_{int(top_percent * 100)}pct_{filename}', index=False)
         print(f"🔎 Сохранено {top_n} самых значимых пар в файл: top_{int(top_percent * 100)}pct_{self.output_csv}")
+        return df_top
 
 
     def plot_delta_distribution(self, bins=50):
-        if not self.results:
+        # Гистограмма по всем оценённым парам из таблицы (в том числе из прошлого процесса)
+        if self.table is None and os.path.exists(self.table_path):
+            self.load_table()
+        if self.table is not None:
+            self.table.plot_delta_distribution("delta_distribution.png", bins=bins, r2_threshold=self.r2_threshold,
+                                               show=True)
+            return
+
+        if self.results.empty:
             print("⚠️ Нет результатов для визуализации.")
             return
 
@@ -103,38 +239,93 @@ class PairPermutationTestEvaluator:
         plt.show()
         print("📊 График сохранён как: delta_distribution.png")
 
-    def run_async_evaluation(self):
-        self.pairs_df = pd.read_csv(self.pairs_csv)
-        futures = {}
+    def run_async_evaluation(self, pairs_df=None, checkpoint_path=None, resume=False):
+        # Пары можно передать напрямую (например, результаты анализатора из того же прогона)
+        self.pairs_df = pd.read_csv(self.pairs_csv) if pairs_df is None else pairs_df
+        self.results = pd.DataFrame()
+        self.table = None
+        # Все монеты читаются один раз в выровненную панель вместо двух CSV на каждую пару;
+        # пары разбираются один раз в int32-идентификаторы строк панели (utils.symbols)
+        self.panel = AlignedPanel.from_dir(self.timeframe_dir())
+        self.symbols = SymbolDictionary.from_panel(self.panel)
+        pairs = self.symbols.encode_pairs(self.pairs_df)
+        leader, follower, lags = self.pair_lags(pairs)
+        r2_real = np.full(len(pairs), np.nan)
+        r2_shuffled = np.full(len(pairs), np.nan)
+        done = np.zeros(len(pairs), dtype=bool)
+
+        known = pairs.known
+        if not known.all():
+            print(f"⚠️ Нет данных для {int((~known).sum())} пар — пропущены")
+        eligible = known.copy()
+        eligible[known] = self.panel.overlap_counts[pairs.a[known], pairs.b[known]] >= self.min_data_points + lags[known]
 
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            for _, row in self.pairs_df.iterrows():
-                pair_str = row['pair']
-                try:
-                    asset_a, asset_b = pair_str.split('/')
-                    future = executor.submit(self.evaluate_pair, asset_a, asset_b)
-                    futures[future] = pair_str
-                except Exception as e:
-                    print(f"⚠️ Ошибка в паре {pair_str}: {e}")
+        # Контрольная точка: результат каждой пары (до фильтра по r2_threshold) дописывается в файл,
+        # при resume=True пары из неё не пересчитываются, если данные и список пар не изменились
+        checkpoint = None
+        labels = pairs.labels()
+        if checkpoint_path:
+            # Список пар — по int32-идентификаторам строк панели (вход может быть и без столбца 'pair')
+            pair_ids = hashlib.sha1(np.stack([pairs.a, pairs.b]).tobytes()).hexdigest()
+            fingerprint = params_fingerprint('permutation', self.panel.fingerprint(), pair_ids,
+                                             self.lag, sorted(self.lead_lag.items()), self.min_data_points)
+            checkpoint = PairCheckpoint(checkpoint_path, fingerprint, resume=resume)
+
+        try:
+            tasks = []
+            for k in np.flatnonzero(eligible):
+                if checkpoint is not None and labels[k] in checkpoint:
+                    result = checkpoint.get(labels[k])
+                    if result:
+                        r2_real[k], r2_shuffled[k], done[k] = result['r2_real'], result['r2_shuffled'], True
+                    continue
+                tasks.append((int(k), int(leader[k]), int(follower[k]), int(lags[k])))
 
             print("Выполняем Пермутационный тест")
-            print("▶️ Обработка пар...")
-            for future in tqdm(as_completed(futures), total=len(futures)):
-                pair_str = futures[future]
-                try:
-                    result = future.result()
-                    if result and result['delta'] > self.r2_threshold:
-                        self.results.append(result)
-                except Exception as e:
-                    print(f"⚠️ Ошибка при обработке {pair_str}: {e}")
+            if checkpoint is not None and checkpoint.completed:
+                print(f"⏭ Пропущено уже посчитанных пар: {len(checkpoint.completed)}")
+            # Ошибки отдельных пар не останавливают этап — сводка печатается в конце
+            # Случайный лес sklearn строит деревья без GIL, а панель дорого копировать в процессы — по умолчанию потоки
+            backend = 'thread' if self.backend == 'auto' else self.backend
+            executor = StageExecutor(backend=backend, max_workers=self.max_workers)
+            for task, (real, shuffled) in executor.map(self.evaluate_rows, tasks, desc="▶️ Обработка пар"):
+                k = task[0]
+                r2_real[k], r2_shuffled[k], done[k] = real, shuffled, True
+                if checkpoint is not None:
+                    checkpoint.add(labels[k], self._record(pairs, leader, lags, r2_real, r2_shuffled, k))
+        finally:
+            if checkpoint is not None:
+                checkpoint.close()
+
+        # Результаты хранятся столбцами; строки с именами монет — только в self.results и файлах
+        self.table = PermutationResults(self.symbols.names, pairs.a[done], pairs.b[done], leader[done], lags[done],
+                                        r2_real[done], r2_shuffled[done])
+        self.results = self.table.above(self.r2_threshold)
+
+    def _record(self, pairs, leader, lags, r2_real, r2_shuffled, k):
+        """
+        Строка результата пары k в формате CSV оценщика (для контрольной точки).
+        """
+        names = self.symbols.names
+        return {
+            'asset_a': names[pairs.a[k]],
+            'asset_b': names[pairs.b[k]],
+            'leader': names[leader[k]],
+            'lag': int(lags[k]),
+            'r2_real': float(r2_real[k]),
+            'r2_shuffled': float(r2_shuffled[k]),
+            'delta': float(r2_real[k] - r2_shuffled[k])
+        }
 
     def save_results(self):
         df = pd.DataFrame(self.results)
         df.to_csv(self.output_csv, index=False)
         print(f"✅ Результаты сохранены в: {self.output_csv}")
+        if self.table is not None:
+            self.table.save(self.table_path)
 
-    def run(self):
-        self.run_async_evaluation()
+    def run(self, pairs_df=None, checkpoint_path=None, resume=False):
+        self.run_async_evaluation(pairs_df, checkpoint_path=checkpoint_path, resume=resume)
         self.save_results()
 
 
@@ -145,7 +336,6 @@ if __name__ == "__main__":
         output_csv='significant_pairs.csv',
         r2_threshold=0.1,
         lag=3,
-        max_workers=10
     )
     evaluator.run()
     # Важный момент, благодаря этому этапу мы отсеем 99 процентов сигналов, и оставим 1 процент самых хначимых
@@ -156,7 +346,6 @@ if __name__ == "__main__":
     график распределения delta = R²_real - R²_shuffled даст наглядное понимание, как много пар действительно значимы,
      и где находится порог 1%.
     '''
-    # Для получения отрисовки надо запустить код повторно , пайплайн длинный ( 30минут на выполнение по 10 потокам)
-    # а эту фичу допилил после выполнения, в теории может быть баг,
-    # логика зашита на .self (отдельно от выполнения основной логики не запустишь)
+    # Все оценённые пары лежат в significant_pairs_all.npz: график и отбор строятся из таблицы
+    # и без повторного прогона (python cli.py perm-results --plot)
     evaluator.plot_delta_distribution()
\ No newline at end of file
@@ -0,0 +1,130 @@
+import os
+import numpy as np
+import pandas as pd
+
+TABLE_VERSION = 1
+
+
+class PermutationResults:
+    """
+    Компактная таблица результатов пермутационного теста по всем оценённым парам.
+
+    Хранится столбцами (struct-of-arrays) в сжатом .npz: словарь монет и int32-индексы
+    asset_a / asset_b / leader вместо строк, лаг int16 и r2_real / r2_shuffled в float64
+    (delta — их разность). В таблицу попадают все пары, а не только прошедшие r2_threshold,
+    поэтому отбор top-процента, подбор порога и гистограмма delta делаются из файла
+    за доли секунды, без повторного 30-минутного прогона оценщика.
+    """
+
+    def __init__(self, symbols, asset_a, asset_b, leader, lag, r2_real, r2_shuffled):
+        self.symbols = np.asarray(symbols, dtype=str)
+        self.asset_a = np.asarray(asset_a, dtype=np.int32)
+        self.asset_b = np.asarray(asset_b, dtype=np.int32)
+        self.leader = np.asarray(leader, dtype=np.int32)
+        self.lag = np.asarray(lag, dtype=np.int16)
+        self.r2_real = np.asarray(r2_real, dtype=np.float64)
+        self.r2_shuffled = np.asarray(r2_shuffled, dtype=np.float64)
+
+    @property
+    def delta(self):
+        return self.r2_real - self.r2_shuffled
+
+    def __len__(self):
+        return len(self.asset_a)
+
+    @classmethod
+    def from_records(cls, records):
+        """
+        Из списка словарей evaluate_pair (asset_a, asset_b, leader, lag, r2_real, r2_shuffled).
+        """
+        records = [r for r in records if r]
+        names = sorted({r[key] for r in records for key in ('asset_a', 'asset_b')})
+        ids = {name: i for i, name in enumerate(names)}
+        return cls(
+            names,
+            [ids[r['asset_a']] for r in records],
+            [ids[r['asset_b']] for r in records],
+            [ids[r.get('leader', r['asset_a'])] for r in records],
+            [r.get('lag', 0) for r in records],
+            [r['r2_real'] for r in records],
+            [r['r2_shuffled'] for r in records],
+        )
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez_compressed(path, version=np.array(TABLE_VERSION), symbols=self.symbols, asset_a=self.asset_a,
+                            asset_b=self.asset_b, leader=self.leader, lag=self.lag, r2_real=self.r2_real,
+                            r2_shuffled=self.r2_shuffled)
+        print(f"💾 Таблица всех {len(self)} пар пермутационного теста сохранена в {path}")
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            if int(data['version']) != TABLE_VERSION:
+                raise ValueError(f"Неподдерживаемая версия таблицы {path}: {int(data['version'])}")
+            return cls(data['symbols'], data['asset_a'], data['asset_b'], data['leader'], data['lag'],
+                       data['r2_real'], data['r2_shuffled'])
+
+    def to_frame(self, rows=None):
+        """
+        Строки таблицы (все или выбранные индексы) в формате CSV оценщика; имена монет — только здесь.
+        """
+        rows = np.arange(len(self)) if rows is None else np.asarray(rows)
+        return pd.DataFrame({
+            'asset_a': self.symbols[self.asset_a[rows]],
+            'asset_b': self.symbols[self.asset_b[rows]],
+            'leader': self.symbols[self.leader[rows]],
+            'lag': self.lag[rows],
+            'r2_real': self.r2_real[rows],
+            'r2_shuffled': self.r2_shuffled[rows],
+            'delta': self.delta[rows],
+        })
+
+    def above(self, r2_threshold):
+        """
+        Пары с delta > r2_threshold (то, что оценщик оставляет в self.results), по убыванию delta.
+        """
+        delta = self.delta
+        rows = np.flatnonzero(delta > r2_threshold)
+        return self.to_frame(rows[np.argsort(-delta[rows], kind='stable')])
+
+    def top_percent(self, top_percent=0.01, r2_threshold=None):
+        """
+        Самые значимые пары: top_percent от прошедших r2_threshold (если задан), минимум одна.
+        """
+        df = self.above(-np.inf if r2_threshold is None else r2_threshold)
+        return df.head(max(1, int(len(df) * top_percent))) if len(df) else df
+
+    def threshold_table(self, thresholds):
+        """
+        Сколько пар проходит каждый порог delta и какая это доля всех оценённых.
+        """
+        delta = np.sort(self.delta[np.isfinite(self.delta)])
+        passed = len(delta) - np.searchsorted(delta, np.asarray(thresholds, dtype=np.float64), side='right')
+        return pd.DataFrame({'threshold': thresholds, 'pairs': passed,
+                             'share': passed / len(delta) if len(delta) else np.nan})
+
+    def plot_delta_distribution(self, path="delta_distribution.png", bins=50, r2_threshold=None, show=False):
+        import matplotlib.pyplot as plt
+
+        deltas = self.delta[np.isfinite(self.delta)]
+        if not len(deltas):
+            print("⚠️ Нет результатов для визуализации.")
+            return None
+        plt.figure(figsize=(10, 6))
+        plt.hist(deltas, bins=bins, color='skyblue', edgecolor='black')
+        plt.axvline(np.percentile(deltas, 99), color='red', linestyle='--', label='1% порог')
+        if r2_threshold is not None:
+            plt.axvline(r2_threshold, color='gray', linestyle=':', label=f'r2_threshold = {r2_threshold}')
+        plt.title(f"Распределение значимости (delta R²), все {len(deltas)} пар")
+        plt.xlabel("Delta R² (R²_real - R²_shuffled)")
+        plt.ylabel("Количество пар")
+        plt.legend()
+        plt.grid(True)
+        plt.tight_layout()
+        plt.savefig(path)
+        if show:
+            plt.show()
+        plt.close()
+        print(f"📊 График сохранён как: {path}")
+        return path
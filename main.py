@@ -1,7 +1,5 @@
-import schedule
 import time
 import sys
-from pipeline_runner import MainPipelineRunner
 from utils.logger import setup_logger
 
 '''
@@ -10,9 +8,16 @@ from utils.logger import setup_logger
 	    python main.py
 	•	Принудительный запуск вручную:
 		python main.py --now
+	•	Отдельные этапы и ленивый импорт зависимостей:
+		python cli.py --help
 '''
 
 def schedule_weekly():
+    # Тяжёлый пайплайн и планировщик импортируются только при запуске,
+    # чтобы `import main` (например, из cli.py) был мгновенным
+    import schedule
+    from pipeline_runner import MainPipelineRunner
+
     runner = MainPipelineRunner()
     schedule.every().monday.at("09:00").do(runner.run)
     print("🕒 Планировщик активен...")
@@ -27,6 +32,7 @@ if __name__ == "__main__":
 
     if "--now" in sys.argv:
         print("🚨 Принудительный запуск пайплайна")
+        from pipeline_runner import MainPipelineRunner
         runner = MainPipelineRunner()
         runner.run()
     else:
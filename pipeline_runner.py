@@ -4,13 +4,22 @@ from datetime import datetime
 from analyzers.CointegrationAnalyzerAsync import CointegrationAnalyzerAsync
 from collectors.FuturesDataCollector import FuturesDataCollector
 from evaluators.PairPermutationTestEvaluator import PairPermutationTestEvaluator
+from evaluators.MeanReversionEvaluator import MeanReversionEvaluator
+from analyzers.LeadLagAnalyzer import LeadLagAnalyzer
 from simulators.PairTradingSimulatorCoin import PairTradingSimulatorCoin
+from simulators.BootstrapRobustnessTester import BootstrapRobustnessTester
 from utils.telegram_notifier import TelegramNotifier
+from utils.results_store import ResultsStore
+from processors.UniverseFilter import UniverseFilter
+from plotters.HtmlRunReport import build_run_report
 import os
+import pandas as pd
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = os.path.join(BASE_DIR, "futures_data")
 plot_path = os.path.join(BASE_DIR, "delta_distribution.png")
+RESULTS_DB = os.path.join(BASE_DIR, "results.db")
+REPORTS_DIR = os.path.join(BASE_DIR, "reports")
 
 
 class MainPipelineRunner:
@@ -35,20 +44,33 @@ class MainPipelineRunner:
             limit=3600
         )
 
+        # Ликвидная вселенная: пары строятся только из монет с достаточным оборотом, полнотой баров и мелким тиком
+        self.universe = UniverseFilter(data_dir=DATA_DIR)
+
         self.analyzer = CointegrationAnalyzerAsync(
             data_dir=DATA_DIR,
             min_data_points=100,
-            pvalue_threshold=0.05,
-            max_workers=8
+            pvalue_threshold=0.05
+        )
+
+        # Отсев пар с медленным возвратом спреда к среднему до пермутационного теста и симуляции
+        self.mean_reversion = MeanReversionEvaluator(
+            data_dir=DATA_DIR,
+            max_half_life=72
+        )
+
+        # Лучший лаг и направление опережения по каждой паре вместо одного lag для всех
+        self.lead_lag = LeadLagAnalyzer(
+            data_dir=DATA_DIR,
+            max_lag=48
         )
 
         self.evaluator = PairPermutationTestEvaluator(
             pairs_csv='/Users/papaskakun/PycharmProjects/PythonProject/cointegrated_pairs.csv',
-            data_dir='DATA_DIR',
+            data_dir=DATA_DIR,
             output_csv='/Users/papaskakun/PycharmProjects/PythonProject/significant_pairs.csv',
             r2_threshold=0.1,
-            lag=3,
-            max_workers=10
+            lag=3
         )
 
         self.simulator = PairTradingSimulatorCoin(
@@ -56,52 +78,128 @@ class MainPipelineRunner:
             pairs_file=os.path.join(BASE_DIR, "top_1pct_significant_pairs.csv")
         )
 
+        # Устойчивость отобранных пар: доверительные интервалы PnL, win rate и просадки по блочному бутстрапу
+        self.robustness = BootstrapRobustnessTester(
+            data_dir=DATA_DIR,
+            n_resamples=2000
+        )
+
+        # История результатов всех прогонов: пары, этапы и метрики с индексами (SQLite)
+        self.store = ResultsStore(RESULTS_DB)
+        self.stage_timings = {}
+        self._stage_start = None
+
+    def _lap(self, stage):
+        """
+        Запоминает длительность этапа, завершившегося сейчас (с конца предыдущего этапа).
+        """
+        now = time.time()
+        self.stage_timings[stage] = now - self._stage_start
+        self._stage_start = now
+
     def run(self):
         start_time = time.time()
         now = datetime.now()
         self.notifier.send_message(f"🚀 Запуск пайплайна: {now}")
-        logging.info("Pipeline started")
+        run_id = self.store.start_run()
+        logging.info(f"Pipeline started, run_id={run_id}")
+        status = 'ok'
+        self.stage_timings = {}
+        self._stage_start = start_time
 
         try:
             # Запуск сбора информации
             self.collector.collect_all_data()
             logging.info("Data collected.")
             self.notifier.send_message("📡 Сбор данных завершён.")
+            self._lap('collect')
+
+            symbols = self.universe.run()
+            self.universe.save(os.path.join(BASE_DIR, "universe.csv"))
+            self.notifier.send_message(f"🌐 Вселенная: {len(symbols)} из {len(self.universe.metrics)} монет.")
+            self._lap('universe')
 
             # Запуск Анализатора на коинтеграцию с использованием теста Энгла-Грейнджера
+            # Данные перечитываются после сбора и ограничиваются вселенной
+            self.analyzer.set_universe(symbols)
             self.analyzer.run()
+            self._lap('coint')
+            # Дальше идут только пары, коинтегрированные на последних окнах, а не когда-то в истории
+            self.analyzer.run_stability()
+            self.analyzer.save_stability(os.path.join(BASE_DIR, "coint_stability.csv"))
             self.analyzer.save_results("/Users/papaskakun/PycharmProjects/PythonProject/cointegrated_pairs.csv")
+            self.store.write_stage(run_id, 'coint', self.analyzer.results)
+            self._lap('stability')
             logging.info("Cointegration analysis done.")
             self.notifier.send_message("🔍 Анализ завершён.")
 
+            # Скорость возврата спреда к среднему: half-life, Хёрст, variance ratio, пересечения нуля
+            fast_pairs = self.mean_reversion.run(pd.DataFrame(self.analyzer.results, columns=['pair', 'p-value']))
+            self.store.write_stage(run_id, 'mean_reversion', self.mean_reversion.metrics)
+            logging.info("Mean reversion metrics done.")
+            self._lap('mean_reversion')
+
+            self.lead_lag.run(fast_pairs)
+            self.lead_lag.save_results(os.path.join(BASE_DIR, "lead_lag_pairs.csv"))
+            # Лаг заменяется только там, где пик корреляции значим с учётом числа проверенных лагов
+            self.evaluator.set_lead_lag(self.lead_lag.significant())
+            self._lap('lead_lag')
+
             # Запуск отборшика, фильтр на самые значимые пары
-            self.evaluator.run()
+            # Пары передаются напрямую из анализатора, CSV остаётся только выгрузкой
+            self.evaluator.run(pairs_df=fast_pairs)
+            self.store.write_stage(run_id, 'permutation', self.evaluator.results, asset_keys=('asset_a', 'asset_b'))
             # Важный момент, благодаря этому этапу мы отсеем 99 процентов сигналов, и оставим 1 процент самых значимых
-            self.evaluator.filter_top_percent(top_percent=0.01)
+            top_pairs = self.evaluator.filter_top_percent(top_percent=0.01)
             logging.info("Evaluation done.")
             self.notifier.send_message("📊 Оценка завершена.")
+            self._lap('permutation')
 
-            # Этот этап позволяет "отрисовать"
-            '''
-                график распределения delta = R²_real - R²_shuffled даст наглядное понимание, как много пар действительно значимы,
-                 и где находится порог 1%.
-                '''
-            # Для получения отрисовки надо запустить код повторно , пайплайн длинный ( 30минут на выполнение по 10 потокам)
-            # а эту фичу допилил после выполнения, в теории может быть баг,
-            # логика зашита на .self (отдельно от выполнения основной логики не запустишь)
+            # График распределения delta = R²_real - R²_shuffled по всем оценённым парам и порог 1%.
+            # Таблица всех пар сохраняется рядом с CSV, поэтому график и отбор можно перестроить
+            # без повторного прогона: python cli.py perm-results --plot --top-percent 0.01
             self.evaluator.plot_delta_distribution()
             graph_path = "/Users/papaskakun/PycharmProjects/PythonProject/delta_distribution.png"
             self.notifier.send_photo(graph_path, caption="📈 Распределение значимости пар")
 
             # Запуск симуляции
-            self.simulator.run_batch()
+            selected = self.simulator.run_batch(pairs_df=top_pairs)
+            self.store.write_stage(run_id, 'simulation', self.simulator.results)
             logging.info("Simulation complete.")
             self.notifier.send_message("🧪 Симуляция завершена.")
+            self._lap('simulation')
+
+            # Проверка отобранных пар на устойчивость (одна траектория симуляции часто не повторяется)
+            if selected is not None:
+                robust = self.robustness.run(selected)
+                self.robustness.save_results(os.path.join(self.simulator.save_dir, "bootstrap_robustness.csv"))
+                self.store.write_stage(run_id, 'robustness', robust)
+                n_robust = int(robust['robust'].sum()) if 'robust' in robust.columns else 0
+                logging.info("Bootstrap robustness done.")
+                self.notifier.send_message(f"🎲 Бутстрап: устойчиво прибыльных пар {n_robust} из {len(robust)}.")
+                self._lap('robustness')
+
+            # Один HTML-файл на прогон: длительности этапов, delta, PnL и спреды пар со сделками
+            deltas = self.evaluator.table.delta if self.evaluator.table is not None else None
+            report_path = build_run_report(
+                os.path.join(REPORTS_DIR, f"run_{run_id}.html"),
+                simulator=self.simulator,
+                pair_results=self.simulator.results,
+                deltas=deltas,
+                timings=self.stage_timings,
+                robustness=self.robustness.results,
+                title=f"Solomon_bot: прогон {run_id} от {now:%Y-%m-%d %H:%M}"
+            )
+            self.notifier.send_message(f"🧾 HTML-отчёт прогона: {report_path}")
 
         except Exception as e:
+            status = 'failed'
             logging.error(f"Pipeline failed: {e}")
             self.notifier.send_message(f"❌ Ошибка: {e}")
 
+        self.store.finish_run(run_id, status)
         elapsed = time.time() - start_time
         self.notifier.send_message(f"⏱ Выполнение заняло: {elapsed / 60:.2f} минут")
-        logging.info(f"Pipeline finished in {elapsed / 60:.2f} minutes.")
\ No newline at end of file
+        logging.info(f"Pipeline finished in {elapsed / 60:.2f} minutes.")
+        # Уведомления уходят в фоне — дожидаемся отправки очереди, но не дольше минуты
+        self.notifier.flush(timeout=60)
\ No newline at end of file
@@ -1,43 +1,37 @@
 import os
-import pandas as pd
 import matplotlib.pyplot as plt
+from processors.AlignedPanel import AlignedPanel
+from processors.TimeframeResampler import resolve_timeframe_dir
+from utils.symbols import SymbolDictionary
 
 class PairSpreadPlotter:
-    def __init__(self, data_dir="futures_data"):
+    def __init__(self, data_dir="futures_data", timeframe='h1'):
         self.data_dir = data_dir
-        self.data = {}
+        self.timeframe = timeframe
+        self.panel = None
+        self.symbols = None
         self.load_data()
 
     def load_data(self):
-        """Загружает все csv-файлы из директории в память."""
+        """Загружает все csv-файлы из директории в выровненную панель."""
         if not os.path.exists(self.data_dir):
             raise FileNotFoundError(f"❌ Папка {self.data_dir} не найдена.")
 
-        for file in os.listdir(self.data_dir):
-            if file.endswith(".csv"):
-                file_path = os.path.join(self.data_dir, file)
-                df = pd.read_csv(file_path)
-                if 'timestamp' not in df.columns or 'close' not in df.columns:
-                    continue
-                df['timestamp'] = pd.to_datetime(df['timestamp'])
-                name = os.path.splitext(file)[0].replace('_h1', '')  # удаляем _h1 если есть
-                self.data[name] = df[['timestamp', 'close']]
-
-        print(f"✅ Загружено {len(self.data)} монет из папки '{self.data_dir}'.")
+        self.panel = AlignedPanel.from_dir(resolve_timeframe_dir(self.data_dir, self.timeframe),
+                                           strip_suffix=f'_{self.timeframe}')  # удаляем _h1 если есть
+        self.symbols = SymbolDictionary.from_panel(self.panel)
+        print(f"✅ Загружено {len(self.panel)} монет из папки '{self.data_dir}'.")
 
     def plot_pair_spread(self, coin_a, coin_b):
         """Строит график цен двух монет и их Z-score спреда."""
-        # Автоматическая коррекция имен (если вдруг передали 'BTCUSDT_h1')
-        coin_a = coin_a.replace('_h1', '')
-        coin_b = coin_b.replace('_h1', '')
-
-        if coin_a not in self.data or coin_b not in self.data:
+        # Словарь ищет монеты без суффикса таймфрейма (можно передать и 'BTCUSDT_h1')
+        ia, ib = self.symbols.id(coin_a), self.symbols.id(coin_b)
+        if ia < 0 or ib < 0:
             print(f"❗ Монеты {coin_a} или {coin_b} не найдены.")
             return
+        coin_a, coin_b = self.symbols.names[ia], self.symbols.names[ib]
 
-        df1 = self.data[coin_a].set_index('timestamp')
-        df2 = self.data[coin_b].set_index('timestamp')
-        merged = pd.merge(df1, df2, left_index=True, right_index=True, suffixes=('_a', '_b'))
+        merged = self.panel.pair_frame(coin_a, coin_b)
 
         spread = merged['close_a'] - merged['close_b']
         zscore = (spread - spread.mean()) / spread.std()
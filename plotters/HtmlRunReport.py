@@ -0,0 +1,291 @@
+import html
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from utils.symbols import pair_name_columns
+
+
+def lttb(x, y, n_out):
+    """
+    Прореживание ряда Largest-Triangle-Three-Buckets: из n точек оставляет n_out,
+    сохраняя форму графика (пики и провалы), первая и последняя точки сохраняются.
+    Возвращает индексы выбранных точек.
+
+    Векторный вариант: вершины A и C треугольника — средние соседних корзин (для крайних
+    корзин — первая и последняя точки), поэтому корзины не зависят друг от друга. Корзины
+    дополняются до общей ширины в 2-D массив, точка с наибольшей площадью берётся argmax по строкам.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    starts, stops = edges[:-1], edges[1:]
+    widths = stops - starts
+    mean_x = np.add.reduceat(x[:n - 1], starts) / widths
+    mean_y = np.add.reduceat(y[:n - 1], starts) / widths
+    ax, ay = np.r_[x[0], mean_x[:-1]], np.r_[y[0], mean_y[:-1]]
+    cx, cy = np.r_[mean_x[1:], x[-1]], np.r_[mean_y[1:], y[-1]]
+
+    idx = starts[:, None] + np.arange(widths.max())
+    inside = idx < stops[:, None]
+    idx = np.minimum(idx, n - 1)
+    bx, by = x[idx], y[idx]
+    area = np.abs((ax[:, None] - cx[:, None]) * (by - ay[:, None]) - (ax[:, None] - bx) * (cy[:, None] - ay[:, None]))
+    area[~inside | ~np.isfinite(area)] = -1.0
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    selected[1:-1] = starts + area.argmax(axis=1)
+    return selected
+
+
+def _fmt(value, digits=4):
+    if isinstance(value, (float, np.floating)):
+        if not np.isfinite(value):
+            return "—"
+        return f"{value:.{digits}g}"
+    return html.escape(str(value))
+
+
+class HtmlRunReport:
+    """
+    Один самодостаточный HTML-отчёт прогона пайплайна (без внешних скриптов и картинок).
+
+    Графики — встроенный SVG, ряды прореживаются LTTB до max_points точек, поэтому файл
+    открывается мгновенно даже для сотен пар × тысяч баров. Подсказки при наведении —
+    через <title> у элементов SVG, графики пар свёрнуты в <details>.
+
+    Разделы: длительности этапов, распределение delta R², сводка PnL (горизонтальные столбцы,
+    читаемые и при 100+ парах) и спред/z-score каждой пары с отметками сделок.
+    """
+
+    WIDTH = 900
+    PAD = 48
+
+    def __init__(self, title="Solomon_bot: отчёт прогона", max_points=400):
+        self.title = title
+        self.max_points = max_points
+        self.sections = []
+
+    def _line_chart(self, x, series, height=220, markers=(), hlines=()):
+        """
+        series — список (подпись, значения, цвет); x — числовая ось (например, мс).
+        markers — (x, y, цвет, подсказка); hlines — (y, цвет, подпись).
+        """
+        w, h, pad = self.WIDTH, height, self.PAD
+        x = np.asarray(x, dtype=np.float64)
+        values = [np.asarray(v, dtype=np.float64) for _, v, _ in series]
+        finite = np.concatenate([v[np.isfinite(v)] for v in values] + [np.array([y for y, _, _ in hlines])])
+        if not len(x) or not len(finite):
+            return "<p>Нет данных.</p>"
+        x0, x1 = x.min(), x.max() if x.max() > x.min() else x.min() + 1
+        y0, y1 = finite.min(), finite.max() if finite.max() > finite.min() else finite.min() + 1
+
+        def sx(v):
+            return pad + (np.asarray(v) - x0) / (x1 - x0) * (w - 2 * pad)
+
+        def sy(v):
+            return h - pad / 2 - (np.asarray(v) - y0) / (y1 - y0) * (h - pad)
+
+        parts = [f'<svg viewBox="0 0 {w} {h}" class="chart">',
+                 f'<line x1="{pad}" y1="{h - pad / 2}" x2="{w - pad}" y2="{h - pad / 2}" class="axis"/>']
+        for y, color, label in hlines:
+            parts.append(f'<line x1="{pad}" x2="{w - pad}" y1="{sy(y):.1f}" y2="{sy(y):.1f}" stroke="{color}" '
+                         f'stroke-dasharray="4 3"><title>{html.escape(label)}</title></line>')
+        for (label, _, color), v in zip(series, values):
+            keep = np.isfinite(v)
+            xs, ys = x[keep], v[keep]
+            idx = lttb(xs, ys, self.max_points)
+            # Целые координаты viewBox: на экране не отличить от десятых, а файл заметно меньше
+            px, py = np.rint(sx(xs[idx])).astype(np.int64), np.rint(sy(ys[idx])).astype(np.int64)
+            points = " ".join(map("{},{}".format, px.tolist(), py.tolist()))
+            parts.append(f'<polyline points="{points}" fill="none" stroke="{color}" stroke-width="1.2">'
+                         f'<title>{html.escape(label)}</title></polyline>')
+        for mx, my, color, tip in markers:
+            parts.append(f'<circle cx="{sx(mx):.0f}" cy="{sy(my):.0f}" r="3" fill="{color}">'
+                         f'<title>{html.escape(tip)}</title></circle>')
+        parts.append(f'<text x="{pad}" y="12" class="tick">{_fmt(y1)}</text>'
+                     f'<text x="{pad}" y="{h - pad / 2 - 4}" class="tick">{_fmt(y0)}</text>')
+        if x.dtype.kind == 'f' and x0 > 1e11:
+            left = pd.Timestamp(int(x0), unit='ms').strftime('%Y-%m-%d')
+            right = pd.Timestamp(int(x1), unit='ms').strftime('%Y-%m-%d')
+            parts.append(f'<text x="{pad}" y="{h - 4}" class="tick">{left}</text>'
+                         f'<text x="{w - pad}" y="{h - 4}" class="tick" text-anchor="end">{right}</text>')
+        parts.append('</svg>')
+        return "".join(parts)
+
+    def _hbar_chart(self, labels, values, unit=""):
+        """
+        Горизонтальные столбцы: подписи читаются при любом числе строк.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if not len(values):
+            return "<p>Нет данных.</p>"
+        row, label_w, w = 16, 260, self.WIDTH
+        h = row * len(values) + 10
+        span = np.nanmax(np.abs(values)) or 1.0
+        has_negative = (values < 0).any()
+        zero = label_w + (w - label_w - 60) / 2 if has_negative else label_w
+        scale = (w - label_w - 60) / (2 * span if has_negative else span)
+
+        parts = [f'<svg viewBox="0 0 {w} {h}" class="chart">']
+        for k, (label, value) in enumerate(zip(labels, values)):
+            y = 5 + k * row
+            length = abs(value) * scale if np.isfinite(value) else 0
+            x = zero if value >= 0 else zero - length
+            color = "#3a8" if value >= 0 else "#d55"
+            parts.append(f'<text x="{label_w - 6}" y="{y + 11}" class="tick" text-anchor="end">'
+                         f'{html.escape(str(label))}</text>'
+                         f'<rect x="{x:.1f}" y="{y}" width="{max(length, 0.5):.1f}" height="{row - 3}" fill="{color}">'
+                         f'<title>{html.escape(str(label))}: {_fmt(value)}{unit}</title></rect>')
+        parts.append(f'<line x1="{zero}" x2="{zero}" y1="0" y2="{h}" class="axis"/></svg>')
+        return "".join(parts)
+
+    def _table(self, df, max_rows=None):
+        if df is None or df.empty:
+            return "<p>Нет данных.</p>"
+        shown = df if max_rows is None else df.head(max_rows)
+        head = "".join(f"<th>{html.escape(str(c))}</th>" for c in shown.columns)
+        body = "".join(
+            "<tr>" + "".join(f"<td>{_fmt(v)}</td>" for v in row) + "</tr>"
+            for row in shown.itertuples(index=False, name=None)
+        )
+        more = f"<p class='note'>Показано {len(shown)} из {len(df)}.</p>" if len(shown) < len(df) else ""
+        return f"<table><thead><tr>{head}</tr></thead><tbody>{body}</tbody></table>{more}"
+
+    def add_stage_timings(self, timings):
+        """
+        timings — словарь {этап: секунды}.
+        """
+        labels = list(timings)
+        values = [timings[k] for k in labels]
+        total = sum(values)
+        self.sections.append(("Длительность этапов", f"<p>Всего: {total / 60:.1f} мин.</p>"
+                              + self._hbar_chart(labels, values, unit=" с")))
+
+    def add_delta_distribution(self, deltas, bins=50):
+        deltas = np.asarray(deltas, dtype=np.float64)
+        deltas = deltas[np.isfinite(deltas)]
+        if not len(deltas):
+            self.sections.append(("Распределение delta R²", "<p>Нет данных.</p>"))
+            return
+        counts, edges = np.histogram(deltas, bins=bins)
+        w, h, pad = self.WIDTH, 220, self.PAD
+        bar_w = (w - 2 * pad) / len(counts)
+        top = counts.max() or 1
+        parts = [f'<svg viewBox="0 0 {w} {h}" class="chart">']
+        for k, count in enumerate(counts):
+            bh = count / top * (h - pad)
+            parts.append(f'<rect x="{pad + k * bar_w:.1f}" y="{h - pad / 2 - bh:.1f}" width="{bar_w - 1:.1f}" '
+                         f'height="{bh:.1f}" fill="#7ab"><title>{_fmt(edges[k])} … {_fmt(edges[k + 1])}: '
+                         f'{count}</title></rect>')
+        p99 = np.percentile(deltas, 99)
+        x99 = pad + (p99 - edges[0]) / ((edges[-1] - edges[0]) or 1) * (w - 2 * pad)
+        parts.append(f'<line x1="{x99:.1f}" x2="{x99:.1f}" y1="0" y2="{h - pad / 2}" stroke="#d33" '
+                     f'stroke-dasharray="4 3"><title>1% порог: {_fmt(p99)}</title></line>'
+                     f'<text x="{pad}" y="{h - 4}" class="tick">{_fmt(edges[0])}</text>'
+                     f'<text x="{w - pad}" y="{h - 4}" class="tick" text-anchor="end">{_fmt(edges[-1])}</text></svg>')
+        self.sections.append(("Распределение delta R²",
+                              f"<p>{len(deltas)} пар, 99-й перцентиль: {_fmt(p99)}.</p>" + "".join(parts)))
+
+    def add_pnl_summary(self, results, robustness=None):
+        """
+        results — результаты симуляции (pair, trades, total_pnl, ...); robustness — интервалы бутстрапа.
+        """
+        if results is None or results.empty:
+            self.sections.append(("Сводка PnL", "<p>Нет данных.</p>"))
+            return
+        df = results.sort_values('total_pnl', ascending=False)
+        if robustness is not None and 'pnl_ci_low' in robustness.columns:
+            df = df.merge(robustness[['pair', 'pnl_ci_low', 'pnl_ci_high', 'prob_positive']], on='pair', how='left')
+        summary = (f"<p>Пар: {len(df)}, суммарный PnL: {_fmt(df['total_pnl'].sum())}, "
+                   f"средний: {_fmt(df['total_pnl'].mean())}, прибыльных: {int((df['total_pnl'] > 0).sum())}.</p>")
+        self.sections.append(("Сводка PnL", summary + self._hbar_chart(df['pair'], df['total_pnl'])
+                              + self._table(df)))
+
+    def add_pair_chart(self, pair, timestamps, spread, zscore=None, trades=(), z_entry=-2, z_exit=0):
+        """
+        Спред пары и его z-score с отметками входов и выходов сделок.
+        """
+        # Явно в наносекундах: pandas может разобрать время с разрешением в секундах или микросекундах
+        ts = pd.to_datetime(pd.Series(timestamps)).to_numpy(dtype='datetime64[ns]').astype(np.int64)
+        x = ts / 1e6
+        spread = np.asarray(spread, dtype=np.float64)
+        markers = []
+        for trade in trades:
+            for key, color in (('entry', '#2a7'), ('exit', '#d33')):
+                found = np.flatnonzero(ts == pd.Timestamp(trade[key]).value)
+                if len(found):
+                    k = found[0]
+                    markers.append((x[k], spread[k], color, f"{key}: {trade[key]}, PnL {_fmt(trade['total_pnl'])}"))
+        body = self._line_chart(x, [("спред", spread, "#357")], markers=markers)
+        if zscore is not None:
+            body += self._line_chart(x, [("z-score", zscore, "#a63")], height=140,
+                                     hlines=[(z_entry, "#2a7", f"вход {z_entry}"), (z_exit, "#d33", f"выход {z_exit}")])
+        pnl = sum(t['total_pnl'] for t in trades)
+        summary = f"{html.escape(pair)} — сделок: {len(trades)}, PnL: {_fmt(pnl)}"
+        self.sections.append((None, f"<details><summary>{summary}</summary>{body}</details>"))
+
+    def render(self):
+        style = """
+body{font-family:-apple-system,Segoe UI,Roboto,sans-serif;margin:24px;color:#222;max-width:960px}
+h2{border-bottom:1px solid #ddd;padding-bottom:4px;margin-top:32px}
+.chart{width:100%;height:auto;display:block;margin:8px 0}
+.axis{stroke:#999;stroke-width:1}.tick{font-size:10px;fill:#555}
+table{border-collapse:collapse;font-size:12px;margin:8px 0}td,th{border:1px solid #ddd;padding:2px 6px;text-align:right}
+th{background:#f4f4f4}details{margin:4px 0}summary{cursor:pointer}.note{color:#777;font-size:12px}
+"""
+        body = []
+        pairs_header_done = False
+        for title, content in self.sections:
+            if title is None and not pairs_header_done:
+                body.append("<h2>Пары: спред и сделки</h2>")
+                pairs_header_done = True
+            if title is not None:
+                body.append(f"<h2>{html.escape(title)}</h2>")
+            body.append(content)
+        created = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        return (f"<!DOCTYPE html><html lang='ru'><head><meta charset='utf-8'><title>{html.escape(self.title)}</title>"
+                f"<style>{style}</style></head><body><h1>{html.escape(self.title)}</h1>"
+                f"<p class='note'>Сформирован {created}</p>{''.join(body)}</body></html>")
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        print(f"🧾 HTML-отчёт сохранён: {path} ({os.path.getsize(path) / 1024:.0f} КБ)")
+        return path
+
+
+def build_run_report(path, simulator=None, pair_results=None, deltas=None, timings=None, robustness=None,
+                     title="Solomon_bot: отчёт прогона", max_pairs=300):
+    """
+    Собирает отчёт прогона: длительности этапов, распределение delta, сводку PnL
+    и графики пар из результатов симуляции (пары 'A_B', спред пересчитывается симулятором).
+    """
+    report = HtmlRunReport(title=title)
+    if timings:
+        report.add_stage_timings(timings)
+    if deltas is not None:
+        report.add_delta_distribution(deltas)
+    if pair_results is not None:
+        report.add_pnl_summary(pair_results, robustness)
+        if simulator is not None:
+            top = pair_results.sort_values('total_pnl', ascending=False).head(max_pairs)
+            names_a, names_b = pair_name_columns(top)
+            if simulator.panel is None:
+                simulator.load_panel(set(names_a) | set(names_b))
+            for pair, symbol1, symbol2 in zip(top['pair'], names_a, names_b):
+                try:
+                    merged, _, trades = simulator.spread_trades(symbol1, symbol2)
+                except Exception as e:
+                    print(f"⚠️ {pair}: не удалось построить график — {e}")
+                    continue
+                report.add_pair_chart(pair, merged['timestamp'], merged['spread'], merged['zscore'], trades)
+    return report.save(path)
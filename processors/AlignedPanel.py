@@ -0,0 +1,136 @@
+import os
+import hashlib
+import numpy as np
+import pandas as pd
+from utils.symbols import strip_timeframe
+
+
+class AlignedPanel:
+    """
+    Выровненная по времени панель цен всех монет.
+
+    Вместо того чтобы каждый этап делал свой pd.merge по timestamp для каждой пары,
+    данные один раз раскладываются на общую часовую ось:
+    - timestamps: общая ось времени (объединение меток всех файлов)
+    - values: матрица [монеты × бары] (float64, NaN там, где бара нет)
+    - mask: булева маска валидности той же формы
+
+    Количество общих баров для всех пар считается одним матричным произведением масок,
+    поэтому пары с недостаточным пересечением отсеиваются до запуска любых вычислений,
+    а пара извлекается индексным срезом без merge.
+    """
+
+    def __init__(self, symbols, timestamps, values, mask):
+        self.symbols = list(symbols)
+        self.index = {name: i for i, name in enumerate(self.symbols)}
+        self.timestamps = timestamps
+        self.values = values
+        self.mask = mask
+        self._overlap_counts = None
+
+    @classmethod
+    def from_dir(cls, data_dir, min_data_points=0, column='close', strip_suffix=None, symbols=None):
+        """
+        Загружает все CSV из директории и строит панель.
+        Файлы без нужных столбцов и короче min_data_points пропускаются.
+        strip_suffix позволяет хранить монеты без суффикса таймфрейма (например, '_h1').
+        symbols — необязательный набор монет (без суффикса таймфрейма), например вселенная UniverseFilter.
+        """
+        series = {}
+        for file in sorted(os.listdir(data_dir)):
+            if not file.endswith(".csv"):
+                continue
+            if symbols is not None and strip_timeframe(os.path.splitext(file)[0]) not in symbols:
+                continue
+            df = pd.read_csv(os.path.join(data_dir, file))
+            if 'timestamp' not in df.columns or column not in df.columns:
+                continue
+            df = df[['timestamp', column]].dropna()
+            if len(df) < min_data_points:
+                continue
+            name = os.path.splitext(file)[0]
+            if strip_suffix:
+                name = name.replace(strip_suffix, '')
+            s = pd.Series(df[column].to_numpy(dtype=np.float64), index=pd.to_datetime(df['timestamp']))
+            series[name] = s[~s.index.duplicated(keep='last')].sort_index()
+        return cls.from_series(series)
+
+    @classmethod
+    def from_series(cls, series):
+        """
+        Строит панель из словаря {монета: pd.Series с DatetimeIndex}.
+        """
+        symbols = list(series.keys())
+        if not symbols:
+            return cls([], np.array([], dtype='datetime64[ns]'), np.empty((0, 0)), np.empty((0, 0), dtype=bool))
+
+        timestamps = np.unique(np.concatenate([s.index.values for s in series.values()]))
+        values = np.full((len(symbols), len(timestamps)), np.nan)
+        for i, name in enumerate(symbols):
+            s = series[name]
+            values[i, np.searchsorted(timestamps, s.index.values)] = s.to_numpy()
+        mask = ~np.isnan(values)
+        return cls(symbols, timestamps, values, mask)
+
+    @property
+    def overlap_counts(self):
+        """
+        Матрица [монеты × монеты] с количеством общих валидных баров для каждой пары.
+        Считается один раз: mask @ mask.T.
+        """
+        if self._overlap_counts is None:
+            m = self.mask.astype(np.float32)
+            self._overlap_counts = np.rint(m @ m.T).astype(np.int64)
+        return self._overlap_counts
+
+    def overlap_count(self, a, b):
+        return int(self.overlap_counts[self.index[a], self.index[b]])
+
+    def eligible_pairs(self, min_data_points=0):
+        """
+        Все пары (a, b) с i < j, у которых не меньше min_data_points общих баров.
+        """
+        i, j = np.triu_indices(len(self.symbols), k=1)
+        keep = self.overlap_counts[i, j] >= min_data_points
+        return [(self.symbols[a], self.symbols[b]) for a, b in zip(i[keep], j[keep])]
+
+    def pair_indices(self, a, b):
+        """
+        Индексы общей оси времени, на которых валидны обе монеты.
+        """
+        return np.flatnonzero(self.mask[self.index[a]] & self.mask[self.index[b]])
+
+    def pair_view(self, a, b):
+        """
+        Возвращает (timestamps, значения a, значения b) только по общим барам.
+        """
+        idx = self.pair_indices(a, b)
+        return self.timestamps[idx], self.values[self.index[a], idx], self.values[self.index[b], idx]
+
+    def pair_frame(self, a, b, suffixes=('_a', '_b'), column='close'):
+        """
+        Общие бары пары в виде DataFrame с индексом timestamp —
+        эквивалент inner merge двух файлов по времени.
+        """
+        ts, values_a, values_b = self.pair_view(a, b)
+        return pd.DataFrame(
+            {f'{column}{suffixes[0]}': values_a, f'{column}{suffixes[1]}': values_b},
+            index=pd.DatetimeIndex(ts, name='timestamp')
+        )
+
+    def fingerprint(self):
+        """
+        Хэш содержимого панели (монеты, ось времени, значения): меняется при любом изменении входных данных.
+        """
+        digest = hashlib.sha1()
+        digest.update("\n".join(self.symbols).encode())
+        digest.update(np.ascontiguousarray(self.timestamps).tobytes())
+        digest.update(np.ascontiguousarray(np.nan_to_num(self.values, nan=0.0)).tobytes())
+        digest.update(np.ascontiguousarray(self.mask).tobytes())
+        return digest.hexdigest()
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __len__(self):
+        return len(self.symbols)
@@ -0,0 +1,118 @@
+import os
+import numpy as np
+import pandas as pd
+from processors.TimeframeResampler import COLUMNS, HOUR_MS, TIMEFRAMES
+from utils.symbols import strip_timeframe
+
+
+class ChunkedPriceReader:
+    """
+    Чтение хранилища цен окнами по времени без загрузки всей истории.
+
+    Каждый CSV (формат коллектора, строки по возрастанию времени) читается потоково
+    порциями по rows_per_read строк. Ось времени — регулярная сетка с шагом bar_ms
+    (по умолчанию шаг таймфрейма; для минутных баров — 60_000), она режется на окна
+    по chunk_bars баров. Итерация выдаёт окна (метки в мс, значения [монеты × бары], маска) —
+    та же раскладка, что у AlignedPanel, но в памяти одновременно одно окно
+    и по порции строк на монету, независимо от длины истории.
+    """
+
+    def __init__(self, data_dir, timeframe='h1', chunk_bars=20_000, bar_ms=None, symbols=None, min_data_points=0,
+                 column='close', rows_per_read=10_000):
+        self.data_dir = data_dir
+        self.chunk_bars = chunk_bars
+        self.bar_ms = bar_ms or TIMEFRAMES[timeframe] * HOUR_MS
+        self.column = column
+        self.rows_per_read = rows_per_read
+        self.files = []
+        for file in sorted(os.listdir(data_dir)):
+            if not file.endswith(".csv"):
+                continue
+            if symbols is not None and strip_timeframe(os.path.splitext(file)[0]) not in symbols:
+                continue
+            if min_data_points and self.count_rows(os.path.join(data_dir, file)) < min_data_points:
+                continue
+            self.files.append(file)
+        self.symbols = [os.path.splitext(file)[0] for file in self.files]
+        self.index = {name: i for i, name in enumerate(self.symbols)}
+
+    @staticmethod
+    def count_rows(path):
+        with open(path, 'rb') as f:
+            return max(0, sum(1 for _ in f) - 1)
+
+    def _open(self, file):
+        return pd.read_csv(os.path.join(self.data_dir, file), header=0, names=COLUMNS,
+                           usecols=['timestamp', self.column], chunksize=self.rows_per_read)
+
+    @staticmethod
+    def _next_rows(reader):
+        for df in reader:
+            df = df.dropna()
+            if len(df):
+                return df['timestamp'].to_numpy(dtype=np.int64), df.iloc[:, 1].to_numpy(dtype=np.float64)
+        return None
+
+    @staticmethod
+    def edge_timestamps(path):
+        """
+        (первая, последняя) метка файла в мс без чтения всего файла: первая строка данных и хвост.
+        None — в файле нет строк.
+        """
+        with open(path, 'rb') as f:
+            f.readline()
+            first = f.readline()
+            if not first.strip():
+                return None
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - 4096))
+            last = next(line for line in reversed(f.read().splitlines()) if line.strip())
+        return int(float(first.split(b',')[1])), int(float(last.split(b',')[1]))
+
+    def n_chunks(self):
+        """
+        Число окон от первой до последней метки всех файлов — total для прогресса итерации
+        (верхняя граница: окна общего простоя всех монет итерация пропускает).
+        """
+        edges = [e for e in (self.edge_timestamps(os.path.join(self.data_dir, f)) for f in self.files) if e]
+        if not edges:
+            return 0
+        t0, t1 = min(first for first, _ in edges), max(last for _, last in edges)
+        return int((t1 - t0) // (self.chunk_bars * self.bar_ms)) + 1
+
+    def __iter__(self):
+        readers = [self._open(file) for file in self.files]
+        try:
+            buffers = [self._next_rows(reader) for reader in readers]
+            firsts = [rows[0][0] for rows in buffers if rows is not None]
+            if not firsts:
+                return
+            t0 = min(firsts)
+            span = self.chunk_bars * self.bar_ms
+            while any(rows is not None for rows in buffers):
+                # Пустые окна (общий простой всех монет) пропускаются целиком
+                nearest = min(rows[0][0] for rows in buffers if rows is not None)
+                t0 += (nearest - t0) // span * span
+                t1 = t0 + span
+                values = np.full((len(readers), self.chunk_bars), np.nan)
+                for i, reader in enumerate(readers):
+                    # Дочитываем порции монеты, пока её буфер не выйдет за конец окна
+                    while buffers[i] is not None and buffers[i][0][-1] < t1:
+                        rows = self._next_rows(reader)
+                        if rows is None:
+                            break
+                        buffers[i] = (np.concatenate([buffers[i][0], rows[0]]),
+                                      np.concatenate([buffers[i][1], rows[1]]))
+                    if buffers[i] is None:
+                        continue
+                    ts, close = buffers[i]
+                    cut = np.searchsorted(ts, t1)
+                    values[i, (ts[:cut] - t0) // self.bar_ms] = close[:cut]
+                    buffers[i] = (ts[cut:], close[cut:]) if cut < len(ts) else self._next_rows(reader)
+                mask = ~np.isnan(values)
+                if mask.any():
+                    yield t0 + self.bar_ms * np.arange(self.chunk_bars, dtype=np.int64), values, mask
+                t0 = t1
+        finally:
+            for reader in readers:
+                reader.close()
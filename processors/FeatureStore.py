@@ -0,0 +1,171 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+from processors.AlignedPanel import AlignedPanel
+from processors.TimeframeResampler import TimeframeResampler, resolve_timeframe_dir
+from utils.symbols import strip_timeframe
+
+# Версия формул признаков: при изменении расчёта увеличивается, и весь кэш пересчитывается
+FEATURE_VERSION = 1
+
+
+class FeatureStore:
+    """
+    Хранилище производных признаков монет рядом с ценами, обновляемое инкрементально.
+
+    Для каждой монеты в {data_dir}/features/{timeframe}/{SYMBOL}_{timeframe}.csv хранятся:
+    - log_return: ln(close_t / close_{t-1}) к предыдущему бару файла монеты;
+    - ma_{w}: скользящее среднее close за w баров;
+    - vol_{w}: скользящее стандартное отклонение log_return за w баров (ddof=1).
+
+    Первый столбец 'timestamp' — время бара в том же виде, что в файлах цен, поэтому
+    признак читается в выровненную панель как обычная цена: AlignedPanel.from_dir(..., column='log_return').
+
+    Обновление как у TimeframeResampler: файл пропускается, если он новее файла цен;
+    иначе пересчитывается хвост — последний бар кэша (он мог быть неполным) и новые бары,
+    с запасом в max(windows) баров истории для скользящих окон. Более старая история кэша сохраняется.
+    Полный пересчёт монеты — если в файле цен появилась более ранняя история или изменился
+    опорный бар. Версия формул и набор окон хранятся в manifest.json: при расхождении
+    весь кэш считается устаревшим и пересчитывается.
+    """
+
+    def __init__(self, data_dir, timeframe='h1', windows=(24, 72, 168), store_dir=None):
+        self.data_dir = data_dir
+        self.timeframe = timeframe
+        self.windows = tuple(sorted(windows))
+        self.store_dir = store_dir or os.path.join(data_dir, "features", timeframe)
+
+    @property
+    def columns(self):
+        return ['log_return'] + [f'ma_{w}' for w in self.windows] + [f'vol_{w}' for w in self.windows]
+
+    def _manifest(self):
+        return {'version': FEATURE_VERSION, 'windows': list(self.windows)}
+
+    def _manifest_path(self):
+        return os.path.join(self.store_dir, "manifest.json")
+
+    def is_current(self):
+        """
+        True, если кэш посчитан текущей версией формул с тем же набором окон.
+        """
+        path = self._manifest_path()
+        if not os.path.exists(path):
+            return False
+        with open(path) as f:
+            return json.load(f) == self._manifest()
+
+    def compute(self, bars):
+        """
+        Признаки по барам формата коллектора (timestamp в мс, close).
+        """
+        close = bars['close'].astype(np.float64).reset_index(drop=True)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            log_return = np.log(close / close.shift(1))
+        out = pd.DataFrame({
+            'timestamp': bars['time'].to_numpy(),
+            'timestamp_ms': bars['timestamp'].to_numpy(dtype=np.int64),
+            'close': close.to_numpy(),
+            'log_return': log_return.to_numpy(),
+        })
+        for w in self.windows:
+            out[f'ma_{w}'] = close.rolling(w).mean().to_numpy()
+        for w in self.windows:
+            out[f'vol_{w}'] = log_return.rolling(w).std().to_numpy()
+        return out
+
+    def path(self, symbol):
+        return os.path.join(self.store_dir, f"{symbol}_{self.timeframe}.csv")
+
+    def read(self, symbol):
+        """
+        Признаки одной монеты (без суффикса таймфрейма); пустой DataFrame, если их нет.
+        """
+        path = self.path(symbol)
+        if not os.path.exists(path):
+            return pd.DataFrame(columns=['timestamp', 'timestamp_ms', 'close'] + self.columns)
+        return pd.read_csv(path)
+
+    def update_symbol(self, file, source_dir, stale=False):
+        """
+        Обновляет признаки одного файла цен. Возвращает 'skip', 'append' или 'full'.
+        """
+        source_path = os.path.join(source_dir, file)
+        symbol = strip_timeframe(file[:-len(".csv")])
+        target_path = self.path(symbol)
+
+        if not stale and os.path.exists(target_path) and os.path.getmtime(target_path) >= os.path.getmtime(source_path):
+            return 'skip'
+
+        bars = TimeframeResampler.read_bars(source_path)
+        cached = self.read(symbol) if not stale else None
+        if cached is None or len(cached) < 2 or bars.empty:
+            self.compute(bars).to_csv(target_path, index=False)
+            return 'full'
+
+        ts = bars['timestamp'].to_numpy(dtype=np.int64)
+        # Опорный бар — предпоследний бар кэша: последний мог быть неполным и пересчитывается
+        anchor_ts, anchor_close = int(cached['timestamp_ms'].iloc[-2]), float(cached['close'].iloc[-2])
+        anchor = int(np.searchsorted(ts, anchor_ts))
+        backfilled = ts[0] < int(cached['timestamp_ms'].iloc[0])
+        if backfilled or anchor >= len(ts) or ts[anchor] != anchor_ts or bars['close'].iloc[anchor] != anchor_close:
+            self.compute(bars).to_csv(target_path, index=False)
+            return 'full'
+
+        # Хвост с запасом max(windows) баров до опорного, чтобы скользящие окна новых баров были полными
+        start = max(anchor - self.windows[-1], 0)
+        fresh = self.compute(bars.iloc[start:])
+        fresh = fresh[fresh['timestamp_ms'] > anchor_ts]
+        kept = cached.iloc[:-1]
+        pd.concat([kept, fresh], ignore_index=True).to_csv(target_path, index=False)
+        return 'append'
+
+    def update_all(self):
+        """
+        Обновляет признаки всех монет таймфрейма и возвращает директорию хранилища.
+        """
+        source_dir = resolve_timeframe_dir(self.data_dir, self.timeframe)
+        os.makedirs(self.store_dir, exist_ok=True)
+        stale = not self.is_current()
+        if stale:
+            print(f"♻️ Признаки устарели (версия {FEATURE_VERSION}, окна {list(self.windows)}) — полный пересчёт")
+
+        suffix = f"_{self.timeframe}.csv"
+        files = sorted(f for f in os.listdir(source_dir) if f.endswith(suffix))
+        counts = {'skip': 0, 'append': 0, 'full': 0}
+        for file in tqdm(files, desc=f"Признаки {self.timeframe}"):
+            counts[self.update_symbol(file, source_dir, stale=stale)] += 1
+
+        with open(self._manifest_path(), "w") as f:
+            json.dump(self._manifest(), f)
+        print(f"🧮 Признаки {self.timeframe}: дописано {counts['append']}, пересчитано {counts['full']}, "
+              f"без изменений {counts['skip']} из {len(files)} файлов в {self.store_dir}")
+        return self.store_dir
+
+    def panel(self, feature, symbols=None, min_data_points=0):
+        """
+        Выровненная панель одного признака (монеты без суффикса таймфрейма), кэш предварительно обновляется.
+        """
+        self.update_all()
+        return AlignedPanel.from_dir(self.store_dir, min_data_points=min_data_points, column=feature,
+                                     strip_suffix=f'_{self.timeframe}', symbols=symbols)
+
+    def aligned(self, feature, panel):
+        """
+        Матрица признака [монеты × бары] на оси времени готовой панели цен (NaN, где значения нет).
+        Монеты панели берутся с её же именами.
+        """
+        self.update_all()
+        out = np.full(panel.values.shape, np.nan)
+        for i, name in enumerate(panel.symbols):
+            path = self.path(strip_timeframe(name))
+            if not os.path.exists(path):
+                continue
+            df = pd.read_csv(path, usecols=['timestamp', feature])
+            ts = pd.to_datetime(df['timestamp']).to_numpy()
+            pos = np.searchsorted(panel.timestamps, ts)
+            found = (pos < len(panel.timestamps)) & (panel.timestamps[np.minimum(pos, len(panel.timestamps) - 1)] == ts)
+            out[i, pos[found]] = df[feature].to_numpy(dtype=np.float64)[found]
+        return out
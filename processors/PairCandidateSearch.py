@@ -0,0 +1,247 @@
+import os
+import time
+import numpy as np
+import pandas as pd
+from sklearn.utils.extmath import randomized_svd
+from processors.AlignedPanel import AlignedPanel
+from processors.TimeframeResampler import resolve_timeframe_dir
+from utils.symbols import SymbolDictionary
+
+
+def normalized_paths(values, window=720, min_coverage=0.5):
+    """
+    Нормированные лог-ценовые пути последних window баров панели [монеты × бары].
+
+    Пропуски заполняются последней известной ценой (в начале окна — первой), каждая строка
+    центрируется и делится на норму, поэтому скалярное произведение двух путей равно
+    корреляции Пирсона лог-цен. Возвращает (пути, индексы монет с долей баров в окне ≥ min_coverage).
+    """
+    recent = values[:, -window:]
+    valid = np.isfinite(recent) & (recent > 0)
+    keep = np.flatnonzero(valid.mean(axis=1) >= min_coverage) if recent.shape[1] else np.array([], dtype=np.int64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        logs = pd.DataFrame(np.where(valid[keep], np.log(recent[keep]), np.nan).T).ffill().bfill().to_numpy().T
+    paths = logs - logs.mean(axis=1, keepdims=True)
+    norms = np.linalg.norm(paths, axis=1)
+    flat = norms == 0
+    paths[~flat] /= norms[~flat, None]
+    return paths[~flat], keep[~flat]
+
+
+def top_k_rows(scores, k):
+    """
+    Индексы k наибольших значений каждой строки (по убыванию).
+    """
+    k = min(k, scores.shape[1])
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, part, axis=1), axis=1)
+    return np.take_along_axis(part, order, axis=1)
+
+
+class PairCandidateSearch:
+    """
+    Приближённый поиск ближайших соседей для генерации пар-кандидатов быстрее O(N²).
+
+    Полный перебор combinations и даже полная матрица корреляций стоят O(N²) пар. Здесь:
+    1. Лог-ценовой путь каждой монеты (последние window баров) нормируется (normalized_paths) —
+       скалярное произведение путей равно их корреляции.
+    2. Путь сжимается в компактный вектор dim: PCA (усечённый randomized SVD) или
+       случайная гауссова проекция (method='random'), вектор нормируется.
+    3. Индекс LSH по случайным гиперплоскостям (SimHash): n_tables таблиц по n_bits бит,
+       монеты с похожими векторами с высокой вероятностью попадают в одну корзину хотя бы одной таблицы.
+    4. Кандидаты из общих корзин переранжируются по скалярному произведению векторов,
+       для каждой монеты остаются k ближайших; пары (a, b) объединяются без повторов.
+
+    Стоимость — O(N · n_tables · размер корзины), а не O(N²); n_bits по умолчанию подбирается так,
+    чтобы в корзине было порядка 4k монет. recall() сравнивает результат с точным перебором.
+    Отрицательно коррелированные пары не ищутся (для коинтеграции с beta > 0 они не нужны).
+    """
+
+    def __init__(self, data_dir, timeframe='h1', k=20, window=720, method='pca', dim=32, n_tables=8,
+                 n_bits=None, min_coverage=0.5, seed=42):
+        if method not in ('pca', 'random'):
+            raise ValueError("method должен быть 'pca' или 'random'")
+        self.data_dir = data_dir
+        self.timeframe = timeframe
+        self.k = k
+        self.window = window
+        self.method = method
+        self.dim = dim
+        self.n_tables = n_tables
+        self.n_bits = n_bits
+        self.min_coverage = min_coverage
+        self.seed = seed
+        self.panel = None
+        self.paths = None
+        self.members = None
+        self.embedding = None
+        self.neighbors = None
+        self.results = pd.DataFrame()
+        self.elapsed = 0.0
+
+    def load_panel(self):
+        self.panel = AlignedPanel.from_dir(resolve_timeframe_dir(self.data_dir, self.timeframe))
+
+    def embed(self, paths):
+        """
+        Компактные нормированные векторы путей [монеты × dim].
+        """
+        rng = np.random.default_rng(self.seed)
+        dim = min(self.dim, *paths.shape)
+        if self.method == 'pca':
+            u, s, _ = randomized_svd(paths, n_components=dim, random_state=self.seed)
+            vectors = u * s
+        else:
+            vectors = paths @ rng.standard_normal((paths.shape[1], dim))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms > 0, norms, 1.0)
+
+    def _bucket_chunks(self, codes, direction):
+        """
+        Группы монет с одинаковым кодом корзины. Корзины больше 8k режутся на куски подряд
+        по проекции на direction, чтобы перекос распределения не давал квадратичной работы.
+        """
+        order = np.lexsort((direction, codes))
+        bounds = np.flatnonzero(np.diff(codes[order])) + 1
+        max_bucket = 8 * self.k
+        for bucket in np.split(order, bounds):
+            for start in range(0, len(bucket), max_bucket):
+                chunk = bucket[start:start + max_bucket]
+                if len(chunk) > 1:
+                    yield chunk
+
+    @staticmethod
+    def _merge_top_k(idx_a, sim_a, idx_b, sim_b, k):
+        """
+        Объединение двух списков соседей [монеты × k] без повторов, k лучших по сходству.
+        """
+        idx = np.hstack([idx_a, idx_b])
+        sim = np.hstack([sim_a, sim_b])
+        order = np.argsort(idx, axis=1, kind='stable')
+        idx = np.take_along_axis(idx, order, axis=1)
+        sim = np.take_along_axis(sim, order, axis=1)
+        sim[:, 1:][idx[:, 1:] == idx[:, :-1]] = -np.inf
+        top = top_k_rows(sim, k)
+        idx = np.take_along_axis(idx, top, axis=1)
+        sim = np.take_along_axis(sim, top, axis=1)
+        idx[~np.isfinite(sim)] = -1
+        return idx, sim
+
+    def query(self, embedding):
+        """
+        k ближайших соседей каждой монеты через LSH: матрица [монеты × k] индексов (-1 — соседей меньше k).
+        Внутри каждой корзины сходства считаются одним матричным произведением, лучшие k
+        по всем таблицам накапливаются без построения списка пар.
+        """
+        n, k = len(embedding), self.k
+        rng = np.random.default_rng(self.seed + 1)
+        n_bits = self.n_bits or max(1, int(np.log2(max(2, n / (4 * k)))))
+        weights = 1 << np.arange(n_bits, dtype=np.int64)
+        # Гиперплоскости проходят через центр облака векторов: общий для всех монет рыночный
+        # компонент иначе сваливает почти все монеты в одну корзину
+        centered = embedding - embedding.mean(axis=0)
+        best_idx = np.full((n, k), -1, dtype=np.int64)
+        best_sim = np.full((n, k), -np.inf)
+        for _ in range(self.n_tables):
+            planes = rng.standard_normal((embedding.shape[1], n_bits + 1))
+            projections = centered @ planes
+            codes = (projections[:, :n_bits] > 0).astype(np.int64) @ weights
+            table_idx = np.full((n, k), -1, dtype=np.int64)
+            table_sim = np.full((n, k), -np.inf)
+            for chunk in self._bucket_chunks(codes, projections[:, n_bits]):
+                scores = embedding[chunk] @ embedding[chunk].T
+                np.fill_diagonal(scores, -np.inf)
+                top = top_k_rows(scores, min(k, len(chunk) - 1))
+                table_idx[chunk, :top.shape[1]] = chunk[top]
+                table_sim[chunk, :top.shape[1]] = np.take_along_axis(scores, top, axis=1)
+            best_idx, best_sim = self._merge_top_k(best_idx, best_sim, table_idx, table_sim, k)
+        return best_idx
+
+    def run(self):
+        if self.panel is None:
+            self.load_panel()
+        start = time.perf_counter()
+        self.paths, self.members = normalized_paths(self.panel.values, self.window, self.min_coverage)
+        self.embedding = self.embed(self.paths)
+        self.neighbors = self.query(self.embedding)
+        self.elapsed = time.perf_counter() - start
+
+        rows, cols = np.nonzero(self.neighbors >= 0)
+        a = self.members[rows]
+        b = self.members[self.neighbors[rows, cols]]
+        lo, hi = np.minimum(a, b), np.maximum(a, b)
+        pairs = np.unique(np.stack([lo, hi], axis=1), axis=0) if len(lo) else np.empty((0, 2), dtype=np.int64)
+        # Итоговое сходство — точная корреляция лог-цен в окне (по полным путям, только для кандидатов)
+        position = {m: i for i, m in enumerate(self.members)}
+        pa = np.array([position[m] for m in pairs[:, 0]], dtype=np.int64)
+        pb = np.array([position[m] for m in pairs[:, 1]], dtype=np.int64)
+        corr = np.einsum('ij,ij->i', self.paths[pa], self.paths[pb]) if len(pairs) else np.empty(0)
+        symbols = np.asarray(self.panel.symbols, dtype=object)
+        self.results = pd.DataFrame({
+            'pair': [f"{x}/{y}" for x, y in zip(symbols[pairs[:, 0]], symbols[pairs[:, 1]])],
+            'asset_a': symbols[pairs[:, 0]],
+            'asset_b': symbols[pairs[:, 1]],
+            'corr': corr,
+        }).sort_values('corr', ascending=False).reset_index(drop=True)
+
+        n = len(self.members)
+        print(f"🧭 Кандидаты ANN: {len(self.results)} пар для {n} монет (k={self.k}, {self.method}, dim={self.embedding.shape[1]}) "
+              f"вместо {n * (n - 1) // 2} пар полного перебора, {self.elapsed:.2f} с")
+        return self.results
+
+    def exact_neighbors(self, block=1024):
+        """
+        Точные k ближайших соседей по корреляции путей (полный перебор блоками строк) — эталон для recall.
+        """
+        n = len(self.paths)
+        neighbors = np.empty((n, min(self.k, n - 1)), dtype=np.int64)
+        for start in range(0, n, block):
+            scores = self.paths[start:start + block] @ self.paths.T
+            rows = np.arange(scores.shape[0])
+            scores[rows, start + rows] = -np.inf
+            neighbors[start:start + block] = top_k_rows(scores, self.k)
+        return neighbors
+
+    def recall(self, pairs_df=None):
+        """
+        Полнота относительно полного перебора:
+        - knn_recall: доля точных k ближайших соседей монет, найденных через LSH;
+        - pair_recall (если передан pairs_df, например результаты coint по всем парам):
+          доля его пар, попавших в кандидаты.
+        """
+        start = time.perf_counter()
+        exact = self.exact_neighbors()
+        exhaustive_sec = time.perf_counter() - start
+        found = sum(len(set(exact[i]) & set(self.neighbors[i][self.neighbors[i] >= 0])) for i in range(len(exact)))
+        report = {
+            'symbols': len(self.members),
+            'k': self.k,
+            'candidate_pairs': len(self.results),
+            'knn_recall': found / exact.size if exact.size else np.nan,
+            'ann_sec': self.elapsed,
+            'exhaustive_sec': exhaustive_sec,
+        }
+        if pairs_df is not None:
+            symbols = SymbolDictionary.from_panel(self.panel)
+            candidates = symbols.encode_pairs(self.results, asset_keys=('asset_a', 'asset_b'))
+            reference = symbols.encode_pairs(pairs_df)
+            # Пара без учёта порядка — одно целое: min(a, b) * N + max(a, b)
+            n = len(symbols) + 1
+
+            def unordered(pairs):
+                return np.minimum(pairs.a, pairs.b).astype(np.int64) * n + np.maximum(pairs.a, pairs.b)
+            hits = int(np.isin(unordered(reference), unordered(candidates)).sum())
+            report['reference_pairs'] = len(reference)
+            report['pair_recall'] = hits / len(reference) if len(reference) else np.nan
+        print(f"🎯 Recall k-NN: {report['knn_recall']:.3f} (ANN {report['ann_sec']:.2f} с, "
+              f"полный перебор {report['exhaustive_sec']:.2f} с)"
+              + (f", покрытие пар полного перебора: {report['pair_recall']:.3f}" if 'pair_recall' in report else ""))
+        return report
+
+    def save_results(self, filepath="candidate_pairs.csv"):
+        if self.results.empty:
+            print("⚠️ Нет результатов для сохранения.")
+            return
+        os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+        self.results.to_csv(filepath, index=False)
+        print(f"💾 Пары-кандидаты сохранены в {filepath}")
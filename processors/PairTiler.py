@@ -0,0 +1,56 @@
+import math
+import numpy as np
+
+
+class PairTiler:
+    """
+    Блочный обход пространства пар (верхний треугольник матрицы [монеты × монеты]).
+
+    Вместо списка всех combinations(symbols, 2) пары выдаются плитками tile × tile индексов,
+    размер плитки подбирается под бюджет памяти: одновременно в работе не больше
+    max_in_flight плиток, каждая пара плитки оценивается в bytes_per_pair байт.
+    Так память не растёт с размером вселенной — растёт только число плиток.
+    """
+
+    def __init__(self, n_symbols, bytes_per_pair, memory_budget_mb=256, max_in_flight=1, min_tile=8, max_tile=None):
+        self.n_symbols = n_symbols
+        budget = memory_budget_mb * 1024 * 1024
+        pairs_per_tile = budget / max(1, bytes_per_pair * max_in_flight)
+        self.tile = max(min_tile, int(math.sqrt(pairs_per_tile)))
+        if max_tile:
+            # Ограничение сверху нужно, чтобы плиток хватило на все потоки
+            self.tile = max(min_tile, min(self.tile, max_tile))
+
+    def tiles(self):
+        """
+        Границы плиток (i0, i1, j0, j1) верхнего треугольника, включая диагональные блоки.
+        """
+        for i0 in range(0, self.n_symbols, self.tile):
+            i1 = min(i0 + self.tile, self.n_symbols)
+            for j0 in range(i0, self.n_symbols, self.tile):
+                yield i0, i1, j0, min(j0 + self.tile, self.n_symbols)
+
+    @property
+    def n_tiles(self):
+        blocks = math.ceil(self.n_symbols / self.tile) if self.n_symbols else 0
+        return blocks * (blocks + 1) // 2
+
+    @staticmethod
+    def tile_pairs(tile, overlap_counts=None, min_count=0):
+        """
+        Глобальные индексы пар (ii, jj) плитки с ii < jj.
+        Если передана матрица пересечений, пары короче min_count отбрасываются сразу.
+        """
+        i0, i1, j0, j1 = tile
+        ii, jj = np.meshgrid(np.arange(i0, i1), np.arange(j0, j1), indexing='ij')
+        keep = ii < jj
+        if overlap_counts is not None and min_count:
+            keep &= overlap_counts[i0:i1, j0:j1] >= min_count
+        return ii[keep], jj[keep]
+
+    @staticmethod
+    def count_pairs(overlap_counts, min_count=0):
+        """
+        Число пар верхнего треугольника с пересечением не короче min_count (без материализации пар).
+        """
+        return int((np.triu(overlap_counts >= min_count, k=1)).sum())
@@ -0,0 +1,146 @@
+import os
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+# Таймфрейм → длительность бара в часах
+TIMEFRAMES = {'h1': 1, 'h2': 2, 'h4': 4, 'h12': 12, 'd1': 24}
+
+# Интервал Bybit (параметр interval у get_kline) → суффикс таймфрейма в имени файла
+INTERVAL_TO_TIMEFRAME = {'60': 'h1', '120': 'h2', '240': 'h4', '720': 'h12', 'D': 'd1'}
+
+BASE_TIMEFRAME = 'h1'
+COLUMNS = ['time', 'timestamp', 'open', 'high', 'low', 'close', 'volume', 'turnover']
+HOUR_MS = 3600 * 1000
+
+
+def timeframe_suffix(interval):
+    """
+    Суффикс файла для интервала Bybit; неизвестные интервалы записываются как есть (например, '_m5').
+    """
+    return INTERVAL_TO_TIMEFRAME.get(str(interval), f"m{interval}")
+
+
+def resolve_timeframe_dir(data_dir, timeframe=BASE_TIMEFRAME):
+    """
+    Возвращает директорию с CSV нужного таймфрейма.
+    Для h1 это сама data_dir, для старших таймфреймов кэш предварительно обновляется.
+    """
+    if timeframe == BASE_TIMEFRAME:
+        return data_dir
+    return TimeframeResampler(data_dir).update_all(timeframe)
+
+
+class TimeframeResampler:
+    """
+    Строит старшие таймфреймы (2h/4h/12h/1d) из сохранённых часовых баров без повторного скачивания.
+
+    - Агрегация векторная: бары группируются по началу интервала (UTC), open/close берутся
+      по индексам границ групп, high/low/volume/turnover считаются через ufunc.reduceat.
+    - Результат кэшируется на диске: {data_dir}/resampled/{timeframe}/{SYMBOL}_{timeframe}.csv
+      в том же формате, что и часовые файлы коллектора.
+    - Обновление инкрементальное: последний (возможно неполный) бар кэша пересчитывается
+      вместе с новыми часовыми барами, более старая история кэша сохраняется,
+      даже если из часового файла она уже ушла.
+    """
+
+    def __init__(self, data_dir, cache_dir=None):
+        self.data_dir = data_dir
+        self.cache_dir = cache_dir or os.path.join(data_dir, "resampled")
+
+    def timeframe_dir(self, timeframe):
+        if timeframe == BASE_TIMEFRAME:
+            return self.data_dir
+        return os.path.join(self.cache_dir, timeframe)
+
+    @staticmethod
+    def read_bars(path):
+        """
+        Читает CSV в формате коллектора: строковое время (МСК), timestamp в мс и OHLCV.
+        """
+        df = pd.read_csv(path, header=0, names=COLUMNS)
+        df = df.dropna(subset=['timestamp', 'close'])
+        df['timestamp'] = df['timestamp'].astype(np.int64)
+        return df.drop_duplicates('timestamp', keep='last').sort_values('timestamp').reset_index(drop=True)
+
+    @staticmethod
+    def write_bars(df, path):
+        out = df.set_index('time')
+        out.index.name = 'timestamp'
+        out.to_csv(path)
+
+    @staticmethod
+    def resample(df, timeframe):
+        """
+        Векторная агрегация часовых баров в бары таймфрейма timeframe.
+        """
+        if df.empty:
+            return df.copy()
+
+        bucket_ms = TIMEFRAMES[timeframe] * HOUR_MS
+        ts = df['timestamp'].to_numpy(dtype=np.int64)
+        buckets = ts // bucket_ms * bucket_ms
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        ends = np.r_[starts[1:], len(ts)] - 1
+
+        out = pd.DataFrame({
+            'timestamp': buckets[starts],
+            'open': df['open'].to_numpy()[starts],
+            'high': np.maximum.reduceat(df['high'].to_numpy(dtype=np.float64), starts),
+            'low': np.minimum.reduceat(df['low'].to_numpy(dtype=np.float64), starts),
+            'close': df['close'].to_numpy()[ends],
+            'volume': np.add.reduceat(df['volume'].to_numpy(dtype=np.float64), starts),
+            'turnover': np.add.reduceat(df['turnover'].to_numpy(dtype=np.float64), starts),
+        })
+        out.insert(0, 'time', pd.to_datetime(out['timestamp'], unit='ms', utc=True)
+                   .dt.tz_convert('Europe/Moscow').dt.strftime('%Y-%m-%d %H:%M:%S'))
+        return out
+
+    def update_symbol(self, file, timeframe):
+        """
+        Обновляет кэш одного файла. Возвращает True, если кэш был перезаписан.
+        """
+        source_path = os.path.join(self.data_dir, file)
+        symbol = file[:-len(f"_{BASE_TIMEFRAME}.csv")]
+        target_path = os.path.join(self.timeframe_dir(timeframe), f"{symbol}_{timeframe}.csv")
+
+        if os.path.exists(target_path) and os.path.getmtime(target_path) >= os.path.getmtime(source_path):
+            return False
+
+        hourly = self.read_bars(source_path)
+        if not os.path.exists(target_path):
+            self.write_bars(self.resample(hourly, timeframe), target_path)
+            return True
+
+        cached = self.read_bars(target_path)
+        if cached.empty:
+            self.write_bars(self.resample(hourly, timeframe), target_path)
+            return True
+
+        # Последний бар кэша мог быть неполным — пересобираем его вместе с новыми часами
+        last_bucket = cached['timestamp'].iloc[-1]
+        fresh = self.resample(hourly[hourly['timestamp'] >= last_bucket], timeframe)
+        if fresh.empty:
+            os.utime(target_path)
+            return False
+
+        kept = cached[cached['timestamp'] < fresh['timestamp'].iloc[0]]
+        self.write_bars(pd.concat([kept, fresh], ignore_index=True), target_path)
+        return True
+
+    def update_all(self, timeframe):
+        """
+        Обновляет кэш таймфрейма для всех часовых файлов и возвращает директорию кэша.
+        """
+        if timeframe not in TIMEFRAMES:
+            raise ValueError(f"Неизвестный таймфрейм: {timeframe}. Доступны: {', '.join(TIMEFRAMES)}")
+
+        target_dir = self.timeframe_dir(timeframe)
+        if timeframe == BASE_TIMEFRAME:
+            return target_dir
+
+        os.makedirs(target_dir, exist_ok=True)
+        files = sorted(f for f in os.listdir(self.data_dir) if f.endswith(f"_{BASE_TIMEFRAME}.csv"))
+        updated = sum(self.update_symbol(file, timeframe) for file in tqdm(files, desc=f"Ресэмплинг {timeframe}"))
+        print(f"🕰 Таймфрейм {timeframe}: обновлено {updated} из {len(files)} файлов в {target_dir}")
+        return target_dir
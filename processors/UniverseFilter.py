@@ -0,0 +1,120 @@
+import os
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+from processors.TimeframeResampler import TIMEFRAMES, HOUR_MS, TimeframeResampler, resolve_timeframe_dir
+from utils.symbols import strip_timeframe
+
+
+class UniverseFilter:
+    """
+    Отбор торгуемой вселенной монет по ликвидности до генерации пар.
+
+    Коллектор сохраняет volume и turnover каждого бара, анализаторы же используют только close,
+    поэтому неликвидные контракты (1000000*, 10000* и т.п.) попадают в пары со всеми остальными,
+    а число пар растёт квадратично. По каждой монете за последние window баров считаются:
+    - median_turnover: медиана оборота бара (в USDT) — скользящая медиана на конце истории;
+    - completeness: доля присутствующих баров от ожидаемых в окне (пропуски = простои торгов);
+    - relative_tick: шаг цены (минимальное ненулевое изменение close) относительно медианной цены —
+      у грубых котировок спред пары определяется дискретностью цены, а не рынком.
+
+    Монета входит во вселенную, если проходит все пороги.
+    """
+
+    def __init__(self, data_dir, timeframe='h1', window=720, min_turnover=10_000, min_completeness=0.95,
+                 max_relative_tick=0.002):
+        self.data_dir = data_dir
+        self.timeframe = timeframe
+        self.window = window
+        self.min_turnover = min_turnover
+        self.min_completeness = min_completeness
+        self.max_relative_tick = max_relative_tick
+        self.metrics = pd.DataFrame()
+
+    @staticmethod
+    def relative_tick(close):
+        """
+        Шаг цены относительно медианной цены: минимальное ненулевое |Δclose| / median(close).
+        """
+        steps = np.abs(np.diff(close))
+        # Отсекаем шум представления float (0.1 + 0.2 и т.п.)
+        steps = steps[steps > 1e-12 * np.abs(close).max()] if len(close) else steps
+        if not len(steps):
+            return np.nan
+        return steps.min() / np.median(close)
+
+    def symbol_metrics(self, bars, end_ts):
+        """
+        Метрики одной монеты по барам формата коллектора; end_ts — конец окна (общий для всех монет), мс.
+        """
+        bar_ms = TIMEFRAMES[self.timeframe] * HOUR_MS
+        start_ts = end_ts - (self.window - 1) * bar_ms
+        recent = bars[bars['timestamp'] >= start_ts]
+        close = recent['close'].to_numpy(dtype=np.float64)
+        return {
+            'bars': len(recent),
+            'median_turnover': float(recent['turnover'].median()) if len(recent) else 0.0,
+            'completeness': len(recent) / self.window,
+            'relative_tick': self.relative_tick(close),
+        }
+
+    def compute(self):
+        directory = resolve_timeframe_dir(self.data_dir, self.timeframe)
+        suffix = f"_{self.timeframe}.csv"
+        files = sorted(f for f in os.listdir(directory) if f.endswith(suffix))
+        bars = {}
+        for file in tqdm(files, desc="Ликвидность монет"):
+            df = TimeframeResampler.read_bars(os.path.join(directory, file))
+            if not df.empty:
+                bars[strip_timeframe(file[:-len(".csv")])] = df[['timestamp', 'close', 'turnover']]
+
+        if not bars:
+            self.metrics = pd.DataFrame(columns=['symbol', 'bars', 'median_turnover', 'completeness',
+                                                 'relative_tick', 'selected'])
+            return self.metrics
+
+        # Окно заканчивается на последнем баре всей вселенной: делистнутые монеты получают низкую полноту
+        end_ts = max(int(df['timestamp'].iloc[-1]) for df in bars.values())
+        rows = [{'symbol': symbol, **self.symbol_metrics(df, end_ts)} for symbol, df in bars.items()]
+        metrics = pd.DataFrame(rows)
+        metrics['selected'] = (
+            (metrics['median_turnover'] >= self.min_turnover)
+            & (metrics['completeness'] >= self.min_completeness)
+            & (metrics['relative_tick'] <= self.max_relative_tick)
+        )
+        self.metrics = metrics.sort_values('median_turnover', ascending=False).reset_index(drop=True)
+        return self.metrics
+
+    def run(self):
+        """
+        Считает метрики и возвращает список монет вселенной (без суффикса таймфрейма).
+        """
+        metrics = self.compute()
+        selected = metrics[metrics['selected']]
+        n_all, n_sel = len(metrics), len(selected)
+        pairs_all, pairs_sel = n_all * (n_all - 1) // 2, n_sel * (n_sel - 1) // 2
+        removed = 1 - pairs_sel / pairs_all if pairs_all else 0.0
+        print(f"🌐 Вселенная: {n_sel} из {n_all} монет "
+              f"(оборот ≥ {self.min_turnover}, полнота ≥ {self.min_completeness}, тик ≤ {self.max_relative_tick})")
+        print(f"✂️ Пар к проверке: {pairs_sel} вместо {pairs_all} (−{removed:.1%} работы)")
+        rejected = metrics[~metrics['selected']]
+        if len(rejected):
+            reasons = {
+                'оборот': int((rejected['median_turnover'] < self.min_turnover).sum()),
+                'полнота': int((rejected['completeness'] < self.min_completeness).sum()),
+                'тик': int((~(rejected['relative_tick'] <= self.max_relative_tick)).sum()),
+            }
+            print("   Отсеяно по критериям: " + ", ".join(f"{k}: {v}" for k, v in reasons.items()))
+        return list(selected['symbol'])
+
+    def save(self, filepath="universe.csv"):
+        self.metrics.to_csv(filepath, index=False)
+        print(f"💾 Метрики вселенной сохранены в {filepath}")
+
+    @staticmethod
+    def load_selected(filepath):
+        """
+        Список монет вселенной из ранее сохранённого файла.
+        """
+        df = pd.read_csv(filepath)
+        return list(df.loc[df['selected'].astype(bool), 'symbol'])
@@ -0,0 +1,222 @@
+import os
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+from processors.AlignedPanel import AlignedPanel
+from processors.TimeframeResampler import resolve_timeframe_dir
+from utils.symbols import split_pair, strip_timeframe
+
+
+def stationary_bootstrap_indices(n, n_resamples, mean_block, rng):
+    """
+    Индексы стационарного блочного бутстрапа (Politis-Romano) для n_resamples путей длины n:
+    блоки начинаются в случайной точке, длина блока геометрическая со средним mean_block,
+    ряд замыкается в кольцо.
+    """
+    t = np.arange(n)
+    new_block = rng.random((n_resamples, n)) < 1.0 / mean_block
+    new_block[:, 0] = True
+    starts = rng.integers(0, n, size=(n_resamples, n))
+    block_t = np.maximum.accumulate(np.where(new_block, t, 0), axis=1)
+    return (np.take_along_axis(starts, block_t, axis=1) + t - block_t) % n
+
+
+def rolling_zscore(paths, window):
+    """
+    Скользящий z-score по строкам (как rolling(window).mean()/std() в pandas, ddof=1).
+    """
+    centered = paths - np.nanmean(paths, axis=1, keepdims=True)
+    filled = np.nan_to_num(centered)
+    cs = np.zeros((len(paths), paths.shape[1] + 1))
+    cs2 = np.zeros_like(cs)
+    np.cumsum(filled, axis=1, out=cs[:, 1:])
+    np.cumsum(filled ** 2, axis=1, out=cs2[:, 1:])
+    s1 = cs[:, window:] - cs[:, :-window]
+    s2 = cs2[:, window:] - cs2[:, :-window]
+    z = np.full(paths.shape, np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = s1 / window
+        std = np.sqrt(np.maximum(s2 - s1 * mean, 0) / (window - 1))
+        z[:, window - 1:] = (centered[:, window - 1:] - mean) / std
+    return z
+
+
+def zscore_strategy(spread, z, start, z_entry=-2, z_exit=0):
+    """
+    Стратегия PairTradingSimulatorCoin.simulate_pair сразу для всех строк:
+    вход в лонг спреда при z < z_entry, выход при z >= z_exit, торговля с бара start (по строкам).
+    PnL сделки — изменение спреда y - beta * x между входом и выходом.
+
+    Возвращает (total_pnl, trades, wins, max_drawdown) по строкам; просадка считается
+    по кривой капитала с переоценкой открытой позиции.
+    """
+    rows = len(spread)
+    in_position = np.zeros(rows, dtype=bool)
+    entry = np.zeros(rows)
+    realized = np.zeros(rows)
+    trades = np.zeros(rows, dtype=np.int64)
+    wins = np.zeros(rows, dtype=np.int64)
+    peak = np.zeros(rows)
+    max_drawdown = np.zeros(rows)
+
+    for t in range(int(start.min()), spread.shape[1]):
+        zt, st = z[:, t], spread[:, t]
+        allowed = start <= t
+        close = in_position & (zt >= z_exit) & allowed
+        pnl = st - entry
+        realized += np.where(close, pnl, 0.0)
+        trades += close
+        wins += close & (pnl > 0)
+        open_ = ~in_position & (zt < z_entry) & allowed
+        in_position = (in_position & ~close) | open_
+        entry = np.where(open_, st, entry)
+        equity = realized + np.where(in_position, st - entry, 0.0)
+        np.maximum(peak, equity, out=peak)
+        np.maximum(max_drawdown, peak - equity, out=max_drawdown)
+    return realized, trades, wins, max_drawdown
+
+
+class BootstrapRobustnessTester:
+    """
+    Проверка устойчивости результатов симуляции стационарным блочным бутстрапом.
+
+    run_batch симулятора даёт одну траекторию на пару. Здесь приращения спреда пары
+    (y - beta * x, beta — та же регрессия, что в симуляторе) пересобираются
+    n_resamples раз блоками средней длины mean_block баров (сохраняется автокорреляция),
+    и на каждом пути заново прогоняется та же z-score стратегия.
+
+    Все пути нескольких пар обрабатываются одним массивом [пути × бары]
+    (пачками не больше max_cells ячеек), цикл идёт только по времени.
+    Для каждой пары сообщаются доверительные интервалы PnL, доли прибыльных сделок и просадки.
+    """
+
+    def __init__(self, data_dir, timeframe='h1', n_resamples=2000, mean_block=24, confidence=0.95,
+                 z_entry=-2, z_exit=0, z_window=30, max_cells=20_000_000, seed=42, min_data_points=100):
+        self.data_dir = data_dir
+        self.timeframe = timeframe
+        self.n_resamples = n_resamples
+        self.mean_block = mean_block
+        self.confidence = confidence
+        self.z_entry = z_entry
+        self.z_exit = z_exit
+        self.z_window = z_window
+        self.max_cells = max_cells
+        self.seed = seed
+        self.min_data_points = min_data_points
+        self.panel = None
+        self.results = pd.DataFrame()
+
+    def load_panel(self):
+        self.panel = AlignedPanel.from_dir(resolve_timeframe_dir(self.data_dir, self.timeframe),
+                                           strip_suffix=f'_{self.timeframe}')
+
+    @staticmethod
+    def _pair_assets(pairs_df):
+        if 'asset_a' in pairs_df.columns and 'asset_b' in pairs_df.columns:
+            return [(strip_timeframe(a), strip_timeframe(b)) for a, b in zip(pairs_df['asset_a'], pairs_df['asset_b'])]
+        return [split_pair(p) for p in pairs_df['pair']]
+
+    def pair_spread(self, symbol1, symbol2):
+        """
+        Спред пары по общим барам, как в симуляторе: close_1 - beta * close_2 (beta из OLS с константой).
+        """
+        _, y, x = self.panel.pair_view(symbol1, symbol2)
+        beta = np.cov(x, y, ddof=0)[0, 1] / np.var(x) if len(x) > 1 and np.var(x) > 0 else np.nan
+        return y - beta * x, beta
+
+    def _paths(self, spread, rng):
+        """
+        n_resamples путей спреда: первое значение исходное, далее пересобранные блоками приращения.
+        """
+        diffs = np.diff(spread)
+        idx = stationary_bootstrap_indices(len(diffs), self.n_resamples, self.mean_block, rng)
+        paths = np.empty((self.n_resamples, len(spread)))
+        paths[:, 0] = spread[0]
+        paths[:, 1:] = spread[0] + np.cumsum(diffs[idx], axis=1)
+        return paths
+
+    def _summarize(self, pnl, trades, wins, drawdown):
+        alpha = (1 - self.confidence) / 2
+        low, high = 100 * alpha, 100 * (1 - alpha)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            win_rate = np.where(trades > 0, wins / trades * 100, np.nan)
+        return {
+            'pnl_mean': pnl.mean(),
+            'pnl_ci_low': np.percentile(pnl, low),
+            'pnl_ci_high': np.percentile(pnl, high),
+            'prob_positive': (pnl > 0).mean(),
+            'win_rate_mean': np.nanmean(win_rate) if np.isfinite(win_rate).any() else np.nan,
+            'win_rate_ci_low': np.nanpercentile(win_rate, low) if np.isfinite(win_rate).any() else np.nan,
+            'win_rate_ci_high': np.nanpercentile(win_rate, high) if np.isfinite(win_rate).any() else np.nan,
+            'drawdown_median': np.median(drawdown),
+            'drawdown_ci_high': np.percentile(drawdown, high),
+            'trades_mean': trades.mean(),
+        }
+
+    def _run_chunk(self, chunk):
+        """
+        chunk — список (строка результата, пути спреда). Пути разной длины выравниваются по концу.
+        """
+        length = max(paths.shape[1] for _, paths in chunk)
+        spread = np.full((sum(len(paths) for _, paths in chunk), length), np.nan)
+        start = np.empty(len(spread), dtype=np.int64)
+        offset = 0
+        for _, paths in chunk:
+            pad = length - paths.shape[1]
+            spread[offset:offset + len(paths), pad:] = paths
+            # Как в simulate_pair: торговля с бара z_window исходного ряда
+            start[offset:offset + len(paths)] = pad + self.z_window
+            offset += len(paths)
+
+        z = rolling_zscore(spread, self.z_window)
+        pnl, trades, wins, drawdown = zscore_strategy(spread, z, start, self.z_entry, self.z_exit)
+
+        offset = 0
+        for row, paths in chunk:
+            part = slice(offset, offset + len(paths))
+            row.update(self._summarize(pnl[part], trades[part], wins[part], drawdown[part]))
+            offset += len(paths)
+
+    def run(self, pairs_df):
+        """
+        pairs_df — результаты симуляции (столбец 'pair' вида 'A_B') или пары asset_a/asset_b.
+        Возвращает DataFrame с интервалами; robust=True, если нижняя граница PnL выше нуля.
+        """
+        if self.panel is None:
+            self.load_panel()
+        rng = np.random.default_rng(self.seed)
+
+        rows, chunk, cells = [], [], 0
+        pairs = self._pair_assets(pairs_df)
+        for symbol1, symbol2 in tqdm(pairs, desc="Блочный бутстрап"):
+            row = {'pair': f"{symbol1}_{symbol2}"}
+            rows.append(row)
+            if symbol1 not in self.panel or symbol2 not in self.panel \
+                    or self.panel.overlap_count(symbol1, symbol2) < max(self.min_data_points, self.z_window + 2):
+                continue
+            spread, beta = self.pair_spread(symbol1, symbol2)
+            row['beta'] = beta
+            paths = self._paths(spread, rng)
+            chunk.append((row, paths))
+            cells += paths.size
+            if cells >= self.max_cells:
+                self._run_chunk(chunk)
+                chunk, cells = [], 0
+        if chunk:
+            self._run_chunk(chunk)
+
+        self.results = pd.DataFrame(rows)
+        if 'pnl_ci_low' in self.results.columns:
+            self.results['robust'] = self.results['pnl_ci_low'] > 0
+            self.results = self.results.sort_values('pnl_ci_low', ascending=False).reset_index(drop=True)
+            print(f"🎲 Бутстрап ({self.n_resamples} путей, блок ~{self.mean_block} баров): "
+                  f"устойчиво прибыльных пар {int(self.results['robust'].sum())} из {len(self.results)}")
+        return self.results
+
+    def save_results(self, filepath="report_data_coin_method/bootstrap_robustness.csv"):
+        if self.results.empty:
+            print("⚠️ Нет результатов для сохранения.")
+            return
+        os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+        self.results.to_csv(filepath, index=False)
+        print(f"💾 Интервалы устойчивости сохранены в {filepath}")
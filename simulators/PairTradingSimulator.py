@@ -2,11 +2,14 @@ import pandas as pd
 from matplotlib import pyplot as plt
 from sklearn.linear_model import LinearRegression
 import os
+from processors.TimeframeResampler import resolve_timeframe_dir
 
 
 class PairTradingSimulator:
-    def __init__(self, data_dir, save_dir="report_data_corr_method"):
+    def __init__(self, data_dir, save_dir="report_data_corr_method", timeframe='h1'):
         self.data_dir = data_dir
+        self.timeframe = timeframe
+        self._timeframe_dir = None
         self.save_dir = save_dir
         self.beta = None
         self.trades_df = None
@@ -14,10 +17,16 @@ class PairTradingSimulator:
         os.makedirs(self.save_dir, exist_ok=True)
         print(f"📁 Папка для данных создана: {self.save_dir}")
 
+    def timeframe_dir(self):
+        """Директория с CSV выбранного таймфрейма (кэш старших таймфреймов обновляется один раз)."""
+        if self._timeframe_dir is None:
+            self._timeframe_dir = resolve_timeframe_dir(self.data_dir, self.timeframe)
+        return self._timeframe_dir
+
     def load_data(self, symbol1, symbol2):
         """Загрузка данных из директории по названию символов."""
-        path1 = os.path.join(self.data_dir, f"{symbol1}_h1.csv")
-        path2 = os.path.join(self.data_dir, f"{symbol2}_h1.csv")
+        path1 = os.path.join(self.timeframe_dir(), f"{symbol1}_{self.timeframe}.csv")
+        path2 = os.path.join(self.timeframe_dir(), f"{symbol2}_{self.timeframe}.csv")
 
         df1 = pd.read_csv(path1, parse_dates=['timestamp'])
         df2 = pd.read_csv(path2, parse_dates=['timestamp'])
@@ -1,78 +1,125 @@
 import os
+import numpy as np
 import pandas as pd
 from matplotlib import pyplot as plt
 from sklearn.linear_model import LinearRegression
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from tqdm import tqdm
+from processors.AlignedPanel import AlignedPanel
+from processors.TimeframeResampler import resolve_timeframe_dir
+from utils.executor import StageExecutor
+from utils.symbols import SymbolDictionary, pair_name_columns
 
 class PairTradingSimulatorCoin:
-    def __init__(self, data_dir, pairs_file, save_dir="report_data_coin_method"):
+    def __init__(self, data_dir, pairs_file, save_dir="report_data_coin_method", min_data_points=100,
+                 timeframe='h1', max_workers=None, backend='auto'):
         self.data_dir = data_dir
+        self.timeframe = timeframe
+        self._timeframe_dir = None
         self.pairs_file = pairs_file
         self.save_dir = save_dir
+        self.min_data_points = min_data_points
+        self.max_workers = max_workers
+        self.backend = backend
+        self.panel = None
+        self.results = pd.DataFrame()
         os.makedirs(self.save_dir, exist_ok=True)
         print(f"📁 Папка для результатов: {self.save_dir}")
 
+    def timeframe_dir(self):
+        """Директория с CSV выбранного таймфрейма (кэш старших таймфреймов обновляется один раз)."""
+        if self._timeframe_dir is None:
+            self._timeframe_dir = resolve_timeframe_dir(self.data_dir, self.timeframe)
+        return self._timeframe_dir
+
     def load_data(self, symbol1, symbol2):
-        path1 = os.path.join(self.data_dir, f"{symbol1}_h1.csv")
-        path2 = os.path.join(self.data_dir, f"{symbol2}_h1.csv")
+        path1 = os.path.join(self.timeframe_dir(), f"{symbol1}_{self.timeframe}.csv")
+        path2 = os.path.join(self.timeframe_dir(), f"{symbol2}_{self.timeframe}.csv")
 
         df1 = pd.read_csv(path1, parse_dates=['timestamp'])
         df2 = pd.read_csv(path2, parse_dates=['timestamp'])
         return df1, df2
 
+    def load_panel(self, symbols):
+        """
+        Читает монеты symbols (без суффикса таймфрейма) в выровненную панель один раз:
+        дальше load_merged берёт пары срезом панели, а не чтением двух CSV на пару.
+        """
+        self.panel = AlignedPanel.from_dir(self.timeframe_dir(), strip_suffix=f'_{self.timeframe}', symbols=symbols)
+        return self.panel
+
+    def load_merged(self, symbol1, symbol2):
+        """
+        Общие бары пары: индексный срез выровненной панели, если она загружена, иначе merge CSV-файлов.
+        """
+        if self.panel is not None:
+            return self.panel.pair_frame(symbol1, symbol2, suffixes=(f'_{symbol1}', f'_{symbol2}')).reset_index()
+
+        df1, df2 = self.load_data(symbol1, symbol2)
+        return pd.merge(
+            df1[['timestamp', 'close']],
+            df2[['timestamp', 'close']],
+            on='timestamp',
+            suffixes=(f'_{symbol1}', f'_{symbol2}')
+        ).dropna().sort_values('timestamp')
+
+    def spread_trades(self, symbol1, symbol2, z_entry=-2, z_exit=0, z_window=30):
+        """
+        Спред пары, его z-score и сделки стратегии: (merged со столбцами spread/zscore, beta, сделки).
+        """
+        merged = self.load_merged(symbol1, symbol2)
+
+        X = merged[[f'close_{symbol2}']]
+        y = merged[f'close_{symbol1}']
+        reg = LinearRegression().fit(X, y)
+        beta = reg.coef_[0]
+
+        merged['spread'] = y - beta * X.squeeze()
+        merged['zscore'] = (merged['spread'] - merged['spread'].rolling(z_window).mean()) / merged['spread'].rolling(z_window).std()
+
+        # Проход по барам идёт по numpy-массивам: .iloc на каждом баре стоил больше самой стратегии
+        z = merged['zscore'].to_numpy()
+        a = merged[f'close_{symbol1}'].to_numpy()
+        b = merged[f'close_{symbol2}'].to_numpy()
+        in_position = False
+        entry_idx = None
+        trades = []
+
+        for i in range(z_window, len(merged)):
+            if not in_position and z[i] < z_entry:
+                in_position = True
+                entry_idx = i
+            elif in_position and z[i] >= z_exit:
+                exit_idx = i
+                a_pnl = a[exit_idx] - a[entry_idx]
+                b_pnl = -(b[exit_idx] - b[entry_idx]) * beta
+                total_pnl = a_pnl + b_pnl
+
+                trades.append({
+                    "entry": merged['timestamp'].iloc[entry_idx],
+                    "exit": merged['timestamp'].iloc[exit_idx],
+                    "total_pnl": total_pnl
+                })
+                in_position = False
+        return merged, beta, trades
+
+    def pair_stats(self, symbol1, symbol2, z_entry=-2, z_exit=0, z_window=30):
+        """
+        Итоги стратегии по паре: (сделок, суммарный PnL, средний PnL, доля прибыльных, beta).
+        """
+        merged, beta, trades = self.spread_trades(symbol1, symbol2, z_entry, z_exit, z_window)
+        if not trades:
+            return 0, 0.0, 0.0, 0.0, beta
+        total = sum(t['total_pnl'] for t in trades)
+        win_rate = sum(t['total_pnl'] > 0 for t in trades) / len(trades)
+        return len(trades), total, total / len(trades), win_rate, beta
+
     def simulate_pair(self, symbol1, symbol2, z_entry=-2, z_exit=0, z_window=30):
         try:
-            df1, df2 = self.load_data(symbol1, symbol2)
-            merged = pd.merge(
-                df1[['timestamp', 'close']],
-                df2[['timestamp', 'close']],
-                on='timestamp',
-                suffixes=(f'_{symbol1}', f'_{symbol2}')
-            ).dropna().sort_values('timestamp')
-
-            X = merged[[f'close_{symbol2}']]
-            y = merged[f'close_{symbol1}']
-            reg = LinearRegression().fit(X, y)
-            beta = reg.coef_[0]
-
-            merged['spread'] = y - beta * X.squeeze()
-            merged['zscore'] = (merged['spread'] - merged['spread'].rolling(z_window).mean()) / merged['spread'].rolling(z_window).std()
-
-            in_position = False
-            entry_idx = None
-            trades = []
-
-            for i in range(z_window, len(merged)):
-                z = merged['zscore'].iloc[i]
-                if not in_position and z < z_entry:
-                    in_position = True
-                    entry_idx = i
-                elif in_position and z >= z_exit:
-                    exit_idx = i
-                    a_entry = merged[f'close_{symbol1}'].iloc[entry_idx]
-                    a_exit = merged[f'close_{symbol1}'].iloc[exit_idx]
-                    b_entry = merged[f'close_{symbol2}'].iloc[entry_idx]
-                    b_exit = merged[f'close_{symbol2}'].iloc[exit_idx]
-
-                    a_pnl = a_exit - a_entry
-                    b_pnl = -(b_exit - b_entry) * beta
-                    total_pnl = a_pnl + b_pnl
-
-                    trades.append({
-                        "entry": merged['timestamp'].iloc[entry_idx],
-                        "exit": merged['timestamp'].iloc[exit_idx],
-                        "total_pnl": total_pnl
-                    })
-                    in_position = False
-
-            if trades:
-                total = sum(t['total_pnl'] for t in trades)
-                avg = total / len(trades)
-                win_rate = sum(t['total_pnl'] > 0 for t in trades) / len(trades)
+            n_trades, total, avg, win_rate, beta = self.pair_stats(symbol1, symbol2, z_entry, z_exit, z_window)
+
+            if n_trades:
                 return {
                     "pair": f"{symbol1}_{symbol2}",
-                    "trades": len(trades),
+                    "trades": n_trades,
                     "total_pnl": round(total, 2),
                     "avg_pnl": round(avg, 2),
                     "win_rate": round(win_rate * 100, 2),
@@ -84,37 +131,66 @@ class PairTradingSimulatorCoin:
         except Exception as e:
             return {"pair": f"{symbol1}_{symbol2}", "error": str(e)}
 
-    def run_batch(self):
-        pairs_df = pd.read_csv(self.pairs_file)
-        results = []
-
-        with ThreadPoolExecutor(max_workers=4) as executor:
-            futures = [
-                executor.submit(
-                    self.simulate_pair,
-                    row['asset_a'].replace('_h1', ''),
-                    row['asset_b'].replace('_h1', '')
-                )
-                for _, row in pairs_df.iterrows()
-            ]
-
-            for future in tqdm(as_completed(futures), total=len(futures), desc="Simulating pairs"):
-                results.append(future.result())
+    def _simulate(self, task):
+        # task — (позиция, строка монеты a, строка монеты b) панели; ошибки пары дают None
+        _, i, j = task
+        try:
+            return self.pair_stats(self.panel.symbols[i], self.panel.symbols[j])
+        except Exception:
+            return None
+
+    def run_batch(self, pairs_df=None):
+        """
+        Симулирует все пары из pairs_df (по умолчанию — из pairs_file).
+        В self.results остаются все пары со сделками, возвращаются пары с доходностью не ниже средней.
+        """
+        if pairs_df is None:
+            pairs_df = pd.read_csv(self.pairs_file)
+        self.results = pd.DataFrame()
+
+        # Читаются только монеты из пар, каждая один раз; пары разбираются в int32-идентификаторы
+        # строк панели, пары без данных или без достаточного пересечения отбрасываются до симуляции
+        names_a, names_b = pair_name_columns(pairs_df, asset_keys=('asset_a', 'asset_b'))
+        self.load_panel(set(names_a) | set(names_b))
+        pairs = SymbolDictionary.from_panel(self.panel).encode_pairs(pairs_df, asset_keys=('asset_a', 'asset_b'))
+        known = pairs.known
+        keep = known.copy()
+        keep[known] = self.panel.overlap_counts[pairs.a[known], pairs.b[known]] >= self.min_data_points
+        if not keep.all():
+            print(f"⚠️ Пропущено пар: {int((~keep).sum())} из {len(keep)} — нет данных монеты: "
+                  f"{int((~known).sum())}, общих баров меньше {self.min_data_points}: {int((known & ~keep).sum())}")
+        pairs = pairs.take(keep)
+
+        # Итоги пар копятся столбцами, строки с именами собираются только для отчёта
+        n_trades = np.zeros(len(pairs), dtype=np.int64)
+        stats = np.full((len(pairs), 4), np.nan)
+        tasks = [(k, int(i), int(j)) for k, (i, j) in enumerate(pairs)]
+        # Проход по барам держит GIL: backend='auto' — процессы, панель урезана до монет пар
+        executor = StageExecutor(backend=self.backend, max_workers=self.max_workers)
+        for (k, _, _), result in executor.map(self._simulate, tasks, desc="Simulating pairs"):
+            if result is not None:
+                n_trades[k] = result[0]
+                stats[k] = result[1:]
 
         # Исключаем результаты с ошибками
-        filtered_results = [res for res in results if 'error' not in res and 'total_pnl' in res]
-
-        if not filtered_results:
+        if np.isnan(stats[:, 0]).all():
             print("⚠️ Нет корректных результатов. Проверь данные.")
             return
 
-        results_df = pd.DataFrame(filtered_results)
-        valid_results = results_df[results_df['trades'] > 0]
-
-        if valid_results.empty:
+        traded = np.flatnonzero(n_trades > 0)
+        if not len(traded):
             print("⚠️ Нет пар с выполненными сделками. Ничего не сохранено.")
             return
 
+        self.results = pd.DataFrame({
+            "pair": pairs.take(traded).labels(sep='_'),
+            "trades": n_trades[traded],
+            "total_pnl": stats[traded, 0].round(2),
+            "avg_pnl": stats[traded, 1].round(2),
+            "win_rate": (stats[traded, 2] * 100).round(2),
+            "beta": stats[traded, 3].round(4),
+        })
+        valid_results = self.results
         avg_total_pnl = valid_results['total_pnl'].mean()
         print(f"📊 Средняя доходность по всем парам: {avg_total_pnl:.2f}")
 
@@ -122,6 +198,7 @@ class PairTradingSimulatorCoin:
 
         filtered_df.to_csv(os.path.join(self.save_dir, "pair_trading_results.csv"), index=False)
         print("✅ Отфильтрованные результаты сохранены в", os.path.join(self.save_dir, "pair_trading_results.csv"))
+        return filtered_df
 
 if __name__ == "__main__":
     sim = PairTradingSimulatorCoin(
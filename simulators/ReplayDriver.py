@@ -0,0 +1,262 @@
+import os
+import time
+from collections import deque
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+from processors.AlignedPanel import AlignedPanel
+from processors.TimeframeResampler import TIMEFRAMES, resolve_timeframe_dir
+from utils.symbols import split_pair, strip_timeframe
+
+
+class OnlinePairState:
+    """
+    Состояние одной пары в живом режиме: обновляется по одному общему бару.
+
+    - z-score спреда y - beta * x по скользящему окну z_window и та же стратегия,
+      что в PairTradingSimulatorCoin.spread_trades: вход при z < z_entry, выход при z >= z_exit;
+    - расхождение CorrAnalyzer: z-score спреда a - b по всей истории пары
+      (среднее и дисперсия по Уэлфорду), сигнал при выходе |z| за zscore_threshold.
+
+    beta='batch' — beta задана заранее (как в симуляторе, по всей истории: совпадает с пакетным расчётом),
+    beta=None — оценивается онлайн по накопленным суммам регрессии (без заглядывания в будущее).
+    """
+
+    __slots__ = ('pair', 'beta', 'fixed_beta', 'z_window', 'z_entry', 'z_exit', 'zscore_threshold',
+                 'spreads', 'n', 'sums', 'in_position', 'entry', 'trades',
+                 'corr_n', 'corr_mean', 'corr_m2', 'corr_z', 'diverged')
+
+    def __init__(self, pair, beta=None, z_window=30, z_entry=-2, z_exit=0, zscore_threshold=2):
+        self.pair = pair
+        self.fixed_beta = beta is not None
+        self.beta = beta
+        self.z_window = z_window
+        self.z_entry = z_entry
+        self.z_exit = z_exit
+        self.zscore_threshold = zscore_threshold
+        self.spreads = deque(maxlen=z_window)
+        self.n = 0
+        # Суммы для онлайн-регрессии y = alpha + beta * x: n, Σx, Σy, Σxx, Σxy
+        self.sums = np.zeros(4)
+        self.in_position = False
+        self.entry = None
+        self.trades = []
+        self.corr_n = 0
+        self.corr_mean = 0.0
+        self.corr_m2 = 0.0
+        self.corr_z = np.nan
+        self.diverged = False
+
+    def _update_beta(self, y, x):
+        self.sums += (x, y, x * x, x * y)
+        n = self.n + 1
+        sx, sy, sxx, sxy = self.sums
+        var = sxx - sx * sx / n
+        if var > 0:
+            self.beta = (sxy - sx * sy / n) / var
+
+    def update(self, ts, y, x):
+        """
+        Новый общий бар пары (y — первая монета, x — вторая). Возвращает список сигналов.
+        """
+        signals = []
+        if not self.fixed_beta:
+            self._update_beta(y, x)
+        i = self.n
+        self.n += 1
+
+        # Расхождение по CorrAnalyzer.compute_latest_zscore: спред a - b относительно всей истории
+        d = y - x
+        self.corr_n += 1
+        delta = d - self.corr_mean
+        self.corr_mean += delta / self.corr_n
+        self.corr_m2 += delta * (d - self.corr_mean)
+        if self.corr_n > 1 and self.corr_m2 > 0:
+            self.corr_z = (d - self.corr_mean) / np.sqrt(self.corr_m2 / (self.corr_n - 1))
+            diverged = abs(self.corr_z) > self.zscore_threshold
+            if diverged and not self.diverged:
+                signals.append({'timestamp': ts, 'pair': self.pair, 'signal': 'divergence', 'zscore': self.corr_z})
+            self.diverged = diverged
+
+        if self.beta is None:
+            return signals
+        spread = y - self.beta * x
+        self.spreads.append(spread)
+        if i < self.z_window:
+            return signals
+
+        window = np.fromiter(self.spreads, dtype=np.float64, count=len(self.spreads))
+        std = window.std(ddof=1)
+        z = (spread - window.mean()) / std if std > 0 else np.nan
+        if not self.in_position and z < self.z_entry:
+            self.in_position = True
+            self.entry = (ts, y, x)
+            signals.append({'timestamp': ts, 'pair': self.pair, 'signal': 'entry', 'zscore': z})
+        elif self.in_position and z >= self.z_exit:
+            entry_ts, y0, x0 = self.entry
+            pnl = (y - y0) - (x - x0) * self.beta
+            self.trades.append({'entry': entry_ts, 'exit': ts, 'total_pnl': pnl})
+            self.in_position = False
+            signals.append({'timestamp': ts, 'pair': self.pair, 'signal': 'exit', 'zscore': z, 'pnl': pnl})
+        return signals
+
+
+class ReplayDriver:
+    """
+    Ускоренное воспроизведение истории для живого пути сигналов.
+
+    Сохранённые бары из data_dir идут строго по возрастанию времени, по одному бару оси
+    (все монеты, у которых есть бар в этот час), и подаются в онлайн-состояния пар
+    (OnlinePairState) так, будто приходят с биржи. speed — во сколько раз быстрее реального
+    времени (час при speed=3600 проходит за секунду); None — максимальная скорость.
+
+    На каждом баре измеряется задержка обработки (все пары бара), записываются сигналы
+    (вход/выход z-score стратегии симулятора, расхождение CorrAnalyzer) и сделки,
+    поэтому пропускная способность измерима, а онлайн-результат сверяется с пакетным (compare_batch).
+    """
+
+    def __init__(self, data_dir, pairs_df, timeframe='h1', z_entry=-2, z_exit=0, z_window=30,
+                 zscore_threshold=2, beta='batch', speed=None):
+        self.data_dir = data_dir
+        self.timeframe = timeframe
+        self.z_entry = z_entry
+        self.z_exit = z_exit
+        self.z_window = z_window
+        self.zscore_threshold = zscore_threshold
+        self.beta = beta
+        self.speed = speed
+        self.pairs = self._pair_assets(pairs_df)
+        self.panel = None
+        self.states = {}
+        self.signals = []
+        self.latency = np.empty(0)
+        self.elapsed = 0.0
+
+    @staticmethod
+    def _pair_assets(pairs_df):
+        if 'asset_a' in pairs_df.columns and 'asset_b' in pairs_df.columns:
+            return [(strip_timeframe(a), strip_timeframe(b)) for a, b in zip(pairs_df['asset_a'], pairs_df['asset_b'])]
+        return [split_pair(p) for p in pairs_df['pair']]
+
+    def load_panel(self):
+        symbols = {s for pair in self.pairs for s in pair}
+        self.panel = AlignedPanel.from_dir(resolve_timeframe_dir(self.data_dir, self.timeframe),
+                                           strip_suffix=f'_{self.timeframe}', symbols=symbols)
+
+    def _batch_beta(self, a, b):
+        """
+        beta по всей истории пары, как в симуляторе (OLS с константой).
+        """
+        _, y, x = self.panel.pair_view(a, b)
+        return np.cov(x, y, ddof=0)[0, 1] / np.var(x) if len(x) > 1 and np.var(x) > 0 else np.nan
+
+    def _init_states(self):
+        self.states = {}
+        for a, b in self.pairs:
+            if a not in self.panel or b not in self.panel:
+                continue
+            beta = self._batch_beta(a, b) if self.beta == 'batch' else None
+            self.states[(a, b)] = OnlinePairState(f"{a}_{b}", beta, self.z_window, self.z_entry, self.z_exit,
+                                                  self.zscore_threshold)
+
+    def run(self, max_bars=None):
+        """
+        Воспроизводит историю (не больше max_bars баров оси) и возвращает DataFrame сигналов.
+        """
+        if self.panel is None:
+            self.load_panel()
+        self._init_states()
+
+        index = self.panel.index
+        members = [(index[a], index[b], state) for (a, b), state in self.states.items()]
+        ia = np.array([m[0] for m in members], dtype=np.int64)
+        ib = np.array([m[1] for m in members], dtype=np.int64)
+        values, mask = self.panel.values, self.panel.mask
+        timestamps = pd.DatetimeIndex(self.panel.timestamps)
+        n_bars = len(timestamps) if max_bars is None else min(max_bars, len(timestamps))
+        bar_seconds = TIMEFRAMES[self.timeframe] * 3600 / self.speed if self.speed else 0.0
+
+        self.signals = []
+        latency = np.empty(n_bars)
+        start = time.perf_counter()
+        for t in tqdm(range(n_bars), desc="Воспроизведение баров"):
+            if bar_seconds:
+                # Бар t «приходит» в момент start + t * bar_seconds (без накопления дрейфа)
+                delay = start + t * bar_seconds - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            received = time.perf_counter()
+            ts = timestamps[t]
+            column, valid = values[:, t], mask[:, t]
+            for k in np.flatnonzero(valid[ia] & valid[ib]):
+                self.signals.extend(members[k][2].update(ts, column[ia[k]], column[ib[k]]))
+            latency[t] = time.perf_counter() - received
+        self.elapsed = time.perf_counter() - start
+        self.latency = latency
+
+        summary = self.summary()
+        print(f"⏯ Воспроизведено {summary['bars']} баров по {len(self.states)} парам за {self.elapsed:.2f} с "
+              f"({summary['bars_per_sec']:.0f} баров/с), задержка бара p50 {summary['latency_p50_us']:.0f} мкс, "
+              f"p99 {summary['latency_p99_us']:.0f} мкс; сигналов: {len(self.signals)}")
+        return pd.DataFrame(self.signals)
+
+    def summary(self):
+        lat = self.latency * 1e6
+        has = len(lat) > 0
+        return {
+            'bars': len(lat),
+            'pairs': len(self.states),
+            'elapsed_sec': self.elapsed,
+            'bars_per_sec': len(lat) / self.elapsed if self.elapsed else np.nan,
+            'latency_p50_us': np.percentile(lat, 50) if has else np.nan,
+            'latency_p99_us': np.percentile(lat, 99) if has else np.nan,
+            'latency_max_us': lat.max() if has else np.nan,
+            'signals': len(self.signals),
+        }
+
+    def compare_batch(self, simulator=None):
+        """
+        Сверка онлайн-результата с пакетным по каждой паре:
+        сделки против PairTradingSimulatorCoin.spread_trades и последний z-score расхождения
+        против CorrAnalyzer.compute_latest_zscore по всей истории пары.
+        Полное совпадение ожидается при beta='batch' и воспроизведении всей истории.
+        """
+        from analyzers.CorrAnalyzer import CorrAnalyzer
+        from simulators.PairTradingSimulatorCoin import PairTradingSimulatorCoin
+
+        if simulator is None:
+            simulator = PairTradingSimulatorCoin(self.data_dir, pairs_file=None, timeframe=self.timeframe)
+        simulator.panel = self.panel
+        rows = []
+        for (a, b), state in self.states.items():
+            _, batch_trades = simulator.spread_trades(a, b, self.z_entry, self.z_exit, self.z_window)[1:]
+            _, close_a, close_b = self.panel.pair_view(a, b)
+            batch_z = CorrAnalyzer.compute_latest_zscore(None, pd.Series(close_a), pd.Series(close_b))
+            online = [(pd.Timestamp(t['entry']), pd.Timestamp(t['exit'])) for t in state.trades]
+            batch = [(pd.Timestamp(t['entry']), pd.Timestamp(t['exit'])) for t in batch_trades]
+            online_pnl = sum(t['total_pnl'] for t in state.trades)
+            batch_pnl = sum(t['total_pnl'] for t in batch_trades)
+            rows.append({
+                'pair': state.pair,
+                'online_trades': len(online),
+                'batch_trades': len(batch),
+                'trades_match': online == batch,
+                'online_pnl': online_pnl,
+                'batch_pnl': batch_pnl,
+                'pnl_diff': online_pnl - batch_pnl,
+                'online_corr_z': state.corr_z,
+                'batch_corr_z': batch_z,
+            })
+        df = pd.DataFrame(rows)
+        if not df.empty:
+            print(f"🔁 Совпадение сделок с пакетным расчётом: {int(df['trades_match'].sum())} из {len(df)} пар, "
+                  f"max |ΔPnL| {df['pnl_diff'].abs().max():.3g}")
+        return df
+
+    def save(self, output_dir="report_data_coin_method/replay"):
+        os.makedirs(output_dir, exist_ok=True)
+        pd.DataFrame(self.signals).to_csv(os.path.join(output_dir, "replay_signals.csv"), index=False)
+        pd.DataFrame({'latency_us': self.latency * 1e6}).to_csv(os.path.join(output_dir, "replay_latency.csv"),
+                                                                index_label='bar')
+        pd.DataFrame([self.summary()]).to_csv(os.path.join(output_dir, "replay_summary.csv"), index=False)
+        print(f"💾 Сигналы и задержки воспроизведения сохранены в {output_dir}")
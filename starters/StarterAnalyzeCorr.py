@@ -1,5 +1,3 @@
-from analyzers.CointegrationAnalyzerAsync import CointegrationAnalyzerAsync
-from collectors.FuturesDataCollector import FuturesDataCollector
 from analyzers.CorrAnalyzer import CorrAnalyzer
 
 if __name__ == "__main__":
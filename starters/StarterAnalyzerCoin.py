@@ -1,7 +1,4 @@
 from analyzers.CointegrationAnalyzerAsync import CointegrationAnalyzerAsync
-from collectors.FuturesDataCollector import FuturesDataCollector
-from analyzers.CorrAnalyzer import CorrAnalyzer
-from plotters.CorrSpreadPlotter import PairSpreadPlotter
 
 if __name__ == "__main__":
     '''
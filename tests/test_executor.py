@@ -0,0 +1,50 @@
+import threading
+import time
+
+import pytest
+from utils.executor import StageExecutor
+
+
+def square(x):
+    return x * x
+
+
+def test_auto_backend_follows_task_kind():
+    assert StageExecutor(kind='cpu', max_workers=2).backend == 'process'
+    assert StageExecutor(kind='io', max_workers=2).backend == 'thread'
+    assert StageExecutor(kind='cpu', max_workers=1).backend == 'serial'
+
+
+@pytest.mark.parametrize('backend', ['serial', 'thread', 'process', 'asyncio'])
+def test_backends_return_every_result(backend):
+    executor = StageExecutor(backend=backend, max_workers=2, progress=False)
+    assert sorted(executor.map(square, range(50))) == [(x, x * x) for x in range(50)]
+    assert [item for item, _ in executor.map(square, range(50), ordered=True)] == list(range(50))
+
+
+def test_asyncio_stops_pulling_chunks_after_error():
+    pulled = []
+    lock = threading.Lock()
+
+    def items():
+        for x in range(10_000):
+            with lock:
+                pulled.append(x)
+            yield x
+
+    def fail_first(x):
+        if x == 0:
+            raise ValueError("boom")
+        time.sleep(0.001)
+        return x
+
+    executor = StageExecutor(backend='asyncio', max_workers=2, errors='raise', progress=False)
+    with pytest.raises(ValueError):
+        list(executor.map(fail_first, items()))
+    time.sleep(0.2)
+    with lock:
+        seen = len(pulled)
+    time.sleep(0.2)
+    # После ошибки новые пачки не выдаются: генератор задач больше не читается
+    assert len(pulled) == seen
+    assert seen < 100
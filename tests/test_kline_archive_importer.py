@@ -0,0 +1,112 @@
+import gzip
+import os
+import zipfile
+
+import numpy as np
+import pandas as pd
+from collectors.FuturesDataCollector import FuturesDataCollector
+from collectors.KlineArchiveImporter import KlineArchiveImporter, OUTPUT_HEADER, read_archive
+
+HOUR_MS = 3_600_000
+DAY_MS = 24 * HOUR_MS
+START_MS = 1_704_067_200_000  # 2024-01-01 00:00 UTC
+COLUMNS = ['time'] + OUTPUT_HEADER[1:]
+
+
+def day_bars(day, scale_ms=1, price=100.0):
+    """
+    Сутки часовых баров: метки времени в единицах scale_ms (1000 — секунды, 1e-3 — микросекунды).
+    """
+    ts = START_MS + day * DAY_MS + np.arange(24) * HOUR_MS
+    close = price + np.arange(24, dtype=float)
+    return pd.DataFrame({
+        'open_time': (ts // scale_ms if scale_ms >= 1 else ts * int(1 / scale_ms)).astype(np.int64),
+        'open': close, 'high': close + 1, 'low': close - 1, 'close': close,
+        'volume': 10.0, 'close_time': ts + HOUR_MS - 1, 'quote_volume': close * 10, 'count': 5,
+    })
+
+
+def write_headerless_zip(path, df):
+    with zipfile.ZipFile(path, 'w') as archive:
+        archive.writestr(os.path.basename(path).replace('.zip', '.csv'), df.to_csv(index=False, header=False))
+
+
+def write_header_gz(path, df):
+    with gzip.open(path, 'wt') as f:
+        df.to_csv(f, index=False)
+
+
+def write_store_file(path, ts, close):
+    times = pd.to_datetime(ts, unit='ms', utc=True).tz_convert('Europe/Moscow').strftime('%Y-%m-%d %H:%M:%S')
+    pd.DataFrame({'time': times, 'timestamp': ts, 'open': close, 'high': close, 'low': close, 'close': close,
+                  'volume': 1.0, 'turnover': close}).to_csv(path, index=False, header=OUTPUT_HEADER)
+
+
+def read_store_file(path):
+    return pd.read_csv(path, header=0, names=COLUMNS)
+
+
+def test_read_archive_layouts_and_units(tmp_path):
+    expected = START_MS + np.arange(24) * HOUR_MS
+    for name, scale, writer in [('A-1h-2024-01-01.zip', 1, write_headerless_zip),
+                                ('B-1h-2024-01-01.csv.gz', 1000, write_header_gz),
+                                ('C-1h-2024-01-01.csv.gz', 1e-3, write_header_gz),
+                                ('D-1h-2024-01-01.zip', 1000, write_headerless_zip)]:
+        path = str(tmp_path / name)
+        writer(path, day_bars(0, scale))
+        df = read_archive(path)
+        np.testing.assert_array_equal(df['timestamp'].to_numpy(), expected, err_msg=name)
+        np.testing.assert_allclose(df['turnover'].to_numpy(), df['close'].to_numpy() * 10)
+
+
+def test_import_merges_with_existing_file(tmp_path):
+    archive_dir, save_dir = tmp_path / 'archives', tmp_path / 'data'
+    archive_dir.mkdir()
+    save_dir.mkdir()
+    # Три дня в разных форматах; второй день повторён в другом архиве — повторы не должны попасть в файл
+    write_headerless_zip(str(archive_dir / 'BTCUSDT-1h-2024-01-01.zip'), day_bars(0))
+    write_header_gz(str(archive_dir / 'BTCUSDT-1h-2024-01-02.csv.gz'), day_bars(1, 1000))
+    write_header_gz(str(archive_dir / 'BTCUSDT_2024-01-02-dup.csv.gz'), day_bars(1, 1e-3))
+    write_headerless_zip(str(archive_dir / 'BTCUSDT-1h-2024-01-03.zip'), day_bars(2))
+
+    # В хранилище уже есть вторая половина второго дня, третий день и полсуток после архивов
+    existing_ts = START_MS + DAY_MS + 12 * HOUR_MS + np.arange(48) * HOUR_MS
+    target = save_dir / 'BTCUSDT_h1.csv'
+    write_store_file(target, existing_ts, np.full(48, -1.0))
+
+    summary = KlineArchiveImporter(str(archive_dir), str(save_dir), max_workers=2, chunksize=7).run()
+    assert summary.loc[0, 'rows'] == 24 * 3 + 12
+    assert summary.loc[0, 'added'] == 24 * 3 + 12 - 48
+
+    out = read_store_file(target)
+    ts = out['timestamp'].to_numpy()
+    np.testing.assert_array_equal(ts, START_MS + np.arange(24 * 3 + 12) * HOUR_MS)
+    assert (np.diff(ts) > 0).all()
+    # При совпадении меток остаются существующие бары
+    assert (out.loc[out['timestamp'].isin(existing_ts), 'close'] == -1.0).all()
+    assert (out.loc[~out['timestamp'].isin(existing_ts), 'close'] >= 100).all()
+    assert out['time'].iloc[0] == '2024-01-01 03:00:00'
+    assert not [f for f in os.listdir(save_dir) if f.endswith('.tmp')]
+
+
+def test_collector_keeps_imported_history(tmp_path):
+    target = str(tmp_path / 'BTCUSDT_h1.csv')
+    history_ts = START_MS + np.arange(48) * HOUR_MS
+    write_store_file(target, history_ts, np.full(48, 1.0))
+
+    # Ответ REST: последние 10 баров, из них 4 уже в файле (последний из них был ещё не закрыт)
+    rest_ts = START_MS + np.arange(44, 54) * HOUR_MS
+    response = {'list': [[str(t), '2', '2', '2', '2', '1', '2'] for t in rest_ts[::-1]]}
+    latest = FuturesDataCollector.format_data(None, response)
+    assert FuturesDataCollector.merge_into_file(latest, target) == 6
+
+    out = read_store_file(target)
+    np.testing.assert_array_equal(out['timestamp'].to_numpy(), START_MS + np.arange(54) * HOUR_MS)
+    assert (out['close'].iloc[:44] == 1.0).all() and (out['close'].iloc[44:] == 2.0).all()
+    assert out['time'].iloc[-1] == pd.Timestamp(int(rest_ts[-1]), unit='ms', tz='UTC').tz_convert(
+        'Europe/Moscow').strftime('%Y-%m-%d %H:%M:%S')
+
+    # Повторный запуск с тем же ответом ничего не добавляет и не меняет файл
+    before = open(target).read()
+    assert FuturesDataCollector.merge_into_file(latest, target) == 0
+    assert open(target).read() == before
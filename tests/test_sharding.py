@@ -0,0 +1,115 @@
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+from utils.sharding import ShardQueue, ShardWorker
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+N_SHARDS = 6
+
+
+def write_panel(data_dir, n_symbols=8, n_bars=400, seed=7):
+    """
+    Маленькая панель в формате коллектора: общий случайный тренд плюс шум — часть пар коинтегрирована.
+    """
+    rng = np.random.default_rng(seed)
+    times = pd.date_range("2025-01-01", periods=n_bars, freq="h")
+    trend = np.cumsum(rng.normal(0, 1, n_bars))
+    os.makedirs(data_dir, exist_ok=True)
+    for k in range(n_symbols):
+        noise = rng.normal(0, 0.5 + 0.5 * k, n_bars)
+        walk = np.cumsum(rng.normal(0, 0.3, n_bars)) if k % 3 == 2 else 0
+        close = 100 + (1 + 0.1 * k) * trend + noise + walk
+        pd.DataFrame({
+            'timestamp': times.strftime('%Y-%m-%d %H:%M:%S'),
+            'ts': times.asi8 // 10**6,
+            'open': close, 'high': close, 'low': close, 'close': close,
+            'volume': 1.0, 'turnover': close,
+        }).rename(columns={'ts': 'timestamp'}).to_csv(os.path.join(data_dir, f"SYM{k}USDT_h1.csv"), index=False)
+
+
+def cli(*args):
+    result = subprocess.run([sys.executable, os.path.join(ROOT, "cli.py"), *args],
+                            cwd=ROOT, capture_output=True, text=True, timeout=600)
+    assert result.returncode == 0, result.stdout + result.stderr
+    return result.stdout
+
+
+def test_concurrent_claims_take_each_shard_once(tmp_path):
+    queue = ShardQueue(str(tmp_path / "queue"))
+    queue.plan('coint', 200, {})
+    claimed = []
+    lock = threading.Lock()
+
+    def worker(k):
+        while True:
+            shard = queue.claim(f"w{k}")
+            if shard is None:
+                return
+            with lock:
+                claimed.append(shard)
+
+    threads = [threading.Thread(target=worker, args=(k,)) for k in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(claimed) == list(range(200))
+    assert queue.status()['pending'] == 0
+
+
+def test_requeue_stale_skips_shards_with_heartbeat(tmp_path):
+    queue_dir = str(tmp_path / "queue")
+    queue = ShardQueue(queue_dir)
+    queue.plan('coint', 2, {})
+
+    # Шард упавшего воркера: взят давно, heartbeat нет — возвращается в очередь
+    shard = queue.claim("dead")
+    old = time.time() - 3600
+    os.utime(queue._claimed_path(shard), (old, old))
+    assert queue.requeue_stale(max_age=60) == 1
+    assert queue.status()['pending'] == 2
+
+    # Живой воркер работает над шардом дольше max_age, но отмечает его — шард не забирают
+    worker = ShardWorker(queue_dir, worker_id="alive", heartbeat=0.05)
+    worker._runner = lambda shard: time.sleep(0.6) or []
+    requeued = []
+    thread = threading.Thread(target=worker.run, kwargs={'max_shards': 1})
+    thread.start()
+    while thread.is_alive():
+        time.sleep(0.1)
+        requeued.append(queue.requeue_stale(max_age=0.3))
+    thread.join()
+    assert sum(requeued) == 0
+    assert queue.status()['done'] == 1
+
+
+def test_local_workers_match_unsharded_run(tmp_path):
+    data_dir = str(tmp_path / "data")
+    queue_dir = str(tmp_path / "queue")
+    write_panel(data_dir)
+
+    cli("shard-plan", "coint", "--shards", str(N_SHARDS), "--queue-dir", queue_dir, "--data-dir", data_dir,
+        "--max-workers", "1")
+    out = cli("shard-worker", "--queue-dir", queue_dir, "--local-workers", "3")
+    cli("shard-merge", "--queue-dir", queue_dir, "--output", str(tmp_path / "merged.csv"))
+    cli("coint", "--data-dir", data_dir, "--output", str(tmp_path / "full.csv"), "--backend", "serial",
+        "--checkpoint", str(tmp_path / "coint.jsonl"))
+
+    # Каждый шард взят ровно одним воркером и ровно один раз
+    claims = Counter(int(m) for m in re.findall(r"шард (\d+)/%d" % N_SHARDS, out))
+    assert claims == Counter({k: 1 for k in range(1, N_SHARDS + 1)})
+    assert len(set(re.findall(r"\[([^\]]+)\] шард", out))) > 1
+    status = ShardQueue(queue_dir).status()
+    assert status == {'pending': 0, 'claimed': 0, 'done': N_SHARDS, 'total': N_SHARDS}
+
+    merged = pd.read_csv(tmp_path / "merged.csv").sort_values('pair').reset_index(drop=True)
+    full = pd.read_csv(tmp_path / "full.csv").sort_values('pair').reset_index(drop=True)
+    assert len(full) > 0
+    pd.testing.assert_frame_equal(merged, full)
@@ -0,0 +1,155 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import pytest
+
+from utils.telegram_notifier import TELEGRAM_MAX_MESSAGE_LENGTH, TelegramNotifier
+
+
+class FakeTelegram:
+    """
+    Локальный фейковый Bot API: запоминает запросы, отвечает по сценарию статусов (дальше — 200).
+    """
+
+    def __init__(self, statuses=()):
+        self.statuses = list(statuses)
+        self.requests = []
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                form = {}
+                if self.headers.get('Content-Type', '').startswith('application/x-www-form-urlencoded'):
+                    form = {k: v[0] for k, v in parse_qs(body.decode()).items()}
+                fake.requests.append((time.monotonic(), self.path, form))
+                status = fake.statuses.pop(0) if fake.statuses else 200
+                payload = {'ok': status < 400}
+                if status == 429:
+                    payload['parameters'] = {'retry_after': 1}
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def texts(self):
+        return [form['text'] for _, path, form in self.requests if path.endswith('/sendMessage')]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def fake():
+    servers = []
+
+    def start(statuses=()):
+        servers.append(FakeTelegram(statuses))
+        return servers[-1]
+    yield start
+    for server in servers:
+        server.close()
+
+
+def notifier_for(server, **kwargs):
+    kwargs.setdefault('batch_interval', 0.3)
+    kwargs.setdefault('backoff', 0.01)
+    return TelegramNotifier("TOKEN", "42", api_url=server.url, timeout=5, **kwargs)
+
+
+def test_messages_within_batch_interval_form_one_digest(fake):
+    server = fake()
+    notifier = notifier_for(server)
+    for text in ("первое", "второе", "третье"):
+        notifier.send_message(text)
+    assert notifier.flush(timeout=10)
+    notifier.close()
+
+    assert server.texts() == ["первое\nвторое\nтретье"]
+    assert server.requests[0][1] == "/botTOKEN/sendMessage"
+    assert server.requests[0][2]['chat_id'] == "42"
+
+
+def test_server_errors_are_retried(fake):
+    server = fake(statuses=[500, 502])
+    notifier = notifier_for(server)
+    notifier.send_message("после двух 5xx")
+    assert notifier.flush(timeout=10)
+    notifier.close()
+
+    assert server.texts() == ["после двух 5xx"] * 3
+
+
+def test_too_many_requests_waits_retry_after(fake):
+    server = fake(statuses=[429])
+    notifier = notifier_for(server)
+    notifier.send_message("после 429")
+    assert notifier.flush(timeout=10)
+    notifier.close()
+
+    assert server.texts() == ["после 429"] * 2
+    assert server.requests[1][0] - server.requests[0][0] >= 0.9
+
+
+def test_client_errors_are_not_retried(fake):
+    server = fake(statuses=[400])
+    notifier = notifier_for(server)
+    notifier.send_message("плохой запрос")
+    assert notifier.flush(timeout=10)
+    notifier.close()
+
+    assert len(server.requests) == 1
+
+
+def test_long_digest_is_split_by_telegram_limit(fake):
+    server = fake()
+    notifier = notifier_for(server)
+    notifier.send_message("x" * (TELEGRAM_MAX_MESSAGE_LENGTH + 100))
+    notifier.send_message("хвост")
+    assert notifier.flush(timeout=10)
+    notifier.close()
+
+    texts = server.texts()
+    assert all(len(text) <= TELEGRAM_MAX_MESSAGE_LENGTH for text in texts)
+    assert "".join(texts).replace("\n", "") == "x" * (TELEGRAM_MAX_MESSAGE_LENGTH + 100) + "хвост"
+
+
+def test_flush_delivers_messages_and_photos(fake, tmp_path):
+    server = fake()
+    notifier = notifier_for(server, batch_interval=0.05)
+    photo = tmp_path / "chart.png"
+    photo.write_bytes(b"\x89PNG fake")
+    for i in range(20):
+        notifier.send_message(f"сообщение {i}")
+        if i == 10:
+            notifier.send_photo(str(photo), caption="график")
+    assert notifier.flush(timeout=10)
+
+    delivered = "\n".join(server.texts()).split("\n")
+    assert delivered == [f"сообщение {i}" for i in range(20)]
+    assert sum(path.endswith('/sendPhoto') for _, path, _ in server.requests) == 1
+    notifier.close()
+
+
+def test_close_sends_queued_messages(fake):
+    server = fake()
+    notifier = notifier_for(server, batch_interval=1.0)
+    notifier.send_message("перед выходом")
+    notifier.close()
+
+    assert server.texts() == ["перед выходом"]
+    notifier.send_message("после закрытия")
+    assert server.texts() == ["перед выходом"]
@@ -0,0 +1,109 @@
+import hashlib
+import json
+import os
+import time
+
+
+def params_fingerprint(*parts):
+    """
+    Хэш произвольных параметров прогона (пороги, лаг, размер плитки, отпечаток данных...).
+    """
+    return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class PairCheckpoint:
+    """
+    Контрольная точка долгого перебора пар: append-only файл JSON Lines.
+
+    Первая строка — заголовок с отпечатком входных данных и параметров, далее по строке
+    на каждую завершённую единицу работы (пару или плитку пар): {"k": ключ, "r": результат}.
+    Строки дописываются по мере готовности и сбрасываются на диск каждые flush_every записей
+    или flush_interval секунд, поэтому при падении процесса теряется не больше одной порции.
+
+    При возобновлении (resume=True) уже выполненные ключи загружаются из файла, если отпечаток
+    совпадает; при несовпадении (данные или параметры изменились) файл начинается заново.
+    Оборванная последняя строка (процесс убит во время записи) пропускается.
+    """
+
+    def __init__(self, path, fingerprint, resume=False, flush_every=200, flush_interval=10.0):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.completed = {}
+        self._unflushed = 0
+        self._last_flush = time.monotonic()
+
+        if resume and os.path.exists(path):
+            self._load()
+        elif resume:
+            print(f"ℹ️ Контрольная точка {path} не найдена — начинаем с начала.")
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        if self.completed:
+            self._file = open(path, "a", encoding="utf-8")
+        else:
+            self._file = open(path, "w", encoding="utf-8")
+            self._file.write(json.dumps({'fingerprint': fingerprint}) + "\n")
+            self._sync()
+
+    def _load(self):
+        with open(self.path, encoding="utf-8") as f:
+            lines = f.read().split("\n")
+        try:
+            header = json.loads(lines[0])
+        except ValueError:
+            header = {}
+        if header.get('fingerprint') != self.fingerprint:
+            print(f"⚠️ Входные данные или параметры изменились с момента контрольной точки {self.path} — "
+                  f"она сбрасывается, расчёт начнётся заново.")
+            return
+
+        for line in lines[1:]:
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Недописанная строка при аварийном завершении
+                continue
+            self.completed[record['k']] = record['r']
+        print(f"⏯ Возобновление из {self.path}: выполнено {len(self.completed)} единиц работы.")
+
+        # Отрезаем возможный недописанный хвост, чтобы новые строки начинались с начала строки
+        with open(self.path, "r+", encoding="utf-8") as f:
+            content = f.read()
+            if content and not content.endswith("\n"):
+                f.seek(0)
+                f.truncate(content.rfind("\n") + 1)
+
+    def __contains__(self, key):
+        return key in self.completed
+
+    def get(self, key):
+        return self.completed.get(key)
+
+    def add(self, key, result):
+        self.completed[key] = result
+        self._file.write(json.dumps({'k': key, 'r': result}, separators=(",", ":"), default=float) + "\n")
+        self._unflushed += 1
+        if self._unflushed >= self.flush_every or time.monotonic() - self._last_flush >= self.flush_interval:
+            self._sync()
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unflushed = 0
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        if not self._file.closed:
+            self._sync()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
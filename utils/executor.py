@@ -0,0 +1,263 @@
+import asyncio
+import os
+import queue
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from itertools import islice
+
+from tqdm import tqdm
+
+BACKENDS = ('serial', 'thread', 'process', 'asyncio')
+
+
+def cpu_count():
+    return os.cpu_count() or 1
+
+
+def default_workers(kind='cpu'):
+    """
+    Число воркеров по умолчанию: для вычислений — по числу ядер,
+    для сетевых/дисковых задач — как у ThreadPoolExecutor (ядра + 4, не больше 32).
+    """
+    if kind == 'io':
+        return min(32, cpu_count() + 4)
+    return cpu_count()
+
+
+def _chunked(items, size):
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _run_chunk(func, chunk, catch):
+    """
+    Выполняет пачку задач в воркере. Ошибки отдельных задач при catch=True
+    возвращаются строкой (исключение может не пережить pickle между процессами).
+    """
+    outcomes = []
+    for item in chunk:
+        try:
+            outcomes.append((True, func(item)))
+        except Exception as e:
+            if not catch:
+                raise
+            outcomes.append((False, f"{type(e).__name__}: {e}"))
+    return outcomes
+
+
+async def _arun_chunk(func, chunk, catch):
+    outcomes = []
+    for item in chunk:
+        try:
+            outcomes.append((True, await func(item)))
+        except Exception as e:
+            if not catch:
+                raise
+            outcomes.append((False, f"{type(e).__name__}: {e}"))
+    return outcomes
+
+
+class StageExecutor:
+    """
+    Общий слой выполнения задач этапов: serial, thread, process и asyncio.
+
+    - kind='cpu' | 'io' задаёт число воркеров по умолчанию (см. default_workers) и backend='auto':
+      сетевые задачи — потоки, вычисления — процессы (чистый Python держит GIL, потоки его не ускоряют).
+      Этапы, задачи которых держат большую панель и считаются в numpy/statsmodels/sklearn
+      (отпускают GIL), передают backend='thread' сами: панель дорого передавать в процессы.
+      Один воркер — всегда serial.
+    - Задачи подаются пачками по chunksize (для процессов по умолчанию — порядка 4 пачек на воркер),
+      в работе одновременно не больше 2 * max_workers пачек, поэтому ленивые генераторы задач
+      не разворачиваются целиком в очередь пула.
+    - Прогресс (tqdm) и ошибки у всех этапов одинаковые: при errors='skip' упавшая задача
+      пропускается, ошибки копятся в self.errors и сводка печатается в конце map;
+      при errors='raise' первая ошибка пробрасывается.
+
+    Пул живёт в контексте with и переиспользуется между вызовами map; вне контекста
+    каждый map создаёт и закрывает свой пул.
+    """
+
+    def __init__(self, backend='auto', kind='cpu', max_workers=None, chunksize=None, errors='skip', progress=True):
+        if backend != 'auto' and backend not in BACKENDS:
+            raise ValueError(f"Неизвестный backend: {backend}. Доступны: auto, {', '.join(BACKENDS)}")
+        if errors not in ('skip', 'raise'):
+            raise ValueError("errors должен быть 'skip' или 'raise'")
+        self.kind = kind
+        self.max_workers = max_workers or default_workers(kind)
+        if backend == 'auto':
+            backend = 'thread' if kind == 'io' else 'process'
+        self.backend = 'serial' if self.max_workers == 1 else backend
+        self.chunksize = chunksize
+        self.errors_mode = errors
+        self.progress = progress
+        self.errors = []
+        self._pool = None
+        self._owns_pool = False
+
+    def __enter__(self):
+        self._pool = self._make_pool()
+        self._owns_pool = True
+        return self
+
+    def __exit__(self, *exc):
+        if self._owns_pool and self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=exc[0] is not None)
+        self._pool = None
+        self._owns_pool = False
+
+    def _make_pool(self):
+        if self.backend == 'process':
+            return ProcessPoolExecutor(max_workers=self.max_workers)
+        if self.backend in ('thread', 'asyncio'):
+            return ThreadPoolExecutor(max_workers=self.max_workers)
+        return None
+
+    def _chunksize(self, total):
+        if self.chunksize:
+            return self.chunksize
+        if self.backend == 'process' and total:
+            return max(1, min(256, total // (4 * self.max_workers)))
+        return 1
+
+    def map(self, func, items, desc=None, total=None, ordered=False, weight=None):
+        """
+        Выполняет func для каждого элемента items и выдаёт пары (item, результат)
+        по мере готовности (ordered=True — в порядке items).
+        weight(результат) — на сколько продвинуть прогресс (например, число пар в плитке).
+        """
+        if total is None and hasattr(items, '__len__'):
+            total = len(items)
+        chunks = _chunked(items, self._chunksize(total))
+        catch = self.errors_mode == 'skip'
+        failed = 0
+
+        pool_owner = self._pool is None and self.backend != 'serial'
+        if pool_owner:
+            self._pool = self._make_pool()
+        try:
+            with tqdm(total=total, desc=desc, disable=not self.progress) as bar:
+                for chunk, outcomes in self._dispatch(func, chunks, ordered, catch):
+                    for item, (ok, value) in zip(chunk, outcomes):
+                        bar.update(weight(value) if ok and weight else 1)
+                        if ok:
+                            yield item, value
+                        else:
+                            failed += 1
+                            self.errors.append((item, value))
+        finally:
+            if pool_owner:
+                self._pool.shutdown(wait=True)
+                self._pool = None
+        if failed:
+            print(f"⚠️ {desc or 'Задачи'}: ошибок {failed}")
+            for item, message in self.errors[-failed:][:5]:
+                print(f"   {item}: {message}")
+
+    def _dispatch(self, func, chunks, ordered, catch):
+        if self.backend == 'serial':
+            for chunk in chunks:
+                yield chunk, _run_chunk(func, chunk, catch)
+        elif self.backend == 'asyncio':
+            yield from self._dispatch_asyncio(func, chunks, ordered, catch)
+        else:
+            yield from self._dispatch_pool(func, chunks, ordered, catch)
+
+    def _dispatch_pool(self, func, chunks, ordered, catch):
+        max_in_flight = 2 * self.max_workers
+        if ordered:
+            pending = deque()
+            for chunk in chunks:
+                pending.append((chunk, self._pool.submit(_run_chunk, func, chunk, catch)))
+                if len(pending) >= max_in_flight:
+                    chunk, future = pending.popleft()
+                    yield chunk, future.result()
+            while pending:
+                chunk, future = pending.popleft()
+                yield chunk, future.result()
+            return
+
+        in_flight = {}
+        try:
+            while True:
+                for chunk in chunks:
+                    in_flight[self._pool.submit(_run_chunk, func, chunk, catch)] = chunk
+                    if len(in_flight) >= max_in_flight:
+                        break
+                if not in_flight:
+                    return
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield in_flight.pop(future), future.result()
+        finally:
+            for future in in_flight:
+                future.cancel()
+
+    def _dispatch_asyncio(self, func, chunks, ordered, catch):
+        """
+        Цикл событий работает в отдельном потоке: корутины выполняются в нём напрямую,
+        обычные функции — в пуле потоков; одновременно в работе не больше max_workers пачек.
+        Когда потребитель выходит (ошибка или прерванный map), stop останавливает выдачу новых пачек.
+        """
+        outcomes = queue.Queue()
+        stop = threading.Event()
+        is_coroutine = asyncio.iscoroutinefunction(func)
+        pool = self._pool
+
+        async def main():
+            loop = asyncio.get_running_loop()
+            slots = asyncio.Semaphore(self.max_workers)
+
+            async def run(k, chunk):
+                try:
+                    if is_coroutine:
+                        result = await _arun_chunk(func, chunk, catch)
+                    else:
+                        result = await loop.run_in_executor(pool, _run_chunk, func, chunk, catch)
+                    outcomes.put((k, chunk, result, None))
+                except BaseException as e:
+                    outcomes.put((k, chunk, None, e))
+                finally:
+                    slots.release()
+
+            tasks = []
+            for k, chunk in enumerate(chunks):
+                if stop.is_set():
+                    break
+                await slots.acquire()
+                if stop.is_set():
+                    slots.release()
+                    break
+                tasks.append(asyncio.create_task(run(k, chunk)))
+            await asyncio.gather(*tasks)
+
+        def runner():
+            try:
+                asyncio.run(main())
+            except BaseException as e:
+                outcomes.put((None, None, None, e))
+            outcomes.put(None)
+
+        threading.Thread(target=runner, daemon=True).start()
+        waiting, next_k = {}, 0
+        try:
+            while True:
+                message = outcomes.get()
+                if message is None:
+                    return
+                k, chunk, result, error = message
+                if error is not None:
+                    raise error
+                if not ordered:
+                    yield chunk, result
+                    continue
+                waiting[k] = (chunk, result)
+                while next_k in waiting:
+                    yield waiting.pop(next_k)
+                    next_k += 1
+        finally:
+            stop.set()
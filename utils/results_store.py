@@ -0,0 +1,152 @@
+import sqlite3
+from datetime import datetime
+
+import pandas as pd
+
+from utils.symbols import split_pair, strip_timeframe
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id      INTEGER PRIMARY KEY AUTOINCREMENT,
+    started_at  TEXT NOT NULL,
+    finished_at TEXT,
+    status      TEXT,
+    timeframe   TEXT,
+    note        TEXT
+);
+CREATE TABLE IF NOT EXISTS pair_results (
+    run_id  INTEGER NOT NULL REFERENCES runs(run_id),
+    stage   TEXT NOT NULL,
+    asset_a TEXT NOT NULL,
+    asset_b TEXT NOT NULL,
+    metric  TEXT NOT NULL,
+    value   REAL
+);
+CREATE INDEX IF NOT EXISTS idx_pair_results_pair ON pair_results (asset_a, asset_b, stage, metric);
+CREATE INDEX IF NOT EXISTS idx_pair_results_stage ON pair_results (stage, metric, run_id);
+CREATE INDEX IF NOT EXISTS idx_pair_results_run ON pair_results (run_id, stage);
+"""
+
+
+class ResultsStore:
+    """
+    Встроенная база результатов (SQLite) вместо перезаписываемых CSV между этапами.
+
+    Каждый прогон пайплайна получает run_id, этапы пишут свои результаты одной транзакцией
+    в «длинную» таблицу pair_results (run_id, stage, asset_a, asset_b, metric, value)
+    с индексами по паре, этапу и метрике. Это позволяет без загрузки старых CSV отвечать
+    на вопросы вида «как менялся p-value пары за последние 20 прогонов»
+    или «лучшие пары по delta за неделю».
+
+    Монеты хранятся без суффикса таймфрейма, таймфрейм записывается в прогон.
+    """
+
+    def __init__(self, db_path="results.db"):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def start_run(self, timeframe='h1', note=''):
+        with self.conn:
+            cur = self.conn.execute(
+                "INSERT INTO runs (started_at, status, timeframe, note) VALUES (?, 'running', ?, ?)",
+                (datetime.now().isoformat(timespec='seconds'), timeframe, note)
+            )
+        return cur.lastrowid
+
+    def finish_run(self, run_id, status='ok'):
+        with self.conn:
+            self.conn.execute(
+                "UPDATE runs SET finished_at = ?, status = ? WHERE run_id = ?",
+                (datetime.now().isoformat(timespec='seconds'), status, run_id)
+            )
+
+    def write_stage(self, run_id, stage, records, pair_key='pair', asset_keys=None):
+        """
+        Пишет результаты этапа одной транзакцией.
+        records — список словарей или DataFrame; пара берётся из pair_key ('A_h1/B_h1', 'A_B')
+        или из пары столбцов asset_keys, например ('asset_a', 'asset_b').
+        Все числовые поля записываются как метрики. Повторная запись этапа прогона заменяет предыдущую.
+        """
+        df = records if isinstance(records, pd.DataFrame) else pd.DataFrame(records)
+        if df.empty:
+            return 0
+
+        if asset_keys:
+            pairs = [(strip_timeframe(a), strip_timeframe(b)) for a, b in zip(df[asset_keys[0]], df[asset_keys[1]])]
+        else:
+            pairs = [split_pair(p) for p in df[pair_key]]
+
+        metrics = [c for c in df.select_dtypes(include='number').columns]
+        rows = [
+            (run_id, stage, a, b, metric, float(value))
+            for (a, b), values in zip(pairs, df[metrics].itertuples(index=False, name=None))
+            for metric, value in zip(metrics, values)
+            if pd.notna(value)
+        ]
+        with self.conn:
+            self.conn.execute("DELETE FROM pair_results WHERE run_id = ? AND stage = ?", (run_id, stage))
+            self.conn.executemany(
+                "INSERT INTO pair_results (run_id, stage, asset_a, asset_b, metric, value) VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+        return len(rows)
+
+    def latest_run_id(self, stage=None):
+        if stage is None:
+            row = self.conn.execute("SELECT MAX(run_id) FROM runs").fetchone()
+        else:
+            row = self.conn.execute("SELECT MAX(run_id) FROM pair_results WHERE stage = ?", (stage,)).fetchone()
+        return row[0]
+
+    def stage_frame(self, stage, run_id=None):
+        """
+        Результаты этапа прогона (по умолчанию последнего) в «широком» виде: asset_a, asset_b, метрики.
+        """
+        run_id = run_id or self.latest_run_id(stage)
+        df = pd.read_sql_query(
+            "SELECT asset_a, asset_b, metric, value FROM pair_results WHERE run_id = ? AND stage = ?",
+            self.conn, params=(run_id, stage)
+        )
+        if df.empty:
+            return df
+        wide = df.pivot_table(index=['asset_a', 'asset_b'], columns='metric', values='value', aggfunc='last')
+        wide.columns.name = None
+        return wide.reset_index()
+
+    def pair_history(self, asset_a, asset_b, stage, metric, last_runs=20):
+        """
+        Значения метрики пары за последние last_runs прогонов, в которых пара встречалась.
+        """
+        return pd.read_sql_query(
+            """
+            SELECT r.run_id, r.started_at, p.value
+            FROM pair_results p JOIN runs r ON r.run_id = p.run_id
+            WHERE p.asset_a = ? AND p.asset_b = ? AND p.stage = ? AND p.metric = ?
+            ORDER BY r.run_id DESC LIMIT ?
+            """,
+            self.conn, params=(strip_timeframe(asset_a), strip_timeframe(asset_b), stage, metric, last_runs)
+        ).iloc[::-1].reset_index(drop=True)
+
+    def top_pairs(self, stage, metric, since=None, limit=20, ascending=False):
+        """
+        Лучшие пары по метрике этапа. since — ISO-дата начала прогона (например, неделя назад);
+        без since берётся последний прогон этапа.
+        """
+        order = "ASC" if ascending else "DESC"
+        if since is None:
+            where, params = "p.run_id = ?", [self.latest_run_id(stage)]
+        else:
+            where, params = "r.started_at >= ?", [since]
+        return pd.read_sql_query(
+            f"""
+            SELECT p.asset_a, p.asset_b, p.run_id, r.started_at, p.value AS "{metric}"
+            FROM pair_results p JOIN runs r ON r.run_id = p.run_id
+            WHERE p.stage = ? AND p.metric = ? AND {where}
+            ORDER BY p.value {order} LIMIT ?
+            """,
+            self.conn, params=[stage, metric, *params, limit]
+        )
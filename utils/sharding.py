@@ -0,0 +1,327 @@
+import importlib
+import json
+import os
+import socket
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+import pandas as pd
+
+SHARD_STAGES = ('coint', 'permutation', 'simulation')
+
+
+def pair_shard(asset_a, asset_b, n_shards):
+    """
+    Детерминированный номер шарда пары: crc32 от 'A/B' по модулю числа шардов.
+    Не зависит от порядка файлов и машины, поэтому все узлы делят пространство пар одинаково.
+    """
+    return zlib.crc32(f"{asset_a}/{asset_b}".encode()) % n_shards
+
+
+def in_shard(asset_a, asset_b, shard):
+    """
+    shard — (номер, число шардов) или None (все пары).
+    """
+    return shard is None or pair_shard(asset_a, asset_b, shard[1]) == shard[0]
+
+
+def shard_pairs_frame(pairs_df, shard, asset_keys=None, pair_key='pair'):
+    """
+    Строки DataFrame пар, попадающие в шард. Пара берётся из столбца 'A/B' или из пары столбцов asset_keys.
+    """
+    if asset_keys:
+        pairs = zip(pairs_df[asset_keys[0]], pairs_df[asset_keys[1]])
+    else:
+        pairs = (p.split('/') for p in pairs_df[pair_key])
+    keep = [in_shard(a, b, shard) for a, b in pairs]
+    return pairs_df[keep]
+
+
+class ShardQueue:
+    """
+    Координатор шардов на основе директории-очереди (локальный диск или общий NFS/SMB-ресурс).
+
+    Структура queue_dir:
+    - manifest.json — этап, число шардов и параметры этапа;
+    - pending/  — шарды, ожидающие обработки (по файлу на шард);
+    - claimed/  — взятые в работу: файл переносится атомарным os.rename, поэтому
+      один шард получает ровно один воркер, даже если воркеры работают на разных узлах;
+    - done/     — завершённые шарды;
+    - results/  — частичные результаты шардов (CSV, пишутся через временный файл и rename).
+
+    Пока воркер работает над шардом, он обновляет mtime файла в claimed/ (heartbeat),
+    поэтому requeue_stale() возвращает в очередь только шарды упавших воркеров.
+    """
+
+    def __init__(self, queue_dir):
+        self.root = queue_dir
+        self.pending_dir = os.path.join(queue_dir, "pending")
+        self.claimed_dir = os.path.join(queue_dir, "claimed")
+        self.done_dir = os.path.join(queue_dir, "done")
+        self.results_dir = os.path.join(queue_dir, "results")
+        self.manifest_path = os.path.join(queue_dir, "manifest.json")
+
+    @staticmethod
+    def _shard_file(shard):
+        return f"shard_{shard:05d}.json"
+
+    def plan(self, stage, n_shards, params):
+        """
+        Создаёт очередь: манифест этапа и n_shards файлов шардов в pending/.
+        """
+        if stage not in SHARD_STAGES:
+            raise ValueError(f"Неизвестный этап: {stage}. Доступны: {', '.join(SHARD_STAGES)}")
+        if os.path.exists(self.manifest_path):
+            raise FileExistsError(f"Очередь уже создана: {self.manifest_path}")
+
+        for path in (self.pending_dir, self.claimed_dir, self.done_dir, self.results_dir):
+            os.makedirs(path, exist_ok=True)
+        manifest = {'stage': stage, 'n_shards': n_shards, 'params': params,
+                    'created_at': time.strftime('%Y-%m-%dT%H:%M:%S')}
+        with open(self.manifest_path, "w") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        for shard in range(n_shards):
+            with open(os.path.join(self.pending_dir, self._shard_file(shard)), "w") as f:
+                json.dump({'shard': shard}, f)
+        print(f"🧩 Очередь {self.root}: этап {stage}, {n_shards} шардов")
+        return manifest
+
+    def manifest(self):
+        with open(self.manifest_path) as f:
+            return json.load(f)
+
+    def claim(self, worker_id):
+        """
+        Забирает следующий свободный шард. Возвращает номер шарда или None, если очередь пуста.
+        """
+        for file in sorted(os.listdir(self.pending_dir)):
+            target = os.path.join(self.claimed_dir, f"{file}@{worker_id}")
+            try:
+                os.rename(os.path.join(self.pending_dir, file), target)
+            except FileNotFoundError:
+                # Шард успел забрать другой воркер
+                continue
+            os.utime(target)
+            return int(file[len("shard_"):-len(".json")])
+        return None
+
+    def touch(self, shard, worker_id):
+        """
+        Heartbeat воркера: обновляет mtime взятого им шарда. False — шард уже не у этого воркера.
+        """
+        try:
+            os.utime(os.path.join(self.claimed_dir, f"{self._shard_file(shard)}@{worker_id}"))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _claimed_path(self, shard):
+        prefix = self._shard_file(shard)
+        for file in os.listdir(self.claimed_dir):
+            if file.startswith(prefix + "@"):
+                return os.path.join(self.claimed_dir, file)
+        return None
+
+    def complete(self, shard, results):
+        """
+        Записывает частичный результат шарда и помечает шард выполненным.
+        """
+        df = results if isinstance(results, pd.DataFrame) else pd.DataFrame(results)
+        path = os.path.join(self.results_dir, f"shard_{shard:05d}.csv")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        df.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+        claimed = self._claimed_path(shard)
+        if claimed is not None:
+            os.replace(claimed, os.path.join(self.done_dir, self._shard_file(shard)))
+
+    def release(self, shard):
+        """
+        Возвращает взятый шард в очередь (например, после ошибки воркера).
+        """
+        claimed = self._claimed_path(shard)
+        if claimed is not None:
+            os.replace(claimed, os.path.join(self.pending_dir, self._shard_file(shard)))
+
+    def requeue_stale(self, max_age):
+        """
+        Возвращает в очередь шарды без heartbeat дольше max_age секунд (воркер, вероятно, упал).
+        max_age должен быть в несколько раз больше интервала heartbeat воркеров.
+        """
+        now = time.time()
+        requeued = 0
+        for file in os.listdir(self.claimed_dir):
+            path = os.path.join(self.claimed_dir, file)
+            try:
+                if now - os.path.getmtime(path) > max_age:
+                    os.replace(path, os.path.join(self.pending_dir, file.split("@")[0]))
+                    requeued += 1
+            except FileNotFoundError:
+                continue
+        return requeued
+
+    def status(self):
+        return {
+            'pending': len(os.listdir(self.pending_dir)),
+            'claimed': len(os.listdir(self.claimed_dir)),
+            'done': len(os.listdir(self.done_dir)),
+            'total': self.manifest()['n_shards'],
+        }
+
+    def merge(self, allow_partial=False):
+        """
+        Объединяет частичные результаты всех шардов в один DataFrame.
+        """
+        status = self.status()
+        if status['done'] < status['total'] and not allow_partial:
+            raise RuntimeError(f"Выполнено {status['done']} из {status['total']} шардов, объединять рано")
+
+        frames = []
+        for file in sorted(os.listdir(self.results_dir)):
+            if not file.endswith(".csv"):
+                continue
+            try:
+                frames.append(pd.read_csv(os.path.join(self.results_dir, file)))
+            except pd.errors.EmptyDataError:
+                # Шард без найденных пар
+                continue
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+def _stage_class(module_name, class_name):
+    # Классы этапов импортируются лениво: воркеру нужен только один из них
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+class ShardWorker:
+    """
+    Воркер очереди шардов: забирает шарды, выполняет этап только для пар своего шарда
+    и пишет частичный результат. Данные (панель цен) загружаются один раз на воркер.
+
+    Воркеры можно запускать на разных узлах с общей queue_dir и общей (или одинаковой) data_dir.
+    Пока шард в работе, фоновый поток раз в heartbeat секунд обновляет mtime его файла в claimed/.
+    """
+
+    def __init__(self, queue_dir, worker_id=None, max_workers=None, heartbeat=30):
+        self.queue = ShardQueue(queue_dir)
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.heartbeat = heartbeat
+        self.manifest = self.queue.manifest()
+        self.stage = self.manifest['stage']
+        self.params = dict(self.manifest['params'])
+        if max_workers:
+            self.params['max_workers'] = max_workers
+        self._runner = None
+
+    def _build_runner(self):
+        params = dict(self.params)
+        if self.stage == 'coint':
+            cls = _stage_class("analyzers.CointegrationAnalyzerAsync", "CointegrationAnalyzerAsync")
+            analyzer = cls(**params)
+            return lambda shard: analyzer.run(shard=shard)
+
+        if self.stage == 'permutation':
+            cls = _stage_class("evaluators.PairPermutationTestEvaluator", "PairPermutationTestEvaluator")
+            evaluator = cls(**params)
+            pairs_df = pd.read_csv(evaluator.pairs_csv)
+
+            def run_permutation(shard):
+                evaluator.run_async_evaluation(shard_pairs_frame(pairs_df, shard))
+                return evaluator.results
+            return run_permutation
+
+        cls = _stage_class("simulators.PairTradingSimulatorCoin", "PairTradingSimulatorCoin")
+        # Промежуточные отчёты шардов не должны перезаписывать общий отчёт симулятора
+        params['save_dir'] = os.path.join(self.queue.root, "scratch", self.worker_id)
+        simulator = cls(**params)
+        pairs_df = pd.read_csv(simulator.pairs_file)
+
+        def run_simulation(shard):
+            simulator.run_batch(shard_pairs_frame(pairs_df, shard, asset_keys=('asset_a', 'asset_b')))
+            return simulator.results
+        return run_simulation
+
+    @contextmanager
+    def _heartbeat(self, shard):
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(self.heartbeat):
+                self.queue.touch(shard, self.worker_id)
+
+        thread = threading.Thread(target=beat, daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def run(self, max_shards=None):
+        """
+        Обрабатывает шарды, пока очередь не опустеет (или max_shards шардов). Возвращает число шардов.
+        """
+        processed = 0
+        while max_shards is None or processed < max_shards:
+            shard = self.queue.claim(self.worker_id)
+            if shard is None:
+                break
+            if self._runner is None:
+                self._runner = self._build_runner()
+            print(f"🧩 [{self.worker_id}] шард {shard + 1}/{self.manifest['n_shards']} ({self.stage})")
+            try:
+                with self._heartbeat(shard):
+                    results = self._runner((shard, self.manifest['n_shards']))
+            except Exception:
+                self.queue.release(shard)
+                raise
+            self.queue.complete(shard, results)
+            processed += 1
+        print(f"✅ [{self.worker_id}] обработано шардов: {processed}")
+        return processed
+
+
+def run_local_workers(queue_dir, n_workers, max_workers=None, heartbeat=30):
+    """
+    Запускает n_workers локальных процессов-воркеров (замена узлов при проверке на одной машине).
+    """
+    from multiprocessing import Process
+
+    processes = [
+        Process(target=_worker_main, args=(queue_dir, f"{socket.gethostname()}-local{k}", max_workers, heartbeat))
+        for k in range(n_workers)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    return [process.exitcode for process in processes]
+
+
+def _worker_main(queue_dir, worker_id, max_workers, heartbeat):
+    ShardWorker(queue_dir, worker_id, max_workers, heartbeat).run()
+
+
+def merge_shards(queue_dir, output=None, allow_partial=False):
+    """
+    Объединяет частичные результаты и приводит их к виду полного прогона этапа:
+    коинтеграция сортируется по p-value, пермутационный тест — по delta,
+    для симуляции, как в run_batch, остаются пары с доходностью не ниже средней.
+    """
+    queue = ShardQueue(queue_dir)
+    stage = queue.manifest()['stage']
+    df = queue.merge(allow_partial=allow_partial)
+    if not df.empty:
+        if stage == 'coint':
+            df = df.sort_values('p-value')
+        elif stage == 'permutation':
+            df = df.sort_values('delta', ascending=False)
+        else:
+            df = df[df['total_pnl'] >= df['total_pnl'].mean()]
+    if output:
+        df.to_csv(output, index=False)
+        print(f"💾 Объединено {len(df)} строк ({stage}) в {output}")
+    return df
@@ -0,0 +1,146 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+TIMEFRAME_SUFFIX = re.compile(r"_(h\d+|d\d+|m\d+)$")
+
+
+def strip_timeframe(symbol):
+    return TIMEFRAME_SUFFIX.sub('', symbol)
+
+
+def split_pair(pair):
+    """
+    'KERNELUSDT_h1/ZRXUSDT_h1' или 'XCHUSDT_GLMRUSDT' → ('KERNELUSDT', 'ZRXUSDT').
+    """
+    if '/' in pair:
+        a, b = pair.split('/')
+    else:
+        a, b = pair.split('_', 1)
+    return strip_timeframe(a), strip_timeframe(b)
+
+
+def pair_name_columns(pairs_df, pair_key='pair', asset_keys=None):
+    """
+    Имена монет пар из DataFrame: (Series a, Series b) без суффикса таймфрейма.
+    Пара берётся из столбцов asset_keys, иначе из pair_key ('A_h1/B_h1' или 'A_B', как split_pair);
+    если столбца pair_key нет, но есть asset_a/asset_b — из них.
+    Разбор векторный, строки каждой пары не парсятся в цикле.
+    """
+    if asset_keys is None and pair_key not in pairs_df.columns and {'asset_a', 'asset_b'} <= set(pairs_df.columns):
+        asset_keys = ('asset_a', 'asset_b')
+    if asset_keys:
+        a, b = pairs_df[asset_keys[0]].astype(str), pairs_df[asset_keys[1]].astype(str)
+    else:
+        pair = pairs_df[pair_key].astype(str)
+        slash = pair.str.contains('/', regex=False)
+        parts = pair.str.partition('/')
+        a, b = parts[0].copy(), parts[2].copy()
+        if not slash.all():
+            under = pair[~slash].str.partition('_')
+            a[~slash], b[~slash] = under[0], under[2]
+    return (a.str.replace(TIMEFRAME_SUFFIX, '', regex=True).reset_index(drop=True),
+            b.str.replace(TIMEFRAME_SUFFIX, '', regex=True).reset_index(drop=True))
+
+
+class SymbolDictionary:
+    """
+    Словарь монет: имя ↔ компактный int32-идентификатор.
+
+    Имена ищутся без суффикса таймфрейма ('BTCUSDT' и 'BTCUSDT_h1' — одна монета), а хранятся
+    в исходном виде, поэтому на выходе получаются те же строки, что и раньше. Словарь панели
+    (from_panel) нумерует монеты её строками: идентификатор пары — сразу индексы строк values/mask.
+    Между этапами пары передаются как PairSet (два массива int32), строки собираются только на выходе.
+    """
+
+    def __init__(self, names=()):
+        self.names = []
+        self._ids = {}
+        for name in names:
+            self.add(name)
+
+    @classmethod
+    def from_panel(cls, panel):
+        return cls(panel.symbols)
+
+    def add(self, name):
+        key = strip_timeframe(name)
+        if key not in self._ids:
+            self._ids[key] = len(self.names)
+            self.names.append(name)
+        return self._ids[key]
+
+    def id(self, name, default=-1):
+        return self._ids.get(strip_timeframe(name), default)
+
+    def encode(self, names, add=False):
+        """
+        Имена → массив int32 (-1 — монеты нет в словаре; при add=True она добавляется).
+        """
+        keys = pd.Series(names, dtype=object).astype(str).str.replace(TIMEFRAME_SUFFIX, '', regex=True)
+        if add:
+            for key in keys.unique():
+                self.add(key)
+        return keys.map(self._ids).fillna(-1).to_numpy(dtype=np.int32)
+
+    def decode(self, ids):
+        """
+        Идентификаторы → массив имён (для -1 — пустая строка).
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        names = np.asarray(self.names + [''], dtype=object)
+        return names[np.where(ids >= 0, ids, len(self.names))]
+
+    def encode_pairs(self, pairs_df, pair_key='pair', asset_keys=None, add=False):
+        """
+        Пары DataFrame → PairSet (порядок строк сохраняется, неизвестные монеты — -1).
+        """
+        a, b = pair_name_columns(pairs_df, pair_key, asset_keys)
+        return PairSet(self, self.encode(a, add=add), self.encode(b, add=add))
+
+    def __contains__(self, name):
+        return strip_timeframe(name) in self._ids
+
+    def __len__(self):
+        return len(self.names)
+
+
+class PairSet:
+    """
+    Набор пар — два массива int32 идентификаторов одного SymbolDictionary (a — первая монета пары).
+    """
+
+    def __init__(self, dictionary, a, b):
+        self.dictionary = dictionary
+        self.a = np.asarray(a, dtype=np.int32)
+        self.b = np.asarray(b, dtype=np.int32)
+
+    @property
+    def known(self):
+        """
+        Маска пар, обе монеты которых есть в словаре.
+        """
+        return (self.a >= 0) & (self.b >= 0)
+
+    def take(self, rows):
+        return PairSet(self.dictionary, self.a[rows], self.b[rows])
+
+    def names(self):
+        """
+        (имена a, имена b) — массивы строк.
+        """
+        return self.dictionary.decode(self.a), self.dictionary.decode(self.b)
+
+    def labels(self, sep='/'):
+        """
+        Подписи пар 'A/B' (sep='_' — формат симулятора).
+        """
+        a, b = self.names()
+        return (pd.Series(a, dtype=object) + sep + pd.Series(b, dtype=object)).to_numpy(dtype=object)
+
+    def __iter__(self):
+        return zip(self.a.tolist(), self.b.tolist())
+
+    def __len__(self):
+        return len(self.a)
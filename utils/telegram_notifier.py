@@ -1,26 +1,170 @@
-import requests
+import atexit
 import logging
+import queue
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+TELEGRAM_API_URL = "https://api.telegram.org"
+TELEGRAM_MAX_MESSAGE_LENGTH = 4096
+_NOTHING = object()
 
 
 class TelegramNotifier:
-    def __init__(self, bot_token: str, chat_id: str):
+    """
+    Неблокирующий отправщик уведомлений в Telegram.
+
+    send_message/send_photo только кладут сообщение в очередь и сразу возвращают управление,
+    отправкой занимается фоновый поток:
+    - одна keep-alive сессия requests с пулом соединений и таймаутами;
+    - текстовые сообщения, пришедшие в пределах batch_interval секунд, склеиваются в один дайджест;
+    - ошибки сети, 5xx и 429 повторяются с экспоненциальной задержкой (для 429 учитывается retry_after);
+    - flush() дожидается отправки очереди, close() (вызывается и при выходе из процесса) завершает поток.
+
+    api_url можно направить на локальный фейковый HTTP-сервер для тестов.
+    """
+
+    def __init__(self, bot_token: str, chat_id: str, api_url: str = TELEGRAM_API_URL,
+                 timeout: float = 10, batch_interval: float = 2.0, max_retries: int = 3, backoff: float = 1.0):
         self.bot_token = bot_token
         self.chat_id = chat_id
+        self.api_url = api_url.rstrip("/")
+        self.timeout = timeout
+        self.batch_interval = batch_interval
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+
+        self._queue = queue.Queue()
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name="telegram-notifier", daemon=True)
+        self._worker.start()
+        atexit.register(self.close)
 
     def send_message(self, text: str):
-        url = f"https://api.telegram.org/bot{self.bot_token}/sendMessage"
-        data = {"chat_id": self.chat_id, "text": text}
-        try:
-            requests.post(url, data=data)
-        except Exception as e:
-            logging.error(f"Telegram message error: {e}")
+        self._put(("message", text, None))
 
     def send_photo(self, image_path: str, caption: str = ""):
-        url = f"https://api.telegram.org/bot{self.bot_token}/sendPhoto"
+        # Файл читается сразу: к моменту отправки его может перезаписать следующий этап
         try:
             with open(image_path, "rb") as photo:
-                files = {"photo": photo}
-                data = {"chat_id": self.chat_id, "caption": caption}
-                requests.post(url, files=files, data=data)
+                self._put(("photo", caption, photo.read()))
         except Exception as e:
-            logging.error(f"Telegram photo error: {e}")
\ No newline at end of file
+            logging.error(f"Telegram photo error: {e}")
+
+    def flush(self, timeout: float = None):
+        """
+        Ждёт, пока фоновый поток отправит всё, что уже лежит в очереди.
+        Возвращает False, если за timeout секунд очередь не опустела.
+        """
+        if timeout is None:
+            self._queue.join()
+            return True
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+        return not self._queue.unfinished_tasks
+
+    def close(self, timeout: float = 30):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._worker.join(timeout)
+        self.session.close()
+
+    def _put(self, item):
+        if self._closed:
+            logging.error("Telegram notifier is closed, message dropped")
+            return
+        self._queue.put(item)
+
+    def _run(self):
+        # pending — элемент, вынутый при сборе дайджеста (в том числе None — сигнал закрытия)
+        pending = _NOTHING
+        while True:
+            item = pending if pending is not _NOTHING else self._queue.get()
+            pending = _NOTHING
+            if item is None:
+                self._queue.task_done()
+                return
+
+            kind, text, payload = item
+            if kind == "photo":
+                self._post("sendPhoto", {"chat_id": self.chat_id, "caption": text}, {"photo": payload})
+                self._queue.task_done()
+                continue
+
+            # Склеиваем пачку текстовых сообщений в дайджест
+            texts = [text]
+            deadline = time.monotonic() + self.batch_interval
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    nxt = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if nxt is None or nxt[0] != "message":
+                    pending = nxt
+                    break
+                texts.append(nxt[1])
+
+            for chunk in self._digest_chunks(texts):
+                self._post("sendMessage", {"chat_id": self.chat_id, "text": chunk})
+            for _ in texts:
+                self._queue.task_done()
+
+    @staticmethod
+    def _digest_chunks(texts):
+        """
+        Склеивает сообщения через перевод строки, не превышая лимит длины сообщения Telegram.
+        """
+        chunks, current = [], ""
+        for text in texts:
+            while len(text) > TELEGRAM_MAX_MESSAGE_LENGTH:
+                if current:
+                    chunks.append(current)
+                    current = ""
+                chunks.append(text[:TELEGRAM_MAX_MESSAGE_LENGTH])
+                text = text[TELEGRAM_MAX_MESSAGE_LENGTH:]
+            if current and len(current) + 1 + len(text) > TELEGRAM_MAX_MESSAGE_LENGTH:
+                chunks.append(current)
+                current = text
+            else:
+                current = f"{current}\n{text}" if current else text
+        if current:
+            chunks.append(current)
+        return chunks
+
+    def _post(self, method, data, files=None):
+        url = f"{self.api_url}/bot{self.bot_token}/{method}"
+        for attempt in range(self.max_retries + 1):
+            delay = self.backoff * 2 ** attempt
+            try:
+                response = self.session.post(url, data=data, files=files, timeout=self.timeout)
+                if response.status_code < 400:
+                    return True
+                if response.status_code == 429:
+                    try:
+                        delay = max(delay, response.json().get("parameters", {}).get("retry_after", 0))
+                    except ValueError:
+                        pass
+                elif response.status_code < 500:
+                    logging.error(f"Telegram {method} error: {response.status_code} {response.text[:200]}")
+                    return False
+                logging.warning(f"Telegram {method}: HTTP {response.status_code}, попытка {attempt + 1}")
+            except requests.RequestException as e:
+                logging.warning(f"Telegram {method}: {e}, попытка {attempt + 1}")
+
+            if attempt < self.max_retries:
+                time.sleep(delay)
+
+        logging.error(f"Telegram {method} error: сообщение не отправлено после {self.max_retries + 1} попыток")
+        return False